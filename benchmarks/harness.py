@@ -0,0 +1,143 @@
+"""
+The benchmark run itself.
+
+config.py is read when this module is imported, so benchmarks/run_benchmark.py sets up the environment first.
+"""
+import resource
+import sys
+import time
+from functools import partial
+from typing import Any, Dict, Optional
+
+from sqlalchemy import func, select
+
+from config import CRAWL_SHARDS
+from models.database import engine, async_session, init_db
+from models.product import Product
+from models.price_history import PriceObservation
+from parsers.parse_pool import ParsePool
+from parsers.parser_manager import ParserManager
+from parsers.sharding import ShardCoordinator
+from utils.metrics import metrics
+from .synthetic_store import SyntheticStore, MAGNIT, PEREKRESTOK
+
+
+def _timed(func, *args, **kwargs):
+    """
+    Run a parse function and measure its CPU-side duration inside the worker, without the time spent in the queue.
+    """
+    started_at = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - started_at
+
+
+class TimedParsePool(ParsePool):
+    """
+    A parse pool that counts parsed pages and the time spent parsing them.
+
+    Attributes:
+        parsed_pages (int): The number of parsed documents.
+        parse_seconds (float): The total parse time measured in the workers, sec.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.parsed_pages = 0
+        self.parse_seconds = 0.0
+
+    async def _run(self, func, *args):
+        result, elapsed = await super()._run(partial(_timed, func), *args)
+        self.parsed_pages += 1
+        self.parse_seconds += elapsed
+        return result
+
+
+class BenchmarkParserManager(ParserManager):
+    """
+    A ParserManager that keeps its timed parse pool for the report.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.timed_pool = None
+
+    def create_parse_pool(self) -> ParsePool:
+        self.timed_pool = TimedParsePool()
+        return self.timed_pool
+
+
+def _peak_rss_mb(who: int) -> float:
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    peak = resource.getrusage(who).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _parse_ms_per_page(manager) -> Optional[float]:
+    pool = getattr(manager, 'timed_pool', None)
+    if pool is not None:
+        return round(pool.parse_seconds / pool.parsed_pages * 1000, 3) if pool.parsed_pages else None
+    # The worker processes of a sharded run report the parse stage through the merged metrics,
+    # which also include the time a document waits for a parse worker.
+    parsed = [histogram for (stage, _, _), histogram in metrics.histograms.items() if stage == 'parse']
+    count = sum(histogram.count for histogram in parsed)
+    return round(sum(histogram.sum for histogram in parsed) / count * 1000, 3) if count else None
+
+
+async def _count_rows(model) -> int:
+    async with async_session() as session:
+        return await session.scalar(select(func.count()).select_from(model))
+
+
+async def run_benchmark(sections: int, products: int, page_size: int, latency: float, error_rate: float,
+                        padding: int) -> Dict[str, Any]:
+    """
+    Crawl the synthetic store into the configured database and measure the throughput.
+    With CRAWL_SHARDS above 1, the crawl runs in that many worker processes.
+
+    Args:
+        sections (int): The number of sections of each store.
+        products (int): The number of products in each section.
+        page_size (int): The number of products on a section page.
+        latency (float): The delay before each answer of the server, sec.
+        error_rate (float): The share of requests answered with 503.
+        padding (int): The size of the filler markup of each product page, bytes.
+
+    Returns:
+        Dict[str, Any]: The measured metrics.
+    """
+    await init_db()
+    store = SyntheticStore(sections, products, page_size, latency, error_rate, padding)
+    async with store:
+        stores = {'Магнит': store.base_url(MAGNIT), 'Перекрёсток': store.base_url(PEREKRESTOK)}
+        magnit_sections = store.section_urls(MAGNIT)
+        perekrestok_sections = store.section_urls(PEREKRESTOK)
+        crawl_sections = {
+            f'Раздел {number}': {'Магнит': magnit_sections[number], 'Перекрёсток': perekrestok_sections[number]}
+            for number in range(sections)
+        }
+        if CRAWL_SHARDS > 1:
+            manager = ShardCoordinator(stores, crawl_sections)
+        else:
+            manager = BenchmarkParserManager(stores, crawl_sections)
+        started_at = time.perf_counter()
+        await manager.run()
+        elapsed = time.perf_counter() - started_at
+
+    products_rows = await _count_rows(Product)
+    observation_rows = await _count_rows(PriceObservation)
+    await engine.dispose()
+    return {
+        'elapsed_sec': round(elapsed, 3),
+        'pages': store.stats.pages,
+        'section_pages': store.stats.section_pages,
+        'product_pages': store.stats.product_pages,
+        'injected_errors': store.stats.errors,
+        'megabytes_received': round(store.stats.bytes_sent / 1024 / 1024, 2),
+        'pages_per_sec': round(store.stats.pages / elapsed, 2),
+        'parse_ms_per_page': _parse_ms_per_page(manager),
+        'product_rows': products_rows,
+        'price_observation_rows': observation_rows,
+        'db_rows_per_sec': round((products_rows + observation_rows) / elapsed, 2),
+        'peak_rss_mb': _peak_rss_mb(resource.RUSAGE_SELF),
+        'peak_rss_children_mb': _peak_rss_mb(resource.RUSAGE_CHILDREN),
+    }
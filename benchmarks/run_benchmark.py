@@ -0,0 +1,121 @@
+"""
+Offline crawl benchmark.
+
+Starts a local synthetic store, crawls it with ParserManager into a disposable database and reports pages/sec,
+parse ms/page, DB rows/sec and peak RSS. The results are written as JSON, so runs of different versions
+can be compared with --baseline.
+
+Usage:
+    python -m benchmarks.run_benchmark --products 500 --latency 0.02 --error-rate 0.01
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+
+METRICS = ('pages_per_sec', 'parse_ms_per_page', 'db_rows_per_sec', 'peak_rss_mb')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Offline crawl benchmark against a local synthetic store.')
+    parser.add_argument('--sections', type=int, default=3, help='Number of sections of each store')
+    parser.add_argument('--products', type=int, default=200, help='Number of products in each section')
+    parser.add_argument('--page-size', type=int, default=24, help='Number of products on a section page')
+    parser.add_argument('--latency', type=float, default=0.0, help='Delay before each answer, sec')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with 503')
+    parser.add_argument('--padding', type=int, default=20000, help='Filler markup of each product page, bytes')
+    parser.add_argument('--selectors-only', action='store_true',
+                        help='Parse the pages with the selectors only, ignoring the embedded JSON')
+    parser.add_argument('--shards', type=int, default=1, help='Number of crawl processes')
+    parser.add_argument('--shard-pages', type=int, default=0, help='Section pages in a work unit of a crawl process')
+    parser.add_argument('--database-url', help='Disposable database URL, a temporary SQLite file by default')
+    parser.add_argument('--output', help='Result file, .benchmarks/<time>.json by default')
+    parser.add_argument('--baseline', help='Result file of a previous run to compare with')
+    return parser.parse_args()
+
+
+def configure_environment(args, workdir: str):
+    """
+    Point config.py at the disposable database and lift the limits meant to protect the real stores.
+    """
+    os.environ['DATABASE_URL'] = args.database_url or f'sqlite+aiosqlite:///{workdir}/benchmark.db'
+    os.environ['HTTP_CACHE_ENABLED'] = '0'
+    os.environ['FRONTIER_PATH'] = os.path.join(workdir, 'frontier.sqlite')
+    os.environ['CRAWL_INCREMENTAL'] = '0'
+    os.environ['RATE_LIMIT_RPS'] = '100000'
+    os.environ['ADAPTIVE_INITIAL_CONCURRENCY'] = os.environ.get('HTTP_LIMIT_PER_HOST', '10')
+    os.environ['HTTP_BACKOFF_BASE'] = '0.05'
+    os.environ['HTTP_BACKOFF_MAX'] = '1'
+    os.environ['CRAWL_MAX_PRODUCTS_PER_CATEGORY'] = str(args.products)
+    os.environ['CRAWL_MAX_PAGES_PER_CATEGORY'] = str(args.products // args.page_size + 2)
+    os.environ['CRAWL_SHARDS'] = str(args.shards)
+    os.environ['PARSE_STRUCTURED_DATA'] = '0' if args.selectors_only else '1'
+    os.environ['CRAWL_SHARD_PAGES'] = str(args.shard_pages)
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_comparison(result, baseline):
+    print(f"Сравнение с {baseline.get('revision')} ({baseline.get('started_at')}):")
+    for metric in METRICS:
+        new, old = result['metrics'].get(metric), baseline['metrics'].get(metric)
+        if new is None or not old:
+            continue
+        print(f'  {metric}: {old} -> {new} ({(new - old) / old:+.1%})')
+
+
+def main():
+    args = parse_args()
+    started_at = datetime.now(timezone.utc)
+    with tempfile.TemporaryDirectory() as workdir:
+        configure_environment(args, workdir)
+        # config.py is read on import, so the project modules are imported only after the environment is set.
+        from benchmarks.harness import run_benchmark
+        metrics = asyncio.run(run_benchmark(
+            args.sections, args.products, args.page_size, args.latency, args.error_rate, args.padding
+        ))
+
+    result = {
+        'revision': git_revision(),
+        'started_at': started_at.isoformat(),
+        'python': platform.python_version(),
+        'parameters': {
+            'sections': args.sections,
+            'products': args.products,
+            'page_size': args.page_size,
+            'latency': args.latency,
+            'error_rate': args.error_rate,
+            'padding': args.padding,
+            'shards': args.shards,
+            'shard_pages': args.shard_pages,
+            'parser_backend': os.getenv('PARSER_BACKEND', 'lxml'),
+            'parse_executor': os.getenv('PARSE_EXECUTOR', 'process'),
+            'structured_data': not args.selectors_only,
+            'database': 'postgresql' if args.database_url else 'sqlite',
+        },
+        'metrics': metrics,
+    }
+    output = Path(args.output or f".benchmarks/{started_at:%Y%m%dT%H%M%S}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding='utf-8')
+
+    for metric, value in metrics.items():
+        print(f'{metric}: {value}')
+    print(f'Результаты сохранены в {output}')
+    if args.baseline:
+        print_comparison(result, json.loads(Path(args.baseline).read_text(encoding='utf-8')))
+
+
+if __name__ == '__main__':
+    main()
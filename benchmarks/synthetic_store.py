@@ -0,0 +1,247 @@
+"""
+A local stand-in for the real stores.
+
+The server generates Магнит- and Перекрёсток-style section and product pages whose markup matches
+parsers/selectors.py, so the parsers can be run end to end without touching the real sites.
+The pages also embed their products as JSON, as parsers/selectors.py expects it: JSON-LD on Магнит pages and
+the __NEXT_DATA__ hydration state on Перекрёсток pages.
+Pages are generated deterministically from their URL.
+"""
+import asyncio
+import json
+import random
+import zlib
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from aiohttp import web
+
+MAGNIT = 'magnit'
+PEREKRESTOK = 'perekrestok'
+
+_NAMES = ('Молоко', 'Кофе молотый', 'Сыр', 'Кефир', 'Салат', 'Суп', 'Йогурт', 'Творог', 'Хлеб', 'Чай')
+_BRANDS = ('Простоквашино', 'Lavazza', 'Jacobs', 'Домик в деревне', 'Valio', 'Jardin', 'Экомилк')
+_SIZES = ('900 мл', '1 л', '250 г', '500 г', '1 кг', '0,5 л')
+
+
+@dataclass
+class SyntheticStoreStats:
+    """
+    Counters of the served requests.
+
+    Attributes:
+        section_pages (int): Section pages served.
+        product_pages (int): Product pages served.
+        errors (int): Requests answered with an injected error.
+        bytes_sent (int): The total size of the served bodies.
+    """
+    section_pages: int = 0
+    product_pages: int = 0
+    errors: int = 0
+    bytes_sent: int = 0
+
+    @property
+    def pages(self) -> int:
+        return self.section_pages + self.product_pages
+
+
+@dataclass
+class SyntheticStore:
+    """
+    A local aiohttp server that imitates both stores.
+
+    Магнит is served under /magnit/ and Перекрёсток under /perekrestok/. Use base_url() to get the base URLs:
+    the stores get different host names (127.0.0.1 and localhost), so the HTTP client limits them separately.
+
+    Attributes:
+        sections (int): The number of sections of each store.
+        products_per_section (int): The number of products in each section.
+        page_size (int): The number of products on a section page.
+        latency (float): The delay before each answer, sec.
+        error_rate (float): The share of requests answered with 503.
+        padding (int): The size of the filler markup added to each product page, bytes.
+        structured_data (bool): Embed the products as JSON in the pages.
+        seed (int): The seed of the error injection.
+        stats (SyntheticStoreStats): Counters of the served requests.
+    """
+    sections: int = 3
+    products_per_section: int = 200
+    page_size: int = 24
+    latency: float = 0.0
+    error_rate: float = 0.0
+    padding: int = 20000
+    structured_data: bool = True
+    seed: int = 0
+    stats: SyntheticStoreStats = field(default_factory=SyntheticStoreStats)
+
+    def __post_init__(self):
+        self._random = random.Random(self.seed)
+        self._runner: Optional[web.AppRunner] = None
+        self.port: Optional[int] = None
+
+    def base_url(self, store: str) -> str:
+        host = '127.0.0.1' if store == MAGNIT else 'localhost'
+        return f'http://{host}:{self.port}/{store}/'
+
+    def section_urls(self, store: str) -> Dict[int, str]:
+        """
+        Get the section URLs of a store, relative to its base URL, keyed by section number.
+        """
+        if store == MAGNIT:
+            return {number: f'express/catalog/{number}-bench' for number in range(self.sections)}
+        return {number: f'cat/c/{number}/bench' for number in range(self.sections)}
+
+    async def start(self, port: int = 0):
+        app = web.Application()
+        app.router.add_get('/magnit/express/catalog/{section:\\d+}-bench', self._magnit_section)
+        app.router.add_get('/magnit/express/product/{section:\\d+}-{product:\\d+}', self._magnit_product)
+        app.router.add_get('/perekrestok/cat/c/{section:\\d+}/bench', self._perekrestok_section)
+        app.router.add_get('/perekrestok/cat/{section:\\d+}/p/{product:\\d+}', self._perekrestok_product)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def _answer(self, counter: str, html: str) -> web.Response:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.error_rate and self._random.random() < self.error_rate:
+            self.stats.errors += 1
+            raise web.HTTPServiceUnavailable()
+        body = html.encode('utf-8')
+        setattr(self.stats, counter, getattr(self.stats, counter) + 1)
+        self.stats.bytes_sent += len(body)
+        return web.Response(body=body, content_type='text/html', charset='utf-8')
+
+    def _page_products(self, request: web.Request):
+        page = int(request.query.get('page', 1))
+        first = (page - 1) * self.page_size
+        return range(first, min(first + self.page_size, self.products_per_section))
+
+    @staticmethod
+    def _product(section: int, product: int) -> Dict[str, str]:
+        key = zlib.crc32(f'{section}-{product}'.encode())
+        price = 50 + key % 2000 + (key % 100) / 100
+        old_price = round(price * 1.2, 2)
+        return {
+            'name': (
+                f'{_NAMES[key % len(_NAMES)]} «{_BRANDS[key % len(_BRANDS)]}» {_SIZES[key % len(_SIZES)]} №{product}'
+            ),
+            'price': price,
+            'old_price': old_price,
+            'price_new': f'{price:.2f}'.replace('.', ','),
+            'price_old': f'{old_price:.2f}'.replace('.', ','),
+            'rating': f'{3 + key % 20 / 10:.1f}',
+            'article': str(key),
+        }
+
+    def _filler(self) -> str:
+        return '<div class="filler">' + 'x' * self.padding + '</div>'
+
+    def _script(self, data, **attrs) -> str:
+        if not self.structured_data:
+            return ''
+        attributes = ''.join(f' {name.replace("_", "-")}="{value}"' for name, value in attrs.items())
+        return f'<script{attributes}>{json.dumps(data, ensure_ascii=False)}</script>'
+
+    async def _magnit_section(self, request: web.Request) -> web.Response:
+        section = int(request.match_info['section'])
+        products = self._page_products(request)
+        cards = ''.join(
+            f'<a class="app-link product-card product-list__item" href="/express/product/{section}-{product}">'
+            f'<span>Товар {product}</span></a>'
+            for product in products
+        )
+        item_list = {
+            '@context': 'https://schema.org',
+            '@type': 'ItemList',
+            'itemListElement': [
+                {'@type': 'ListItem', 'position': position + 1,
+                 'url': f'{self.base_url(MAGNIT)}express/product/{section}-{product}'}
+                for position, product in enumerate(products)
+            ],
+        }
+        return await self._answer(
+            'section_pages',
+            f'<html><head>{self._script(item_list, type="application/ld+json")}</head>'
+            f'<body><div class="product-list">{cards}</div></body></html>'
+        )
+
+    async def _magnit_product(self, request: web.Request) -> web.Response:
+        product = self._product(int(request.match_info['section']), int(request.match_info['product']))
+        json_ld = {
+            '@context': 'https://schema.org',
+            '@type': 'Product',
+            'name': product['name'],
+            'description': f'Описание товара {product["name"]}',
+            'sku': product['article'],
+            'offers': {
+                '@type': 'Offer',
+                'price': product['price'],
+                'priceCurrency': 'RUB',
+                'availability': 'https://schema.org/InStock',
+                'priceSpecification': [
+                    {'@type': 'UnitPriceSpecification', 'priceType': 'https://schema.org/StrikethroughPrice',
+                     'price': product['old_price'], 'priceCurrency': 'RUB'},
+                ],
+            },
+        }
+        return await self._answer(
+            'product_pages',
+            f'<html><head>{self._script(json_ld, type="application/ld+json")}</head><body>'
+            f'<h1 class="m-page-header__title text--h1">{product["name"]}</h1>'
+            f'<div class="product-detail-text">Описание товара {product["name"]}</div>'
+            f'<div data-test-id="product-price">{product["price_new"]} ₽</div>'
+            f'<div data-test-id="product-price_old">{product["price_old"]} ₽</div>'
+            f'<span data-test-id="product-article">{product["article"]}</span>'
+            f'{self._filler()}</body></html>'
+        )
+
+    async def _perekrestok_section(self, request: web.Request) -> web.Response:
+        section = int(request.match_info['section'])
+        products = self._page_products(request)
+        cards = ''.join(
+            f'<div class="product-card"><a class="product-card__link" href="/cat/{section}/p/{product}">'
+            f'Товар {product}</a></div>'
+            for product in products
+        )
+        state = {'props': {'pageProps': {'products': [
+            {'id': product, 'url': f'{self.base_url(PEREKRESTOK)}cat/{section}/p/{product}'} for product in products
+        ]}}}
+        return await self._answer(
+            'section_pages',
+            f'<html><body>{cards}{self._script(state, id="__NEXT_DATA__", type="application/json")}</body></html>'
+        )
+
+    async def _perekrestok_product(self, request: web.Request) -> web.Response:
+        product = self._product(int(request.match_info['section']), int(request.match_info['product']))
+        state = {'props': {'pageProps': {'product': {
+            'title': product['name'],
+            'plu': product['article'],
+            'priceTag': {'price': product['price'], 'grossPrice': product['old_price']},
+            'rating': float(product['rating']),
+            'balanceStateText': 'В наличии',
+        }}}}
+        return await self._answer(
+            'product_pages',
+            '<html><body>'
+            f'<h1 class="sc-fubCzh ibFUIH product__title">{product["name"]}</h1>'
+            f'<div class="price-new">{product["price_new"]} ₽</div>'
+            f'<div class="price-old">{product["price_old"]} ₽</div>'
+            f'<div role="img" class="sc-fFucqa drDzyo">{product["rating"]}</div>'
+            f'<div class="price-card-balance-state">В наличии</div>'
+            f'{self._filler()}{self._script(state, id="__NEXT_DATA__", type="application/json")}</body></html>'
+        )
@@ -1,9 +1,15 @@
+import argparse
 import asyncio
+from datetime import date
 from services.fetcher import PriceFetcher
+from services.columnar import ColumnarFetcher
+from services.exporter import ProductExporter
 from services.processor import ResultProcessor
 from services.printer import ResultPrinter
+from services.matcher import ProductMatcher
 from logger import setup_logger
 from exceptions import PriceComparatorError
+from config import EXPORT_DIR
 
 logger = setup_logger(__name__)
 
@@ -13,12 +19,15 @@ class PriceComparator:
     The PriceComparator class is responsible for fetching, processing, and printing price comparisons.
 
     Attributes:
-        fetcher (PriceFetcher): An instance of the PriceFetcher class.
+        fetcher (PriceFetcher): An instance of the PriceFetcher class, or of the ColumnarFetcher class
+            to compare the prices from an export instead of the database.
         processor (ResultProcessor): An instance of the ResultProcessor class.
+        matcher (ProductMatcher): An instance of the ProductMatcher class.
     """
-    def __init__(self):
-        self.fetcher = PriceFetcher()
+    def __init__(self, fetcher=None):
+        self.fetcher = fetcher or PriceFetcher()
         self.processor = ResultProcessor()
+        self.matcher = ProductMatcher()
 
     async def calculate_average_price(self):
         """
@@ -31,8 +40,10 @@ class PriceComparator:
             PriceComparatorError: If any error occurs during the operations.
         """
         try:
-            results = await self.fetcher.fetch_average_prices()
-            stores = await self.fetcher.fetch_stores()
+            results, stores = await asyncio.gather(
+                self.fetcher.fetch_average_prices(),
+                self.fetcher.fetch_stores()
+            )
             category_prices = self.processor.process_results(results)
             printer = ResultPrinter(stores)
             printer.print_comparison(category_prices)
@@ -40,8 +51,114 @@ class PriceComparator:
             logger.error(f"Ошибка при вычислении средней цены: {e}")
             raise PriceComparatorError(e)
 
+    async def compare_statistics(self, availability: str = None, min_price: float = None, max_price: float = None,
+                                 per_unit: bool = False):
+        """
+        The method to compare price statistics.
+
+        This method fetches the price statistics and the stores concurrently, processes the results,
+        and prints the comparison of count, mean, median, trimmed mean, p10/p90 and min/max prices.
+
+        Args:
+            availability (str, optional): Only products whose availability contains this text.
+            min_price (float, optional): Only products not cheaper than this price.
+            max_price (float, optional): Only products not more expensive than this price.
+            per_unit (bool): If True, the prices per kilogram or litre are compared instead of the pack prices.
+
+        Raises:
+            PriceComparatorError: If any error occurs during the operations.
+        """
+        try:
+            results, stores = await asyncio.gather(
+                self.fetcher.fetch_price_statistics(availability, min_price, max_price, per_unit=per_unit),
+                self.fetcher.fetch_stores()
+            )
+            category_statistics = self.processor.process_statistics(results)
+            printer = ResultPrinter(stores)
+            printer.print_statistics(category_statistics)
+        except Exception as e:
+            logger.error(f"Ошибка при вычислении статистики цен: {e}")
+            raise PriceComparatorError(e)
+
+    async def compare_matched_products(self, rematch: bool = False, limit: int = None):
+        """
+        The method to compare the prices of the same goods in different stores.
+
+        Args:
+            rematch (bool): If True, the products of every pair of stores are matched again before the comparison.
+            limit (int, optional): The maximum number of pairs to print, the largest price gaps first.
+
+        Raises:
+            PriceComparatorError: If any error occurs during the operations.
+        """
+        try:
+            stores = await self.fetcher.fetch_stores()
+            if rematch:
+                for store_name in stores:
+                    for other_store_name in stores:
+                        if store_name < other_store_name:
+                            await self.matcher.run(store_name, other_store_name)
+            matched_products = await self.fetcher.fetch_matched_price_gaps(limit)
+            printer = ResultPrinter(stores)
+            printer.print_matched_products(matched_products)
+        except Exception as e:
+            logger.error(f"Ошибка при сравнении одинаковых товаров: {e}")
+            raise PriceComparatorError(e)
+
+    @staticmethod
+    async def export(directory: str = EXPORT_DIR, since: date = None):
+        """
+        The method to export the products to Parquet files partitioned by store and crawl date.
+
+        Args:
+            directory (str): The directory of the export.
+            since (date, optional): The first crawl date to export. By default, from the latest exported date.
+
+        Raises:
+            PriceComparatorError: If any error occurs during the export.
+        """
+        try:
+            exporter = ProductExporter(directory)
+            await exporter.export(since)
+            print(f'Выгружено товаров: {exporter.rows}, партиций: {exporter.partitions}, каталог: {directory}')
+        except Exception as e:
+            logger.error(f"Ошибка при выгрузке товаров: {e}")
+            raise PriceComparatorError(e)
+
 
 if __name__ == "__main__":
-    # Creating an instance of the PriceComparator class and running the calculate_average_price method
-    comparator = PriceComparator()
-    asyncio.run(comparator.calculate_average_price())
+    parser = argparse.ArgumentParser(description='Сравнение цен в магазинах')
+    parser.add_argument('--averages', action='store_true', help='Сравнить только средние цены')
+    parser.add_argument('--availability', help='Учитывать только товары с указанным текстом наличия')
+    parser.add_argument('--min-price', type=float, help='Минимальная цена учитываемых товаров')
+    parser.add_argument('--max-price', type=float, help='Максимальная цена учитываемых товаров')
+    parser.add_argument('--per-unit', action='store_true', help='Сравнить цены за килограмм или литр')
+    parser.add_argument('--matched', action='store_true', help='Сравнить цены одинаковых товаров разных магазинов')
+    parser.add_argument('--rematch', action='store_true', help='Заново сопоставить товары перед сравнением')
+    parser.add_argument('--limit', type=int, help='Количество выводимых пар товаров')
+    parser.add_argument('--export', nargs='?', const=EXPORT_DIR, metavar='DIR',
+                        help='Выгрузить товары в Parquet по магазинам и датам обхода')
+    parser.add_argument('--from-export', nargs='?', const=EXPORT_DIR, metavar='DIR',
+                        help='Сравнить цены по выгрузке вместо базы данных')
+    parser.add_argument('--since', type=date.fromisoformat, help='Первая дата обхода выгрузки, ГГГГ-ММ-ДД')
+    parser.add_argument('--until', type=date.fromisoformat,
+                        help='Дата обхода, на которую сравниваются цены по выгрузке')
+    args = parser.parse_args()
+    if args.from_export and (args.matched or args.rematch):
+        parser.error('Сравнение одинаковых товаров выполняется только по базе данных')
+    if args.from_export and args.since:
+        parser.error('--since задаёт первую дату выгрузки, сравнение по выгрузке учитывает все даты до --until')
+
+    # Creating an instance of the PriceComparator class and running the comparison
+    if args.from_export:
+        comparator = PriceComparator(ColumnarFetcher(args.from_export, args.until))
+    else:
+        comparator = PriceComparator()
+    if args.export:
+        asyncio.run(comparator.export(args.export, args.since))
+    elif args.matched or args.rematch:
+        asyncio.run(comparator.compare_matched_products(args.rematch, args.limit))
+    elif args.averages:
+        asyncio.run(comparator.calculate_average_price())
+    else:
+        asyncio.run(comparator.compare_statistics(args.availability, args.min_price, args.max_price, args.per_unit))
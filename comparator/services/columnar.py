@@ -0,0 +1,251 @@
+"""
+The price comparisons of PriceFetcher, calculated from an export of ProductExporter instead of the database.
+
+Only the columns a comparison needs are read, and only from the partitions up to the requested crawl date. A product
+has a row for every category it is listed in and may be present in several partitions, one per date it changed on;
+an unchanged product is not scraped again, so its latest row may be in a partition of any earlier date. Only its
+latest row in each category is used, so the comparison describes the products as they were on that date.
+The statistics of all stores and categories are then calculated at once with vectorized NumPy kernels over the
+prices sorted by group, with the same definitions as the SQL of PriceFetcher: linear interpolation for the
+percentiles (percentile_cont) and percent_rank for the trimmed mean.
+"""
+import asyncio
+import os
+from collections import namedtuple
+from datetime import date
+from typing import Dict, List, Optional
+
+from comparator.logger import setup_logger
+from comparator.services.exporter import export_schema
+from config import EXPORT_DIR, COMPARE_TRIM_FRACTION
+
+try:
+    import numpy as np
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+except ImportError:
+    np = None
+    pa = None
+
+logger = setup_logger(__name__)
+
+AveragePrice = namedtuple('AveragePrice', 'store_name category_name average_price')
+PriceStatistics = namedtuple(
+    'PriceStatistics', 'store_name category_name count mean median trimmed_mean p10 p90 min_price max_price'
+)
+
+# Separates the parts of a group key. Does not occur in store, category or unit names.
+_KEY_SEPARATOR = '\x1f'
+
+
+def group_statistics(codes, prices, trim_fraction: float = COMPARE_TRIM_FRACTION) -> Dict[str, 'np.ndarray']:
+    """
+    Calculate the price statistics of every group.
+
+    Args:
+        codes (np.ndarray): The group of every price, 0 to the number of groups - 1. Every group has a price.
+        prices (np.ndarray): The prices.
+        trim_fraction (float): The share of the cheapest and of the most expensive prices left out of the trimmed mean.
+
+    Returns:
+        Dict[str, np.ndarray]: count, mean, median, trimmed_mean, p10, p90, min_price and max_price of every group,
+            indexed by the group code.
+    """
+    order = np.lexsort((prices, codes))
+    codes = codes[order]
+    prices = prices[order]
+    size = len(prices)
+
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    ends = np.r_[starts[1:], size]
+    counts = ends - starts
+    means = np.add.reduceat(prices, starts) / counts
+
+    def quantile(q):
+        position = starts + q * (counts - 1)
+        lower = np.floor(position).astype(np.int64)
+        upper = np.minimum(lower + 1, ends - 1)
+        return prices[lower] + (position - lower) * (prices[upper] - prices[lower])
+
+    # percent_rank: the number of smaller prices in the group over the size of the group - 1, 0 for a single price.
+    first = np.r_[True, (codes[1:] != codes[:-1]) | (prices[1:] != prices[:-1])]
+    first_index = np.maximum.accumulate(np.where(first, np.arange(size), 0))
+    group_counts = np.repeat(counts, counts)
+    rank = (first_index - np.repeat(starts, counts)) / np.maximum(group_counts - 1, 1)
+    kept = (rank >= trim_fraction) & (rank <= 1 - trim_fraction)
+    kept_counts = np.add.reduceat(kept.astype(np.int64), starts)
+    kept_sums = np.add.reduceat(np.where(kept, prices, 0.0), starts)
+    trimmed_means = np.where(kept_counts > 0, kept_sums / np.maximum(kept_counts, 1), means)
+
+    return {
+        'count': counts,
+        'mean': means,
+        'median': quantile(0.5),
+        'trimmed_mean': trimmed_means,
+        'p10': quantile(0.1),
+        'p90': quantile(0.9),
+        'min_price': prices[starts],
+        'max_price': prices[ends - 1],
+    }
+
+
+class ColumnarFetcher:
+    """
+    The ColumnarFetcher class calculates the price comparisons of PriceFetcher from an export.
+
+    It has the same methods as PriceFetcher for the comparisons it supports, so PriceComparator can use either.
+
+    Attributes:
+        directory (str): The directory of the export.
+        until (date): The crawl date to compare the products as of. None for the last exported date.
+    """
+
+    def __init__(self, directory: str = EXPORT_DIR, until: Optional[date] = None):
+        self.directory = directory
+        self.until = until
+
+    def _dataset(self):
+        if np is None:
+            raise ImportError('Для сравнения по выгрузке установите numpy и pyarrow: pip install numpy pyarrow')
+        if not os.path.isdir(self.directory):
+            raise FileNotFoundError(f'Выгрузка не найдена: {self.directory}')
+        partition_schema = pa.schema([('store', pa.string()), ('crawl_date', pa.string())])
+        schema = pa.unify_schemas([export_schema(), partition_schema])
+        return ds.dataset(self.directory, schema=schema, format='parquet',
+                          partitioning=ds.partitioning(partition_schema, flavor='hive'))
+
+    def _latest(self, columns: List[str]):
+        """
+        Read the latest row of every product in every category up to the crawl date.
+
+        Args:
+            columns (List[str]): The columns to read besides the store and the category.
+
+        Returns:
+            pyarrow.Table: The rows.
+        """
+        condition = ds.field('crawl_date') <= self.until.isoformat() if self.until is not None else None
+        columns = ['store', 'product_id', 'category', 'scraped_at', *(name for name in columns if name != 'category')]
+        table = self._dataset().to_table(columns=columns, filter=condition)
+        if table.num_rows == 0:
+            return table
+
+        product_ids = table['product_id'].to_numpy()
+        categories = table['category'].combine_chunks().dictionary_encode().indices.to_numpy()
+        scraped_at = table['scraped_at'].cast(pa.int64()).to_numpy()
+        order = np.lexsort((scraped_at, categories, product_ids))
+        product_ids = product_ids[order]
+        categories = categories[order]
+        last = np.r_[(product_ids[1:] != product_ids[:-1]) | (categories[1:] != categories[:-1]), True]
+        return table.take(order[last])
+
+    @staticmethod
+    def _groups(table, per_unit: bool):
+        """
+        Encode the store and category (and unit) of every row as a group code.
+
+        Args:
+            table (pyarrow.Table): The rows.
+            per_unit (bool): If True, the unit is a part of the group.
+
+        Returns:
+            tuple: The group codes and the (store name, category name) of every group.
+        """
+        parts = [table['store'], table['category']]
+        if per_unit:
+            parts.append(table['unit'])
+        keys = pc.binary_join_element_wise(*parts, _KEY_SEPARATOR).combine_chunks().dictionary_encode()
+        groups = []
+        for key in keys.dictionary.to_pylist():
+            store, category, *unit = key.split(_KEY_SEPARATOR)
+            groups.append((store, f'{category} (за {unit[0]})' if per_unit else category))
+        return keys.indices.to_numpy(), groups
+
+    async def fetch_average_prices(self):
+        """
+        Asynchronously calculates the average price of each store in each category.
+
+        Returns:
+            list: Rows with store_name, category_name and average_price.
+        """
+        return await asyncio.to_thread(self._average_prices)
+
+    def _average_prices(self):
+        table = self._latest(['category', 'price_new'])
+        table = table.filter(pc.is_valid(table['price_new']))
+        if table.num_rows == 0:
+            return []
+        codes, groups = self._groups(table, per_unit=False)
+        prices = table['price_new'].to_numpy()
+        averages = np.bincount(codes, weights=prices) / np.bincount(codes)
+        logger.info(f"Calculated average prices from the export in {self.directory}")
+        return [AveragePrice(store, category, float(average)) for (store, category), average in zip(groups, averages)]
+
+    async def fetch_price_statistics(self, availability: str = None, min_price: float = None,
+                                     max_price: float = None, trim_fraction: float = COMPARE_TRIM_FRACTION,
+                                     per_unit: bool = False):
+        """
+        Asynchronously calculates price statistics of each store in each category.
+
+        Args:
+            availability (str, optional): Only products whose availability contains this text.
+            min_price (float, optional): Only products not cheaper than this price.
+            max_price (float, optional): Only products not more expensive than this price.
+            trim_fraction (float): The share of the cheapest and of the most expensive products
+                left out of the trimmed mean.
+            per_unit (bool): If True, the statistics are calculated over the prices per kilogram or litre,
+                separately for each unit, and the category name gets the unit appended.
+
+        Returns:
+            list: Rows with store_name, category_name, count, mean, median, trimmed_mean, p10, p90,
+                min_price and max_price.
+        """
+        return await asyncio.to_thread(
+            self._price_statistics, availability, min_price, max_price, trim_fraction, per_unit
+        )
+
+    def _price_statistics(self, availability, min_price, max_price, trim_fraction, per_unit):
+        price_column = 'unit_price' if per_unit else 'price_new'
+        table = self._latest(['category', price_column, 'unit', 'availability'])
+        price = table[price_column]
+        mask = pc.is_valid(price)
+        if per_unit:
+            mask = pc.and_(mask, pc.is_valid(table['unit']))
+        if availability is not None:
+            matches = pc.match_substring(table['availability'], availability, ignore_case=True)
+            mask = pc.and_(mask, pc.fill_null(matches, False))
+        if min_price is not None:
+            mask = pc.and_(mask, pc.fill_null(pc.greater_equal(price, min_price), False))
+        if max_price is not None:
+            mask = pc.and_(mask, pc.fill_null(pc.less_equal(price, max_price), False))
+        table = table.filter(mask)
+        if table.num_rows == 0:
+            return []
+
+        codes, groups = self._groups(table, per_unit)
+        statistics = group_statistics(codes, table[price_column].to_numpy(), trim_fraction)
+        logger.info(f"Calculated price statistics from the export in {self.directory}")
+        return [
+            PriceStatistics(store, category, int(statistics['count'][code]),
+                            *(float(statistics[name][code]) for name in PriceStatistics._fields[3:]))
+            for code, (store, category) in enumerate(groups)
+        ]
+
+    async def fetch_stores(self):
+        """
+        Asynchronously lists the names of the stores in the export.
+
+        Returns:
+            list: A list of store names.
+        """
+        return await asyncio.to_thread(self._stores)
+
+    def _stores(self):
+        stores = set()
+        for fragment in self._dataset().get_fragments():
+            store = ds.get_partition_keys(fragment.partition_expression).get('store')
+            if store is not None:
+                stores.add(store)
+        logger.info(f"Listed stores of the export in {self.directory}")
+        return sorted(stores)
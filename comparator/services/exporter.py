@@ -0,0 +1,280 @@
+"""
+The export of the products to Parquet files for analysis without the database.
+
+The products are read joined with their store and categories in a single query streamed with a server-side cursor,
+EXPORT_CHUNK_SIZE rows at a time, ordered by store and scraped_at, so the partitions come one after another and only
+one of them is open at a time. The memory of the export is a chunk of rows plus the product ids and categories of
+the partition being written, which it needs to merge the partition with the rows exported before. A product
+listed in several categories gets a row for each of them. The rows are written to Hive-style partitions, one
+directory per store and crawl date (the UTC date of scraped_at):
+
+    EXPORT_DIR/store=<store>/crawl_date=<YYYY-MM-DD>/part-<id>.parquet
+
+Every export replaces the partitions it writes and leaves the others. A product is only scraped again when it
+changes, so a partition holds the products that changed on its date, and the state of all products on a date is the
+latest row of each of them over the partitions up to that date. The partition of the latest exported date is written
+again by the next export; the rows it holds for products that have changed again since are kept, so every partition
+keeps the products as they were last scraped on its date.
+"""
+import os
+import uuid
+from datetime import date, datetime, time, timezone
+from typing import List, Optional, Tuple
+from urllib.parse import quote, unquote
+
+from sqlalchemy import select
+
+from models.product import Store, Category, Product, product_category_links
+from models.database import async_session
+from comparator.logger import setup_logger
+from config import EXPORT_DIR, EXPORT_CHUNK_SIZE, EXPORT_COMPRESSION
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+logger = setup_logger(__name__)
+
+# The columns of the exported files. The store and the crawl date are the partition directories.
+COLUMNS = (
+    ('product_id', 'int64'),
+    ('category', 'string'),
+    ('name', 'string'),
+    ('article', 'string'),
+    ('url', 'string'),
+    ('price_new', 'float64'),
+    ('price_old', 'float64'),
+    ('unit_price', 'float64'),
+    ('unit', 'string'),
+    ('rating', 'float64'),
+    ('availability', 'string'),
+    ('scraped_at', 'timestamp'),
+)
+
+PART_PREFIX = 'part-'
+PART_SUFFIX = '.parquet'
+
+
+def export_schema():
+    """
+    Build the Arrow schema of the exported files.
+
+    Returns:
+        pyarrow.Schema: The schema.
+
+    Raises:
+        ImportError: If pyarrow is not installed.
+    """
+    if pa is None:
+        raise ImportError('Для выгрузки в Parquet установите pyarrow: pip install pyarrow')
+    types = {'int64': pa.int64(), 'string': pa.string(), 'float64': pa.float64(),
+             'timestamp': pa.timestamp('us', tz='UTC')}
+    return pa.schema([(name, types[kind]) for name, kind in COLUMNS])
+
+
+def partition_path(directory: str, store: str, crawl_date: str) -> str:
+    """
+    Get the directory of a partition. The store name is percent-encoded, as pyarrow expects it.
+
+    Args:
+        directory (str): The directory of the export.
+        store (str): The name of the store.
+        crawl_date (str): The crawl date, YYYY-MM-DD.
+
+    Returns:
+        str: The directory of the partition.
+    """
+    return os.path.join(directory, f'store={quote(store, safe="")}', f'crawl_date={crawl_date}')
+
+
+def exported_dates(directory: str = EXPORT_DIR) -> List[str]:
+    """
+    List the crawl dates present in an export.
+
+    Args:
+        directory (str): The directory of the export.
+
+    Returns:
+        List[str]: The crawl dates, YYYY-MM-DD, in ascending order.
+    """
+    dates = set()
+    if not os.path.isdir(directory):
+        return []
+    for store_entry in os.scandir(directory):
+        if not store_entry.is_dir() or not store_entry.name.startswith('store='):
+            continue
+        for date_entry in os.scandir(store_entry.path):
+            if date_entry.is_dir() and date_entry.name.startswith('crawl_date='):
+                dates.add(unquote(date_entry.name[len('crawl_date='):]))
+    return sorted(dates)
+
+
+class _PartitionWriter:
+    """
+    Writes the rows of one partition to a temporary file, one row group per chunk.
+    """
+
+    def __init__(self, path: str, schema, compression: str):
+        self.path = path
+        self.temporary = os.path.join(path, f'.{PART_PREFIX}{uuid.uuid4().hex}{PART_SUFFIX}.tmp')
+        self.rows: List[tuple] = []
+        self.written = 0
+        # The product_id and category columns of the written row groups.
+        self.keys: List = []
+        self._schema = schema
+        os.makedirs(path, exist_ok=True)
+        self._writer = pq.ParquetWriter(self.temporary, schema, compression=compression)
+        self._closed = False
+
+    def write(self):
+        if not self.rows:
+            return
+        columns = list(zip(*self.rows))
+        table = pa.Table.from_arrays(
+            [pa.array(column, type=field.type) for column, field in zip(columns, self._schema)], schema=self._schema
+        )
+        self._writer.write_table(table)
+        self.keys.append(table.select(['product_id', 'category']))
+        self.written += len(self.rows)
+        self.rows = []
+
+    def keep_previous(self):
+        """
+        Copy the rows of the existing files of the partition whose product and category were not written again.
+        """
+        keys = pa.concat_tables(self.keys) if self.keys else None
+        for entry in os.scandir(self.path):
+            if not entry.name.startswith(PART_PREFIX) or not entry.name.endswith(PART_SUFFIX):
+                continue
+            table = pq.read_table(entry.path, schema=self._schema)
+            if keys is not None:
+                table = table.join(keys, keys=['product_id', 'category'], join_type='left anti')
+            if table.num_rows:
+                self._writer.write_table(table.select(self._schema.names).cast(self._schema))
+
+    def finish(self):
+        """
+        Write the remaining rows and the kept previous ones, and close the temporary file.
+        """
+        self.write()
+        self.keep_previous()
+        self.keys = []
+        self._close()
+
+    def commit(self):
+        """
+        Make the finished temporary file the only file of the partition.
+        """
+        name = os.path.basename(self.temporary)[1:-len('.tmp')]
+        os.replace(self.temporary, os.path.join(self.path, name))
+        for entry in os.scandir(self.path):
+            if entry.name != name and entry.name.startswith(PART_PREFIX) and entry.name.endswith(PART_SUFFIX):
+                os.remove(entry.path)
+
+    def abort(self):
+        self._close()
+        try:
+            os.remove(self.temporary)
+        except OSError:
+            pass
+
+    def _close(self):
+        if not self._closed:
+            self._writer.close()
+            self._closed = True
+
+
+class ProductExporter:
+    """
+    The ProductExporter class exports the products to Parquet files partitioned by store and crawl date.
+
+    Attributes:
+        directory (str): The directory of the export.
+        chunk_size (int): The number of rows fetched from the database at a time and written as one row group.
+        compression (str): The compression of the Parquet files.
+        rows (int): The number of rows written by the last export.
+        partitions (int): The number of partitions written by the last export.
+    """
+
+    def __init__(self, directory: str = EXPORT_DIR, chunk_size: int = EXPORT_CHUNK_SIZE,
+                 compression: str = EXPORT_COMPRESSION):
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.compression = compression
+        self.rows = 0
+        self.partitions = 0
+
+    async def export(self, since: Optional[date] = None) -> int:
+        """
+        Export the products scraped since the given date.
+
+        The partitions are written to temporary files and replace the existing ones only once the whole export
+        has succeeded, so an interrupted export leaves the previous one intact. Products that were never scraped
+        (scraped_at is NULL) are not exported.
+
+        Args:
+            since (date, optional): The first crawl date to export. By default the export starts from the latest
+                exported date, which may have been exported before the crawl of that day finished; the first export
+                takes all products.
+
+        Returns:
+            int: The number of exported rows.
+        """
+        schema = export_schema()
+        if since is None:
+            dates = exported_dates(self.directory)
+            since = date.fromisoformat(dates[-1]) if dates else None
+
+        links = product_category_links()
+        stmt = (
+            select(
+                Store.name, Product.id, Category.name, Product.name, Product.article, Product.url,
+                Product.price_new, Product.price_old, Product.unit_price, Product.unit, Product.rating,
+                Product.availability, Product.scraped_at,
+            )
+            .join(Store, Store.id == Product.store_id)
+            .join(links, links.c.product_id == Product.id)
+            .join(Category, Category.id == links.c.category_id)
+            .where(Product.scraped_at.is_not(None))
+            .order_by(Product.store_id, Product.scraped_at)
+        )
+        if since is not None:
+            stmt = stmt.where(Product.scraped_at >= datetime.combine(since, time.min, timezone.utc))
+
+        # The finished partitions wait for the end of the export, only the current one is open.
+        writers: List[_PartitionWriter] = []
+        current_key: Optional[Tuple[str, str]] = None
+        try:
+            async with async_session() as session:
+                result = await session.stream(stmt.execution_options(yield_per=self.chunk_size))
+                async for rows in result.partitions():
+                    for row in rows:
+                        scraped_at = row[-1]
+                        if scraped_at.tzinfo is None:
+                            # SQLite does not keep the time zone, the timestamps are stored in UTC.
+                            scraped_at = scraped_at.replace(tzinfo=timezone.utc)
+                        key = (row[0], scraped_at.astimezone(timezone.utc).date().isoformat())
+                        if key != current_key:
+                            if writers:
+                                writers[-1].finish()
+                            writers.append(_PartitionWriter(partition_path(self.directory, *key), schema,
+                                                            self.compression))
+                            current_key = key
+                        writers[-1].rows.append(tuple(row[1:]))
+                    if writers and len(writers[-1].rows) >= self.chunk_size:
+                        writers[-1].write()
+            if writers:
+                writers[-1].finish()
+        except BaseException:
+            for writer in writers:
+                writer.abort()
+            raise
+        for writer in writers:
+            writer.commit()
+
+        self.rows = sum(writer.written for writer in writers)
+        self.partitions = len(writers)
+        logger.info(f"Exported {self.rows} products to {self.partitions} partitions in {self.directory}")
+        return self.rows
@@ -1,7 +1,11 @@
-from sqlalchemy import select, func
-from models.product import Store, Category, Product
+from sqlalchemy import select, func, literal
+from sqlalchemy.orm import aliased
+from models.product import Store, Category, Product, ProductMatch, product_category_links
+from models.price_history import PriceObservation
+from models.price_aggregates import PriceAggregate
 from models.database import async_session
 from comparator.logger import setup_logger
+from config import COMPARE_TRIM_FRACTION
 
 logger = setup_logger(__name__)
 
@@ -21,30 +25,146 @@ class PriceFetcher:
     """
     async def fetch_average_prices(self):
         """
-        Prints a comparison of the prices.
+        Asynchronously fetches the average price of each store in each category.
 
-        This method takes a dictionary of category prices, and prints a comparison of the prices.
-        It also calculates the difference between the highest and lowest prices, and identifies the store with the lowest price.
+        The averages are read from the price_aggregates table, which the product writer keeps up to date,
+        so the query cost does not depend on the number of products. A product counts in every category
+        it is listed in.
+
+        Returns:
+            list: Rows with store_name, category_name and average_price.
+        """
+        async with async_session() as session:
+            stmt = (
+                select(
+                    Store.name.label('store_name'),
+                    Category.name.label('category_name'),
+                    (PriceAggregate.price_sum / PriceAggregate.price_count).label('average_price')
+                )
+                .join(Store, Store.id == PriceAggregate.store_id)
+                .join(Category, Category.id == PriceAggregate.category_id)
+                .where(PriceAggregate.price_count > 0)
+            )
+            result = await session.execute(stmt)
+            logger.info("Fetched average prices from the database")
+            return result.fetchall()
+
+    async def fetch_price_statistics(self, availability: str = None, min_price: float = None,
+                                     max_price: float = None, trim_fraction: float = COMPARE_TRIM_FRACTION,
+                                     per_unit: bool = False):
+        """
+        Asynchronously fetches price statistics of each store in each category in a single query.
+
+        The statistics are calculated in the database: percentile_cont gives the median and the 10th/90th
+        percentiles, and a percent_rank window marks the prices used for the trimmed mean. A product counts
+        in every category it is listed in.
 
         Args:
-            category_prices (dict): A dictionary of category prices.
+            availability (str, optional): Only products whose availability contains this text.
+            min_price (float, optional): Only products not cheaper than this price.
+            max_price (float, optional): Only products not more expensive than this price.
+            trim_fraction (float): The share of the cheapest and of the most expensive products
+                left out of the trimmed mean.
+            per_unit (bool): If True, the statistics are calculated over the prices per kilogram or litre,
+                separately for each unit, and the category name gets the unit appended.
 
         Returns:
-            None
+            list: Rows with store_name, category_name, count, mean, median, trimmed_mean, p10, p90,
+                min_price and max_price.
         """
+        price = Product.unit_price if per_unit else Product.price_new
+        unit = Product.unit if per_unit else literal('')
+        links = product_category_links()
+        ranked = (
+            select(
+                Product.store_id,
+                links.c.category_id,
+                unit.label('unit'),
+                price.label('price'),
+                func.percent_rank().over(
+                    partition_by=(Product.store_id, links.c.category_id, unit),
+                    order_by=price
+                ).label('price_rank')
+            )
+            .join(links, links.c.product_id == Product.id)
+            .where(price.is_not(None))
+        )
+        if availability is not None:
+            ranked = ranked.where(Product.availability.ilike(f'%{availability}%'))
+        if min_price is not None:
+            ranked = ranked.where(price >= min_price)
+        if max_price is not None:
+            ranked = ranked.where(price <= max_price)
+        ranked = ranked.subquery()
+
+        category_name = (Category.name + ' (за ' + ranked.c.unit + ')') if per_unit else Category.name
+
         async with async_session() as session:
             stmt = (
                 select(
                     Store.name.label('store_name'),
+                    category_name.label('category_name'),
+                    func.count(ranked.c.price).label('count'),
+                    func.avg(ranked.c.price).label('mean'),
+                    func.percentile_cont(0.5).within_group(ranked.c.price).label('median'),
+                    func.coalesce(
+                        func.avg(ranked.c.price).filter(
+                            ranked.c.price_rank.between(trim_fraction, 1 - trim_fraction)
+                        ),
+                        func.avg(ranked.c.price)
+                    ).label('trimmed_mean'),
+                    func.percentile_cont(0.1).within_group(ranked.c.price).label('p10'),
+                    func.percentile_cont(0.9).within_group(ranked.c.price).label('p90'),
+                    func.min(ranked.c.price).label('min_price'),
+                    func.max(ranked.c.price).label('max_price'),
+                )
+                .join(Store, Store.id == ranked.c.store_id)
+                .join(Category, Category.id == ranked.c.category_id)
+                .group_by(Store.name, Category.name, ranked.c.unit)
+            )
+            result = await session.execute(stmt)
+            logger.info("Fetched price statistics from the database")
+            return result.fetchall()
+
+    async def fetch_matched_price_gaps(self, limit: int = None):
+        """
+        Asynchronously fetches the price gaps between matched products of different stores.
+
+        Args:
+            limit (int, optional): The maximum number of pairs, the largest gaps first.
+
+        Returns:
+            list: Rows with category_name, store_name, name, price, matched_store_name, matched_name,
+                matched_price, price_gap and score.
+        """
+        matched_product = aliased(Product)
+        matched_store = aliased(Store)
+        price_gap = Product.price_new - matched_product.price_new
+        async with async_session() as session:
+            stmt = (
+                select(
                     Category.name.label('category_name'),
-                    func.avg(Product.price_new).label('average_price')
+                    Store.name.label('store_name'),
+                    Product.name.label('name'),
+                    Product.price_new.label('price'),
+                    matched_store.name.label('matched_store_name'),
+                    matched_product.name.label('matched_name'),
+                    matched_product.price_new.label('matched_price'),
+                    price_gap.label('price_gap'),
+                    ProductMatch.score.label('score'),
                 )
-                .join(Product, Store.id == Product.store_id)
+                .join(Product, Product.id == ProductMatch.product_id)
+                .join(matched_product, matched_product.id == ProductMatch.matched_product_id)
+                .join(Store, Store.id == Product.store_id)
+                .join(matched_store, matched_store.id == matched_product.store_id)
                 .join(Category, Category.id == Product.category_id)
-                .group_by(Store.name, Category.name)
+                .where(Product.price_new.is_not(None), matched_product.price_new.is_not(None))
+                .order_by(func.abs(price_gap).desc())
             )
+            if limit is not None:
+                stmt = stmt.limit(limit)
             result = await session.execute(stmt)
-            logger.info("Fetched average prices from the database")
+            logger.info("Fetched matched product price gaps from the database")
             return result.fetchall()
 
     async def fetch_stores(self):
@@ -62,3 +182,54 @@ class PriceFetcher:
             stores = [row[0] for row in result.fetchall()]
             logger.info("Fetched stores from the database")
             return stores
+
+    async def fetch_price_as_of(self, product_id: int, moment):
+        """
+        Asynchronously fetches the price of a product as of the given moment.
+
+        The query reads the latest observation not later than the moment, which is a single descending
+        lookup on the (product_id, observed_at) primary key.
+
+        Args:
+            product_id (int): The ID of the product.
+            moment (datetime): The moment to get the price for.
+
+        Returns:
+            Row: The observation with observed_at, price_new and price_old. None if there is no observation yet.
+        """
+        async with async_session() as session:
+            stmt = (
+                select(PriceObservation.observed_at, PriceObservation.price_new, PriceObservation.price_old)
+                .where(PriceObservation.product_id == product_id, PriceObservation.observed_at <= moment)
+                .order_by(PriceObservation.observed_at.desc())
+                .limit(1)
+            )
+            result = await session.execute(stmt)
+            logger.info(f"Fetched price of product {product_id} as of {moment}")
+            return result.first()
+
+    async def fetch_price_series(self, product_id: int, since=None, until=None):
+        """
+        Asynchronously fetches the price series of a product.
+
+        Args:
+            product_id (int): The ID of the product.
+            since (datetime, optional): The start of the period, inclusive.
+            until (datetime, optional): The end of the period, inclusive.
+
+        Returns:
+            list: Observations with observed_at, price_new and price_old, ordered by time.
+        """
+        async with async_session() as session:
+            stmt = (
+                select(PriceObservation.observed_at, PriceObservation.price_new, PriceObservation.price_old)
+                .where(PriceObservation.product_id == product_id)
+                .order_by(PriceObservation.observed_at)
+            )
+            if since is not None:
+                stmt = stmt.where(PriceObservation.observed_at >= since)
+            if until is not None:
+                stmt = stmt.where(PriceObservation.observed_at <= until)
+            result = await session.execute(stmt)
+            logger.info(f"Fetched price series of product {product_id}")
+            return result.fetchall()
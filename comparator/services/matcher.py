@@ -0,0 +1,156 @@
+import math
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select, delete, insert
+
+from config import MATCH_MIN_SCORE, MATCH_MAX_TOKEN_SHARE, MATCH_SIZE_TOLERANCE
+from models.product import Store, Product, ProductMatch
+from models.database import async_session
+from utils.name_normalizer import NormalizedName, normalize_name
+from comparator.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+def _sizes_compatible(first: Optional[float], second: Optional[float]) -> bool:
+    if first is None or second is None:
+        return True
+    return abs(first - second) <= MATCH_SIZE_TOLERANCE * max(first, second)
+
+
+def attributes_compatible(first: NormalizedName, second: NormalizedName) -> bool:
+    """
+    Check that two normalized names do not contradict each other in volume, weight, fat content or pack size.
+    """
+    return (
+        _sizes_compatible(first.volume_ml, second.volume_ml)
+        and _sizes_compatible(first.weight_g, second.weight_g)
+        and (first.fat_pct is None or second.fat_pct is None or first.fat_pct == second.fat_pct)
+        and (first.pack_count is None or second.pack_count is None or first.pack_count == second.pack_count)
+    )
+
+
+class ProductMatcher:
+    """
+    The ProductMatcher class finds the same goods in the catalogs of two stores.
+
+    Product names are normalized and the products of the second store are put into an inverted index
+    from words to products. For each product of the first store, only the products that share at least
+    one of its rare words are scored, so the matching runs in near-linear time instead of comparing all pairs.
+    Candidates are scored by the IDF-weighted Jaccard similarity of all their words, common ones included,
+    must not contradict each other in volume, weight, fat content or pack size, and get a bonus for the same brand.
+    """
+
+    @staticmethod
+    async def fetch_products(store_name: str) -> List[Tuple[int, str]]:
+        """
+        Asynchronously fetches the IDs and names of all products of a store.
+
+        Args:
+            store_name (str): The name of the store.
+
+        Returns:
+            list: (id, name) tuples.
+        """
+        async with async_session() as session:
+            stmt = (
+                select(Product.id, Product.name)
+                .join(Store, Store.id == Product.store_id)
+                .where(Store.name == store_name, Product.name.is_not(None))
+            )
+            result = await session.execute(stmt)
+            return [(product_id, name) for product_id, name in result]
+
+    @staticmethod
+    def match(products: List[Tuple[int, str]], candidates: List[Tuple[int, str]],
+              min_score: float = MATCH_MIN_SCORE) -> List[Tuple[int, int, float]]:
+        """
+        Match the products of one store against the products of another.
+
+        Args:
+            products (list): (id, name) tuples of the first store.
+            candidates (list): (id, name) tuples of the second store.
+            min_score (float): The minimum score of a match.
+
+        Returns:
+            list: (product_id, matched_product_id, score) tuples, the best match of each product.
+        """
+        normalized = {product_id: normalize_name(name) for product_id, name in candidates}
+        index: Dict[str, List[int]] = defaultdict(list)
+        for product_id, name in normalized.items():
+            for token in name.tokens:
+                index[token].append(product_id)
+
+        total = max(len(normalized), 1)
+        idf = {token: math.log(1 + total / len(postings)) for token, postings in index.items()}
+        # Small catalogs keep all words: the share limit only matters once postings get long.
+        max_postings = max(100, int(total * MATCH_MAX_TOKEN_SHARE))
+
+        matches = []
+        for product_id, name in products:
+            product_name = normalize_name(name)
+            # Rare words only select the candidates; the score is calculated over all shared words.
+            candidate_ids = set()
+            for token in product_name.tokens:
+                postings = index.get(token)
+                if postings and len(postings) <= max_postings:
+                    candidate_ids.update(postings)
+            if not candidate_ids:
+                continue
+
+            own_weight = sum(idf.get(token, math.log(1 + total)) for token in product_name.tokens)
+            best = None
+            for candidate_id in candidate_ids:
+                candidate_name = normalized[candidate_id]
+                if not attributes_compatible(product_name, candidate_name):
+                    continue
+                shared = sum(idf[token] for token in product_name.tokens & candidate_name.tokens)
+                candidate_weight = sum(idf[token] for token in candidate_name.tokens)
+                union = own_weight + candidate_weight - shared
+                score = shared / union if union else 0.0
+                if product_name.brand and product_name.brand == candidate_name.brand:
+                    score = min(1.0, score + 0.1)
+                if best is None or score > best[1]:
+                    best = (candidate_id, score)
+            if best is not None and best[1] >= min_score:
+                matches.append((product_id, best[0], round(best[1], 4)))
+        return matches
+
+    @staticmethod
+    def _store_products(store_name: str):
+        return select(Product.id).join(Store, Store.id == Product.store_id).where(Store.name == store_name)
+
+    async def run(self, store_name: str, other_store_name: str) -> int:
+        """
+        Match the products of two stores and replace their stored matches.
+
+        Args:
+            store_name (str): The name of the first store.
+            other_store_name (str): The name of the second store.
+
+        Returns:
+            int: The number of stored matches.
+        """
+        products = await self.fetch_products(store_name)
+        candidates = await self.fetch_products(other_store_name)
+        matches = self.match(products, candidates)
+
+        matched_at = datetime.now(timezone.utc)
+        async with async_session() as session:
+            await session.execute(
+                delete(ProductMatch).where(
+                    ProductMatch.product_id.in_(self._store_products(store_name)),
+                    ProductMatch.matched_product_id.in_(self._store_products(other_store_name)),
+                )
+            )
+            if matches:
+                await session.execute(insert(ProductMatch), [
+                    {'product_id': product_id, 'matched_product_id': matched_id, 'score': score,
+                     'matched_at': matched_at}
+                    for product_id, matched_id, score in matches
+                ])
+            await session.commit()
+        logger.info(f"Matched {len(matches)} products of {store_name} with {other_store_name}")
+        return len(matches)
@@ -43,3 +43,55 @@ class ResultPrinter:
                 print(f'Выгоднее покупать в {cheaper_store} на {difference} руб')
             logger.info(f'Printed comparison for category: {category}')
             print("---")
+
+    def print_statistics(self, category_statistics):
+        """
+        Prints a comparison of the price statistics.
+
+        For each category, this method prints the statistics of every store and identifies the store
+        with the lowest median price, which is not affected by a few very cheap or very expensive products.
+
+        Args:
+            category_statistics (dict): A dictionary of category statistics.
+
+        Returns:
+            None
+        """
+        for category, statistics in category_statistics.items():
+            print(f'Категория: {category}')
+            for store in self.stores:
+                if store in statistics:
+                    store_statistics = statistics[store]
+                    print(
+                        f'"{store}": товаров {store_statistics["count"]}, '
+                        f'средняя {store_statistics["mean"]}, медиана {store_statistics["median"]}, '
+                        f'усечённая средняя {store_statistics["trimmed_mean"]}, '
+                        f'p10-p90 {store_statistics["p10"]}-{store_statistics["p90"]}, '
+                        f'мин {store_statistics["min_price"]}, макс {store_statistics["max_price"]}'
+                    )
+            if all(store in statistics for store in self.stores):
+                medians = {store: statistics[store]['median'] for store in self.stores}
+                difference = round(abs(max(medians.values()) - min(medians.values())), 2)
+                cheaper_store = min(self.stores, key=medians.get)
+                print(f'По медиане выгоднее покупать в {cheaper_store} на {difference} руб')
+            logger.info(f'Printed statistics for category: {category}')
+            print("---")
+
+    def print_matched_products(self, matched_products):
+        """
+        Prints the price comparison of the same goods in different stores.
+
+        Args:
+            matched_products (list): Matched product rows fetched from the PriceFetcher.
+
+        Returns:
+            None
+        """
+        for row in matched_products:
+            cheaper_store = row.store_name if row.price_gap < 0 else row.matched_store_name
+            print(f'Категория: {row.category_name} (сходство {row.score})')
+            print(f'{row.price} - "{row.name}" в "{row.store_name}"')
+            print(f'{row.matched_price} - "{row.matched_name}" в "{row.matched_store_name}"')
+            print(f'Выгоднее покупать в {cheaper_store} на {round(abs(row.price_gap), 2)} руб')
+            print("---")
+        logger.info(f'Printed comparison for {len(matched_products)} matched products')
@@ -2,6 +2,9 @@ from comparator.logger import setup_logger
 
 logger = setup_logger(__name__)
 
+# Price statistics returned by PriceFetcher.fetch_price_statistics, in display order.
+STATISTICS = ('mean', 'median', 'trimmed_mean', 'p10', 'p90', 'min_price', 'max_price')
+
 
 class ResultProcessor:
     """
@@ -35,3 +38,26 @@ class ResultProcessor:
             category_prices[category][store] = average_price
         logger.info("Processed results into category prices")
         return category_prices
+
+    @staticmethod
+    def process_statistics(results):
+        """
+        Process the fetched price statistics into a dictionary.
+
+        Args:
+            results (list): A list of price statistics fetched from the PriceFetcher.
+
+        Returns:
+            dict: A dictionary where each category is a key, and the value is another dictionary where each store
+            is a key and the value is a dictionary of rounded statistics (count, mean, median, trimmed_mean,
+            p10, p90, min_price, max_price).
+        """
+        category_statistics = {}
+        for result in results:
+            statistics = {'count': result.count}
+            for name in STATISTICS:
+                value = getattr(result, name)
+                statistics[name] = round(float(value), 2) if value is not None else None
+            category_statistics.setdefault(result.category_name, {})[result.store_name] = statistics
+        logger.info("Processed results into category statistics")
+        return category_statistics
@@ -28,3 +28,165 @@ SECTIONS = {
         "Перекрёсток": "cat/c/114/moloko"
     }
 }
+
+# Настройки HTTP-клиента, общего для всех парсеров
+HTTP_POOL_LIMIT = int(os.getenv('HTTP_POOL_LIMIT', 100))  # Общий лимит одновременных соединений
+HTTP_LIMIT_PER_HOST = int(os.getenv('HTTP_LIMIT_PER_HOST', 10))  # Лимит соединений на один магазин по умолчанию
+HTTP_HOST_LIMITS = {
+    # Индивидуальные лимиты соединений для отдельных магазинов, например:
+    # "Магнит": 5,
+}
+HTTP_DNS_CACHE_TTL = int(os.getenv('HTTP_DNS_CACHE_TTL', 300))  # Время жизни DNS-кеша, сек
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv('HTTP_KEEPALIVE_TIMEOUT', 30))  # Время удержания keep-alive соединения, сек
+HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', 30))  # Общий таймаут запроса, сек
+HTTP_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'Accept-Language': 'ru-RU,ru;q=0.9',
+}
+
+# Настройки парсинга HTML
+PARSE_EXECUTOR = os.getenv('PARSE_EXECUTOR', 'process')  # Тип пула парсинга: 'process' или 'thread'
+PARSE_WORKERS = int(os.getenv('PARSE_WORKERS', 0)) or None  # Количество воркеров, по умолчанию - число ядер
+PARSER_BACKEND = os.getenv('PARSER_BACKEND', 'lxml')  # HTML-парсер: 'html.parser', 'lxml' или 'selectolax'
+# Сначала извлекать товары из встроенного JSON (JSON-LD, состояние страницы), селекторы - для недостающих полей
+PARSE_STRUCTURED_DATA = os.getenv('PARSE_STRUCTURED_DATA', '1') == '1'
+
+# Настройки пакетной записи товаров в базу данных
+WRITER_BATCH_SIZE = int(os.getenv('WRITER_BATCH_SIZE', 500))  # Максимальное количество товаров в одном INSERT
+# Максимальное время ожидания неполного пакета, сек
+WRITER_FLUSH_INTERVAL = float(os.getenv('WRITER_FLUSH_INTERVAL', 1.0))
+WRITER_QUEUE_SIZE = int(os.getenv('WRITER_QUEUE_SIZE', 5000))  # Размер очереди товаров на запись
+
+# Настройки обхода разделов
+CRAWL_MAX_PAGES_PER_CATEGORY = int(os.getenv('CRAWL_MAX_PAGES_PER_CATEGORY', 50))  # Максимум страниц раздела
+CRAWL_MAX_PRODUCTS_PER_CATEGORY = int(os.getenv('CRAWL_MAX_PRODUCTS_PER_CATEGORY', 2000))  # Максимум товаров раздела
+# Максимум ссылок на товары, ожидающих обработки во всём обходе
+CRAWL_MAX_FRONTIER = int(os.getenv('CRAWL_MAX_FRONTIER', 100))
+CRAWL_WORKERS = int(os.getenv('CRAWL_WORKERS', 20))  # Количество одновременно выполняемых запросов во всём обходе
+CRAWL_SHARDS = int(os.getenv('CRAWL_SHARDS', 1))  # Количество процессов обхода, 1 - обход в одном процессе
+# Количество страниц раздела в одной единице работы процесса, 0 - раздел целиком
+CRAWL_SHARD_PAGES = int(os.getenv('CRAWL_SHARD_PAGES', 0))
+
+# Фронтир ссылок на товары: товар, найденный в нескольких разделах, загружается один раз за обход
+# Не загружать повторно товары, найденные в других разделах
+FRONTIER_ENABLED = os.getenv('FRONTIER_ENABLED', '1') == '1'
+# Файл множества всех найденных ссылок (SQLite), рядом хранится фильтр Блума
+FRONTIER_PATH = os.getenv('FRONTIER_PATH', '.frontier/urls.sqlite')
+FRONTIER_RUN_CAPACITY = int(os.getenv('FRONTIER_RUN_CAPACITY', 1_000_000))  # Ожидаемое количество ссылок за один обход
+FRONTIER_CAPACITY = int(os.getenv('FRONTIER_CAPACITY', 10_000_000))  # Ожидаемое количество ссылок за всё время
+FRONTIER_ERROR_RATE = float(os.getenv('FRONTIER_ERROR_RATE', 0.01))  # Доля ложных срабатываний фильтров Блума
+# Количество ссылок, после которого они записываются на диск
+FRONTIER_BATCH_SIZE = int(os.getenv('FRONTIER_BATCH_SIZE', 1000))
+
+# Журнал обхода для продолжения прерванного обхода (python main.py --resume)
+# Записывать состояние страниц разделов и товаров в журнал обхода
+CRAWL_JOURNAL = os.getenv('CRAWL_JOURNAL', '1') == '1'
+# Количество изменений, после которого журнал записывается в базу
+JOURNAL_BATCH_SIZE = int(os.getenv('JOURNAL_BATCH_SIZE', 500))
+# Максимальное время ожидания записи изменения журнала, сек
+JOURNAL_FLUSH_INTERVAL = float(os.getenv('JOURNAL_FLUSH_INTERVAL', 2.0))
+
+# Приоритеты разделов: чем меньше число, тем раньше обходится раздел
+SECTION_PRIORITIES = {
+    # 'Молоко': 10,
+}
+DEFAULT_SECTION_PRIORITY = 100
+
+# Настройки дискового кеша HTTP-ответов
+HTTP_CACHE_ENABLED = os.getenv('HTTP_CACHE_ENABLED', '1') == '1'  # Включить кеш ответов
+HTTP_CACHE_DIR = os.getenv('HTTP_CACHE_DIR', '.cache/http')  # Каталог кеша
+# Максимальный размер кеша, байт; соблюдается каждым процессом обхода отдельно
+HTTP_CACHE_MAX_BYTES = int(os.getenv('HTTP_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+# Время свежести ответа без заголовков кеширования, сек
+HTTP_CACHE_DEFAULT_TTL = float(os.getenv('HTTP_CACHE_DEFAULT_TTL', 0))
+
+# Архив загруженных страниц для повторного разбора без обращения к магазинам
+ARCHIVE_ENABLED = os.getenv('ARCHIVE_ENABLED', '0') == '1'  # Сохранять все загруженные страницы в архив
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', '.archive')  # Каталог архива, внутри - по каталогу на дату обхода
+# Размер сегмента архива, после которого начинается новый, байт
+ARCHIVE_SEGMENT_BYTES = int(os.getenv('ARCHIVE_SEGMENT_BYTES', 256 * 1024 * 1024))
+ARCHIVE_COMPRESSION_LEVEL = int(os.getenv('ARCHIVE_COMPRESSION_LEVEL', 6))  # Уровень сжатия zlib страниц в архиве
+# Количество процессов повторного разбора, по умолчанию - число ядер
+REPLAY_WORKERS = int(os.getenv('REPLAY_WORKERS', 0)) or None
+# Количество страниц в одном задании процесса повторного разбора
+REPLAY_CHUNK_SIZE = int(os.getenv('REPLAY_CHUNK_SIZE', 500))
+
+# Адаптивный повторный обход (python -m parsers.recrawl): товары, цены которых меняются чаще, проверяются чаще
+# Файл состояния планировщика повторного обхода
+RECRAWL_STATE_PATH = os.getenv('RECRAWL_STATE_PATH', '.recrawl/state.json')
+RECRAWL_INTERVAL = float(os.getenv('RECRAWL_INTERVAL', 300))  # Длительность одного раунда повторного обхода, сек
+RECRAWL_BUDGET_PER_HOUR = int(os.getenv('RECRAWL_BUDGET_PER_HOUR', 1000))  # Количество запросов к одному магазину в час
+RECRAWL_STORE_BUDGETS = {
+    # Индивидуальные бюджеты запросов в час для отдельных магазинов, например:
+    # "Перекрёсток": 500,
+}
+# Интервал обхода разделов для поиска новых товаров, сек
+RECRAWL_SECTION_INTERVAL = float(os.getenv('RECRAWL_SECTION_INTERVAL', 6 * 3600))
+# Предполагаемая частота изменения цены товара без наблюдений, раз в сек
+RECRAWL_DEFAULT_RATE = float(os.getenv('RECRAWL_DEFAULT_RATE', 1 / 86400))
+# Минимальная оценка частоты изменения, чтобы каждый товар иногда проверялся, раз в сек
+RECRAWL_MIN_RATE = float(os.getenv('RECRAWL_MIN_RATE', 1 / (7 * 86400)))
+RECRAWL_PRIOR_CHECKS = float(os.getenv('RECRAWL_PRIOR_CHECKS', 2))  # Вес оценки категории в оценке товара, в проверках
+# Количество последних проверок, по которым оценивается частота изменения
+RECRAWL_HISTORY_CHECKS = int(os.getenv('RECRAWL_HISTORY_CHECKS', 20))
+# Количество неудачных проверок подряд, после которого товар исключается
+RECRAWL_MAX_FAILURES = int(os.getenv('RECRAWL_MAX_FAILURES', 3))
+
+# Инкрементальный обход: пропускать неизменившиеся товары
+CRAWL_INCREMENTAL = os.getenv('CRAWL_INCREMENTAL', '1') == '1'
+
+# Настройки истории цен
+# Количество месячных партиций, создаваемых заранее
+PRICE_HISTORY_PARTITIONS_AHEAD = int(os.getenv('PRICE_HISTORY_PARTITIONS_AHEAD', 3))
+PRICE_HISTORY_RAW_DAYS = int(os.getenv('PRICE_HISTORY_RAW_DAYS', 90))  # Сколько дней хранить все наблюдения цен
+# Интервал прореживания старых наблюдений: 'day', 'week' или 'month'
+PRICE_HISTORY_COMPACT_BUCKET = os.getenv('PRICE_HISTORY_COMPACT_BUCKET', 'week')
+# Сколько месяцев хранить историю, 0 - без ограничения
+PRICE_HISTORY_RETENTION_MONTHS = int(os.getenv('PRICE_HISTORY_RETENTION_MONTHS', 0))
+
+# Доля самых дешёвых и самых дорогих товаров, не учитываемых в усечённом среднем
+COMPARE_TRIM_FRACTION = float(os.getenv('COMPARE_TRIM_FRACTION', 0.1))
+
+# Настройки выгрузки товаров в Parquet для анализа без обращения к базе
+EXPORT_DIR = os.getenv('EXPORT_DIR', '.export')  # Каталог выгрузки, внутри - каталоги store=<магазин>/crawl_date=<дата>
+# Количество строк, читаемых из базы за раз и записываемых в одну группу строк Parquet
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', 50000))
+# Сжатие файлов Parquet: 'zstd', 'snappy', 'gzip' или 'none'
+EXPORT_COMPRESSION = os.getenv('EXPORT_COMPRESSION', 'zstd')
+
+# Настройки сопоставления одинаковых товаров разных магазинов
+MATCH_MIN_SCORE = float(os.getenv('MATCH_MIN_SCORE', 0.5))  # Минимальная оценка сходства для сохранения пары
+# Слова, встречающиеся у большей доли товаров, не используются для поиска кандидатов
+MATCH_MAX_TOKEN_SHARE = float(os.getenv('MATCH_MAX_TOKEN_SHARE', 0.05))
+# Допустимое относительное расхождение объёма и веса
+MATCH_SIZE_TOLERANCE = float(os.getenv('MATCH_SIZE_TOLERANCE', 0.05))
+
+# Настройки адаптивного ограничения запросов к магазинам
+RATE_LIMIT_RPS = float(os.getenv('RATE_LIMIT_RPS', 5))  # Максимальное количество запросов в секунду к одному магазину
+RATE_LIMIT_MIN_RPS = float(os.getenv('RATE_LIMIT_MIN_RPS', 0.2))  # Минимальная частота запросов при замедлении
+HTTP_HOST_RATE_LIMITS = {
+    # Индивидуальные ограничения частоты запросов для отдельных магазинов, например:
+    # "Перекрёсток": 2,
+}
+# Начальное количество одновременных запросов к магазину
+ADAPTIVE_INITIAL_CONCURRENCY = int(os.getenv('ADAPTIVE_INITIAL_CONCURRENCY', 2))
+# Минимальное количество одновременных запросов к магазину
+ADAPTIVE_MIN_CONCURRENCY = int(os.getenv('ADAPTIVE_MIN_CONCURRENCY', 1))
+# Во сколько раз снижать лимиты при перегрузке
+ADAPTIVE_DECREASE_FACTOR = float(os.getenv('ADAPTIVE_DECREASE_FACTOR', 0.5))
+# Рост задержки относительно минимальной, считающийся перегрузкой
+ADAPTIVE_LATENCY_FACTOR = float(os.getenv('ADAPTIVE_LATENCY_FACTOR', 3.0))
+# По скольким последним ответам определяется минимальная задержка
+ADAPTIVE_LATENCY_WINDOW = int(os.getenv('ADAPTIVE_LATENCY_WINDOW', 50))
+HTTP_MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', 4))  # Количество повторов неудачного запроса
+HTTP_BACKOFF_BASE = float(os.getenv('HTTP_BACKOFF_BASE', 0.5))  # Базовая задержка перед повтором, сек
+HTTP_BACKOFF_MAX = float(os.getenv('HTTP_BACKOFF_MAX', 60))  # Максимальная задержка перед повтором, сек
+
+# Метрики обхода
+# Порт HTTP-эндпоинта /metrics (Prometheus) и /metrics.json, 0 - не запускать
+METRICS_PORT = int(os.getenv('METRICS_PORT', 0))
+METRICS_DUMP_PATH = os.getenv('METRICS_DUMP_PATH', '')  # Файл для сохранения метрик в JSON по окончании обхода
+# Интервал замера задержки цикла событий, сек
+METRICS_LOOP_LAG_INTERVAL = float(os.getenv('METRICS_LOOP_LAG_INTERVAL', 0.5))
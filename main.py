@@ -1,15 +1,33 @@
+import argparse
 import asyncio
+import sys
+from config import CRAWL_SHARDS
 from parsers.parser_manager import ParserManager
+from parsers.sharding import ShardCoordinator
 from models.database import init_db, clear_db
+from models.crawl_journal import ResumeError
+from models.price_history import apply_price_history_retention
 
 
 # This is the main function of the program. It initializes the database and runs the parser manager.
-async def main():
+async def main(resume=None):
     # await clear_db()  # This line is commented out. If uncommented, it would clear the database before initialization.
     await init_db()  # This line initializes the database.
-    parser_manager = ParserManager()  # This line creates an instance of the ParserManager class.
+    # This line creates an instance of the ParserManager class, or of the ShardCoordinator if the crawl is sharded.
+    # An interrupted run is resumed in a single process, from the journal of the run. Sharded runs have no journal
+    # of their pages and are refused.
+    parser_manager = ShardCoordinator() if CRAWL_SHARDS > 1 and resume is None else ParserManager(resume=resume)
     await parser_manager.run()  # This line runs the parser manager.
+    await apply_price_history_retention()  # This line downsamples and drops old price history.
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description='Сбор данных о товарах')
+    parser.add_argument('--resume', type=int, nargs='?', const=0, metavar='RUN_ID',
+                        help='Продолжить прерванный обход, по умолчанию - последний незавершённый')
+    args = parser.parse_args()
+    try:
+        asyncio.run(main(args.resume))
+    except ResumeError as e:  # There is no run to resume, or it cannot be resumed.
+        print(e)
+        sys.exit(1)
@@ -0,0 +1,257 @@
+import asyncio
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, delete, select, update
+
+from config import JOURNAL_BATCH_SIZE, JOURNAL_FLUSH_INTERVAL
+from .database import Base, async_session, upsert
+
+# Statuses of a run.
+RUN_RUNNING = 'running'
+RUN_FINISHED = 'finished'
+RUN_FAILED = 'failed'
+# A run crawled by several worker processes. Their jobs are not journaled, so it can not be resumed.
+RUN_SHARDED = 'sharded'
+
+# Statuses of a job of a run.
+JOB_PENDING = 'pending'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+
+class ResumeError(Exception):
+    """Raised when the requested crawl run cannot be resumed."""
+    pass
+
+
+class CrawlRun(Base):
+    """
+    A crawl run. A run that is not finished can be resumed.
+    """
+    __tablename__ = "crawl_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    started_at = Column(DateTime(timezone=True))
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    status = Column(String(10))
+
+
+class CrawlJournalEntry(Base):
+    """
+    The status of a section page or product page of a crawl run.
+    """
+    __tablename__ = "crawl_journal"
+
+    run_id = Column(Integer, ForeignKey("crawl_runs.id", ondelete="CASCADE"), primary_key=True)
+    url = Column(String, primary_key=True)
+    kind = Column(String(10))
+    store = Column(String)
+    category = Column(String)
+    page = Column(Integer, nullable=True)
+    status = Column(String(10))
+    updated_at = Column(DateTime(timezone=True))
+
+
+@dataclass
+class JournalEntry:
+    """
+    A job recorded in the journal of a resumed run.
+
+    Attributes:
+        kind (str): SECTION_JOB or PRODUCT_JOB.
+        url (str): The URL of the page.
+        store (str): The name of the store.
+        category (str): The name of the category.
+        page (int): The page number of a section page.
+        status (str): JOB_PENDING, JOB_DONE or JOB_FAILED.
+    """
+    kind: str
+    url: str
+    store: str
+    category: str
+    page: Optional[int]
+    status: str
+
+
+class CrawlJournal:
+    """
+    The journal of a crawl run: the submitted section and product pages and their statuses.
+
+    Statuses are kept in memory and written in batches with a multi-row upsert once JOURNAL_BATCH_SIZE jobs
+    have changed or JOURNAL_FLUSH_INTERVAL has passed, so a killed run loses at most the last batch, whose jobs
+    are simply repeated on resume. Jobs are written in the order they were recorded, so the next page of a section
+    is always written as pending before the page that submitted it is written as done.
+
+    A run that ends with failed jobs stays resumable, so they can be retried with --resume. The jobs of a finished
+    run are deleted, only the run itself is kept.
+
+    A sharded run only records the run itself, with the status RUN_SHARDED until it finishes, so --resume refuses
+    to continue it instead of silently resuming an older run.
+
+    Attributes:
+        run_id (int): The ID of the run. None until start() is called.
+        resume (int): The ID of the run to resume, 0 for the latest unfinished run. None to start a new run.
+        entries (List[JournalEntry]): The jobs recorded by the resumed run. Empty for a new run.
+        before_flush (Callable[[], Awaitable[None]]): Awaited before each batch is written, e.g. to make sure
+            the products of the jobs marked as done are saved first.
+        batch_size (int): The number of changed jobs that triggers a write.
+        flush_interval (float): The maximum time in seconds a changed job waits to be written.
+        failed (Set[str]): The URLs of the jobs that failed in this run and have not been retried.
+        sharded (bool): The run is crawled by several worker processes and its jobs are not recorded.
+    """
+
+    def __init__(self, resume: Optional[int] = None, before_flush: Optional[Callable[[], Awaitable[None]]] = None,
+                 batch_size: int = JOURNAL_BATCH_SIZE, flush_interval: float = JOURNAL_FLUSH_INTERVAL,
+                 sharded: bool = False):
+        self.run_id: Optional[int] = None
+        self.resume = resume
+        self.sharded = sharded
+        self.entries: List[JournalEntry] = []
+        self.before_flush = before_flush
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.failed: Set[str] = set()
+        self._pending: Dict[str, dict] = {}
+        self._full = asyncio.Event()
+        self._stopped = False
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """
+        Create the run, or load the jobs of the run to resume, and start the background flush task.
+
+        Raises:
+            ResumeError: If there is no run to resume or the run to resume was sharded.
+        """
+        now = datetime.now(timezone.utc)
+        async with async_session() as session:
+            if self.resume is None:
+                run = CrawlRun(started_at=now, status=RUN_SHARDED if self.sharded else RUN_RUNNING)
+                session.add(run)
+                await session.flush()
+                self.run_id = run.id
+            else:
+                query = select(CrawlRun.id, CrawlRun.status).where(CrawlRun.status != RUN_FINISHED)
+                if self.resume:
+                    query = query.where(CrawlRun.id == self.resume)
+                run = (await session.execute(query.order_by(CrawlRun.id.desc()).limit(1))).first()
+                if run is None:
+                    raise ResumeError('Нет незавершённого обхода для продолжения')
+                if run.status == RUN_SHARDED:
+                    raise ResumeError(f'Обход {run.id} выполнялся в нескольких процессах без журнала '
+                                     f'и не может быть продолжен, запустите новый обход')
+                self.run_id = run.id
+                await session.execute(update(CrawlRun).where(CrawlRun.id == self.run_id).values(status=RUN_RUNNING))
+                result = await session.stream(
+                    select(CrawlJournalEntry.kind, CrawlJournalEntry.url, CrawlJournalEntry.store,
+                           CrawlJournalEntry.category, CrawlJournalEntry.page, CrawlJournalEntry.status)
+                    .where(CrawlJournalEntry.run_id == self.run_id)
+                )
+                async for row in result:
+                    self.entries.append(JournalEntry(*row))
+            await session.commit()
+        self._task = asyncio.create_task(self._run())
+
+    def record(self, kind: str, url: str, store: str, category: str, status: str, page: Optional[int] = None):
+        """
+        Record the status of a job. The record is written with the next batch.
+
+        Args:
+            kind (str): SECTION_JOB or PRODUCT_JOB.
+            url (str): The URL of the page.
+            store (str): The name of the store.
+            category (str): The name of the category.
+            status (str): JOB_PENDING, JOB_DONE or JOB_FAILED.
+            page (int, optional): The page number of a section page.
+        """
+        if status == JOB_FAILED:
+            self.failed.add(url)
+        else:
+            self.failed.discard(url)
+        # The job moves to the end, so the batch keeps the order of the last changes.
+        self._pending.pop(url, None)
+        self._pending[url] = {
+            'run_id': self.run_id, 'url': url, 'kind': kind, 'store': store, 'category': category,
+            'page': page, 'status': status, 'updated_at': datetime.now(timezone.utc),
+        }
+        if len(self._pending) >= self.batch_size:
+            self._full.set()
+
+    async def _run(self):
+        while not self._stopped:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f'Ошибка при записи журнала обхода: {e}')
+
+    async def flush(self):
+        """
+        Write the recorded changes. If writing fails, the changes are kept for the next batch.
+        """
+        self._full.clear()
+        if not self._pending:
+            return
+        rows = list(self._pending.values())
+        self._pending = {}
+        try:
+            if self.before_flush is not None:
+                await self.before_flush()
+            async with async_session() as session:
+                for start in range(0, len(rows), self.batch_size):
+                    stmt = upsert(CrawlJournalEntry).values(rows[start:start + self.batch_size])
+                    stmt = stmt.on_conflict_do_update(
+                        index_elements=['run_id', 'url'],
+                        set_={
+                            'status': stmt.excluded.status,
+                            'page': stmt.excluded.page,
+                            'updated_at': stmt.excluded.updated_at,
+                        },
+                    )
+                    await session.execute(stmt)
+                await session.commit()
+        except BaseException:
+            for row in rows:
+                self._pending.setdefault(row['url'], row)
+            raise
+
+    async def close(self, status: str = RUN_FINISHED):
+        """
+        Write the remaining changes and set the status of the run.
+
+        Args:
+            status (str): RUN_FINISHED, or RUN_FAILED if the run was interrupted and should be resumed.
+                An unfinished sharded run keeps RUN_SHARDED.
+        """
+        if self.sharded and status != RUN_FINISHED:
+            status = RUN_SHARDED
+        if self._task is not None:
+            self._stopped = True
+            self._full.set()
+            await self._task
+            self._task = None
+        await self.flush()
+        async with async_session() as session:
+            await session.execute(
+                update(CrawlRun).where(CrawlRun.id == self.run_id).values(
+                    status=status, finished_at=datetime.now(timezone.utc) if status == RUN_FINISHED else None
+                )
+            )
+            if status == RUN_FINISHED:
+                await session.execute(delete(CrawlJournalEntry).where(CrawlJournalEntry.run_id == self.run_id))
+            await session.commit()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close(RUN_FINISHED if exc_type is None and not self.failed else RUN_FAILED)
+        if self.failed:
+            print(f'Не удалось обработать страниц: {len(self.failed)}, '
+                  f'повторить: python main.py --resume {self.run_id}')
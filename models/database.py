@@ -24,9 +24,14 @@ async def init_db():
     # Begin a new transaction.
     async with engine.begin() as conn:
         # Import the models.
-        from .product import Store, Category, Product
+        from .product import Store, Category, Product, ProductCategory, ProductMatch
+        from .price_history import PriceObservation, ensure_price_partitions
+        from .price_aggregates import PriceAggregate
+        from .crawl_journal import CrawlRun, CrawlJournalEntry
         # Create all tables in the database.
         await conn.run_sync(Base.metadata.create_all)
+        # Create the monthly partitions of the price history (PostgreSQL only).
+        await ensure_price_partitions(conn)
 
 
 # Asynchronous function to clear the database.
@@ -36,3 +41,13 @@ async def clear_db():
     async with engine.begin() as conn:
         # Drop all tables in the database.
         await conn.run_sync(Base.metadata.drop_all)
+
+
+# Function to build an INSERT statement that supports ON CONFLICT clauses.
+# PostgreSQL is the main database, SQLite is used for local runs and benchmarks.
+def upsert(model):
+    if engine.dialect.name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        from sqlalchemy.dialects.postgresql import insert
+    return insert(model)
@@ -0,0 +1,93 @@
+from typing import Dict, Iterable
+
+from sqlalchemy import select
+
+from .database import async_session, upsert
+from .product import Store, Category
+
+
+class DimensionCache:
+    """
+    An in-memory cache of Store and Category IDs.
+
+    All stores and categories are loaded once at startup, the missing ones are created with a single
+    INSERT ... ON CONFLICT DO NOTHING RETURNING statement, and every later lookup is served from memory.
+    """
+
+    def __init__(self):
+        self._ids: Dict[type, Dict[str, int]] = {Store: {}, Category: {}}
+
+    async def load(self, store_names: Iterable[str], category_names: Iterable[str]):
+        """
+        Load all stores and categories and create the missing ones.
+
+        Args:
+            store_names (Iterable[str]): The names of the stores that must exist.
+            category_names (Iterable[str]): The names of the categories that must exist.
+        """
+        async with async_session() as session:
+            for model, names in ((Store, store_names), (Category, category_names)):
+                self._ids[model] = await self._load_model(session, model, set(names))
+            await session.commit()
+
+    @staticmethod
+    async def _load_model(session, model, names) -> Dict[str, int]:
+        """
+        Load all rows of the model and create the missing names.
+
+        Args:
+            session: The session to use for database operations.
+            model: Store or Category.
+            names: The names that must exist.
+
+        Returns:
+            Dict[str, int]: The IDs of all rows of the model, keyed by name.
+        """
+        result = await session.execute(select(model.id, model.name))
+        ids = {name: id_ for id_, name in result}
+        missing = names - ids.keys()
+        if missing:
+            stmt = (
+                upsert(model)
+                .values([{'name': name} for name in sorted(missing)])
+                .on_conflict_do_nothing(index_elements=['name'])
+                .returning(model.id, model.name)
+            )
+            result = await session.execute(stmt)
+            ids.update({name: id_ for id_, name in result})
+            # Rows inserted concurrently by another process are skipped by DO NOTHING and have to be read back.
+            missing -= ids.keys()
+            if missing:
+                result = await session.execute(select(model.id, model.name).where(model.name.in_(missing)))
+                ids.update({name: id_ for id_, name in result})
+        return ids
+
+    def store_id(self, name: str) -> int:
+        """
+        Get the ID of a store.
+
+        Args:
+            name (str): The name of the store.
+
+        Returns:
+            int: The ID of the store.
+
+        Raises:
+            KeyError: If the store was not loaded.
+        """
+        return self._ids[Store][name]
+
+    def category_id(self, name: str) -> int:
+        """
+        Get the ID of a category.
+
+        Args:
+            name (str): The name of the category.
+
+        Returns:
+            int: The ID of the category.
+
+        Raises:
+            KeyError: If the category was not loaded.
+        """
+        return self._ids[Category][name]
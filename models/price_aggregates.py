@@ -0,0 +1,209 @@
+from collections import defaultdict
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from sqlalchemy import Column, Integer, Float, ForeignKey, case, delete, func, select, text
+
+from .database import Base, async_session, engine, upsert
+from .product import Product, ProductCategory, product_category_links
+
+# The first key of the PostgreSQL advisory locks that serialize the product writes of a store.
+_STORE_LOCK_NAMESPACE = 0x70726963
+
+
+class PriceAggregate(Base):
+    """
+    Running price statistics of one (store, category) pair.
+
+    A product counts in its own category and in every further category it is linked to in product_categories.
+    The count, sum and sum of squares are maintained exactly by the product write path. The minimum and maximum
+    only ever widen: when the cheapest or the most expensive product changes its price, they keep the old bound
+    until rebuild_price_aggregates() recalculates them.
+    """
+    __tablename__ = "price_aggregates"
+
+    store_id = Column(Integer, ForeignKey("stores.id"), primary_key=True)
+    category_id = Column(Integer, ForeignKey("categories.id"), primary_key=True)
+    price_count = Column(Integer, nullable=False, default=0)
+    price_sum = Column(Float, nullable=False, default=0.0)
+    price_sum_sq = Column(Float, nullable=False, default=0.0)
+    price_min = Column(Float, nullable=True)
+    price_max = Column(Float, nullable=True)
+
+
+class AggregateDeltas:
+    """
+    Collects the changes of the price aggregates caused by a batch of product writes.
+    """
+
+    def __init__(self):
+        self._deltas: Dict[Tuple[int, int], Dict[str, Optional[float]]] = defaultdict(
+            lambda: {'price_count': 0, 'price_sum': 0.0, 'price_sum_sq': 0.0, 'price_min': None, 'price_max': None}
+        )
+
+    def add(self, store_id: int, category_id: int, price: Optional[float]):
+        """
+        Account for a price that enters the (store, category) group.
+        """
+        if price is None:
+            return
+        delta = self._deltas[(store_id, category_id)]
+        delta['price_count'] += 1
+        delta['price_sum'] += price
+        delta['price_sum_sq'] += price * price
+        delta['price_min'] = price if delta['price_min'] is None else min(delta['price_min'], price)
+        delta['price_max'] = price if delta['price_max'] is None else max(delta['price_max'], price)
+
+    def remove(self, store_id: int, category_id: int, price: Optional[float]):
+        """
+        Account for a price that leaves the (store, category) group.
+        """
+        if price is None:
+            return
+        delta = self._deltas[(store_id, category_id)]
+        delta['price_count'] -= 1
+        delta['price_sum'] -= price
+        delta['price_sum_sq'] -= price * price
+
+    def rows(self):
+        return [
+            {'store_id': store_id, 'category_id': category_id, **delta}
+            for (store_id, category_id), delta in self._deltas.items()
+        ]
+
+
+async def apply_aggregate_deltas(session, deltas: AggregateDeltas):
+    """
+    Add the collected deltas to the price aggregates with one multi-row upsert.
+
+    Args:
+        session: The session of the product write transaction.
+        deltas (AggregateDeltas): The changes to apply.
+    """
+    rows = deltas.rows()
+    if not rows:
+        return
+    table = PriceAggregate.__table__
+    stmt = upsert(PriceAggregate).values(rows)
+    excluded = stmt.excluded
+    new_count = table.c.price_count + excluded.price_count
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['store_id', 'category_id'],
+        set_={
+            'price_count': new_count,
+            'price_sum': table.c.price_sum + excluded.price_sum,
+            'price_sum_sq': table.c.price_sum_sq + excluded.price_sum_sq,
+            'price_min': case(
+                (new_count <= 0, None),
+                (table.c.price_min.is_(None), excluded.price_min),
+                (excluded.price_min < table.c.price_min, excluded.price_min),
+                else_=table.c.price_min,
+            ),
+            'price_max': case(
+                (new_count <= 0, None),
+                (table.c.price_max.is_(None), excluded.price_max),
+                (excluded.price_max > table.c.price_max, excluded.price_max),
+                else_=table.c.price_max,
+            ),
+        },
+    )
+    await session.execute(stmt)
+
+
+async def lock_stores(session, store_ids: Iterable[int]):
+    """
+    Serialize the product writes of the stores until the end of the transaction.
+
+    The deltas of the aggregates are calculated from the rows loaded by load_current_prices(). A product inserted
+    by a concurrent transaction, e.g. of another crawl process, after that load would turn the upsert into an update
+    whose old price is never removed. The lock keeps other writers of the same stores out until the commit.
+    The locks are taken in the order of the store IDs, so writers of several stores cannot deadlock. SQLite
+    serializes all writes anyway, so nothing is done there.
+
+    Args:
+        session: The session of the product write transaction.
+        store_ids (Iterable[int]): The IDs of the stores of the batch.
+    """
+    if engine.dialect.name != 'postgresql':
+        return
+    for store_id in sorted(set(store_ids)):
+        await session.execute(
+            text("SELECT pg_advisory_xact_lock(:namespace, :store_id)"),
+            {"namespace": _STORE_LOCK_NAMESPACE, "store_id": store_id},
+        )
+
+
+async def load_current_prices(session, store_id: int, urls: Iterable[str]) -> Dict[str, Tuple[int, Optional[float]]]:
+    """
+    Load the stored category and price of the products that are about to be overwritten.
+    Call lock_stores() first, so no other transaction inserts one of the products in the meantime.
+
+    Args:
+        session: The session of the product write transaction.
+        store_id (int): The ID of the store.
+        urls (Iterable[str]): The normalized URLs of the products.
+
+    Returns:
+        Dict[str, Tuple[int, Optional[float]]]: (category_id, price_new) keyed by URL.
+    """
+    stmt = (
+        select(Product.url, Product.category_id, Product.price_new)
+        .where(Product.store_id == store_id, Product.url.in_(list(urls)))
+        .with_for_update()
+    )
+    result = await session.execute(stmt)
+    return {url: (category_id, price_new) for url, category_id, price_new in result}
+
+
+async def load_further_categories(session, store_id: int, urls: Iterable[str]) -> Dict[str, Set[int]]:
+    """
+    Load the further categories of the products that are about to be written, which their price counts in as well.
+    Call lock_stores() first, so no other transaction links one of the products in the meantime.
+
+    Args:
+        session: The session of the product write transaction.
+        store_id (int): The ID of the store.
+        urls (Iterable[str]): The normalized URLs of the products.
+
+    Returns:
+        Dict[str, Set[int]]: The IDs of the further categories keyed by URL. Products without any are left out.
+    """
+    stmt = (
+        select(ProductCategory.url, ProductCategory.category_id)
+        .where(ProductCategory.store_id == store_id, ProductCategory.url.in_(list(urls)))
+    )
+    categories: Dict[str, Set[int]] = {}
+    for url, category_id in await session.execute(stmt):
+        categories.setdefault(url, set()).add(category_id)
+    return categories
+
+
+async def rebuild_price_aggregates():
+    """
+    Recalculate all price aggregates from the products table and the further categories of the products.
+
+    Used to fill the aggregates of an existing database and to tighten the minimum and maximum.
+    """
+    links = product_category_links()
+    async with async_session() as session:
+        await session.execute(delete(PriceAggregate))
+        stmt = (
+            select(
+                Product.store_id,
+                links.c.category_id,
+                func.count(Product.price_new),
+                func.coalesce(func.sum(Product.price_new), 0.0),
+                func.coalesce(func.sum(Product.price_new * Product.price_new), 0.0),
+                func.min(Product.price_new),
+                func.max(Product.price_new),
+            )
+            .join(links, links.c.product_id == Product.id)
+            .where(Product.price_new.is_not(None))
+            .group_by(Product.store_id, links.c.category_id)
+        )
+        await session.execute(
+            PriceAggregate.__table__.insert().from_select(
+                ['store_id', 'category_id', 'price_count', 'price_sum', 'price_sum_sq', 'price_min', 'price_max'],
+                stmt,
+            )
+        )
+        await session.commit()
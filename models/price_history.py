@@ -0,0 +1,134 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import Column, Integer, Float, DateTime, ForeignKey, Index, text
+
+from config import (
+    PRICE_HISTORY_PARTITIONS_AHEAD,
+    PRICE_HISTORY_RAW_DAYS,
+    PRICE_HISTORY_COMPACT_BUCKET,
+    PRICE_HISTORY_RETENTION_MONTHS,
+)
+from .database import Base, engine
+
+
+class PriceObservation(Base):
+    """
+    A price of a product observed at a given time.
+
+    On PostgreSQL the table is partitioned by month on observed_at. The primary key (product_id, observed_at)
+    serves both "price as of date X" and "price series for product Y" lookups, and the BRIN index on observed_at
+    keeps time-range scans cheap.
+    """
+    __tablename__ = "price_observations"
+    __table_args__ = (
+        Index("ix_price_observations_observed_at", "observed_at", postgresql_using="brin"),
+        {"postgresql_partition_by": "RANGE (observed_at)"},
+    )
+
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    observed_at = Column(DateTime(timezone=True), primary_key=True)
+    price_new = Column(Float, nullable=True)
+    price_old = Column(Float, nullable=True)
+
+
+def _month_start(moment: datetime, shift: int = 0) -> datetime:
+    month_index = moment.year * 12 + moment.month - 1 + shift
+    return datetime(month_index // 12, month_index % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def _partition_name(month_start: datetime) -> str:
+    return f"price_observations_y{month_start.year:04d}m{month_start.month:02d}"
+
+
+async def ensure_price_partitions(conn, months_ahead: int = PRICE_HISTORY_PARTITIONS_AHEAD):
+    """
+    Create the monthly partitions of price_observations from the previous month up to months_ahead months ahead,
+    plus a default partition for everything outside that range. Does nothing on databases other than PostgreSQL.
+
+    Observations of a month that had no partition yet, e.g. because the crawler ran past the prepared months
+    without init_db(), are in the default partition, and PostgreSQL refuses to create a partition for them.
+    In that case the default partition is detached, the rows of the month are moved to the new partition and
+    the default partition is attached again, in the transaction of conn.
+
+    Args:
+        conn: An open connection of the engine.
+        months_ahead (int): The number of future months to create partitions for.
+    """
+    if conn.dialect.name != 'postgresql':
+        return
+    now = datetime.now(timezone.utc)
+    has_default = await conn.scalar(text("SELECT to_regclass('price_observations_default') IS NOT NULL"))
+    for shift in range(-1, months_ahead + 1):
+        start = _month_start(now, shift)
+        end = _month_start(now, shift + 1)
+        partition = _partition_name(start)
+        if await conn.scalar(text(f"SELECT to_regclass('{partition}') IS NOT NULL")):
+            continue
+        bounds = {"start": start, "end": end}
+        misplaced = has_default and await conn.scalar(
+            text(
+                "SELECT EXISTS (SELECT 1 FROM price_observations_default "
+                "WHERE observed_at >= :start AND observed_at < :end)"
+            ),
+            bounds,
+        )
+        if misplaced:
+            await conn.execute(text("ALTER TABLE price_observations DETACH PARTITION price_observations_default"))
+        await conn.execute(text(
+            f"CREATE TABLE {partition} PARTITION OF price_observations "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        ))
+        if misplaced:
+            await conn.execute(
+                text(
+                    f"WITH moved AS (DELETE FROM price_observations_default "
+                    f"WHERE observed_at >= :start AND observed_at < :end RETURNING *) "
+                    f"INSERT INTO {partition} SELECT * FROM moved"
+                ),
+                bounds,
+            )
+            await conn.execute(text(
+                "ALTER TABLE price_observations ATTACH PARTITION price_observations_default DEFAULT"
+            ))
+    await conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS price_observations_default PARTITION OF price_observations DEFAULT"
+    ))
+
+
+async def apply_price_history_retention():
+    """
+    Apply the retention policy of the price history on PostgreSQL.
+
+    Observations older than PRICE_HISTORY_RAW_DAYS are downsampled to the last observation of each product
+    in every PRICE_HISTORY_COMPACT_BUCKET ('day', 'week' or 'month'). Monthly partitions that ended more than
+    PRICE_HISTORY_RETENTION_MONTHS months ago are dropped; 0 keeps them forever.
+    """
+    if engine.dialect.name != 'postgresql':
+        return
+    now = datetime.now(timezone.utc)
+    async with engine.begin() as conn:
+        await ensure_price_partitions(conn)
+        await conn.execute(
+            text(
+                "DELETE FROM price_observations AS po USING ("
+                "  SELECT product_id, observed_at, row_number() OVER ("
+                "    PARTITION BY product_id, date_trunc(:bucket, observed_at) ORDER BY observed_at DESC"
+                "  ) AS position"
+                "  FROM price_observations WHERE observed_at < :cutoff"
+                ") AS ranked "
+                "WHERE ranked.position > 1 "
+                "AND po.product_id = ranked.product_id AND po.observed_at = ranked.observed_at"
+            ),
+            {"bucket": PRICE_HISTORY_COMPACT_BUCKET, "cutoff": now - timedelta(days=PRICE_HISTORY_RAW_DAYS)},
+        )
+        if PRICE_HISTORY_RETENTION_MONTHS:
+            oldest_kept = _partition_name(_month_start(now, -PRICE_HISTORY_RETENTION_MONTHS))
+            result = await conn.execute(text(
+                "SELECT child.relname FROM pg_inherits "
+                "JOIN pg_class AS parent ON parent.oid = pg_inherits.inhparent "
+                "JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid "
+                "WHERE parent.relname = 'price_observations'"
+            ))
+            for (partition,) in result:
+                if partition != 'price_observations_default' and partition < oldest_kept:
+                    await conn.execute(text(f"DROP TABLE IF EXISTS {partition}"))
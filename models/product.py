@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, UniqueConstraint, and_, select, union
 from sqlalchemy.orm import relationship
 from pydantic import BaseModel
 
@@ -25,6 +25,10 @@ class Category(Base):
 
 class Product(Base):
     __tablename__ = "products"
+    # A product is identified by its store and normalized URL, so recrawls update the row instead of duplicating it.
+    __table_args__ = (
+        UniqueConstraint("store_id", "url", name="uq_products_store_url"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True)
@@ -34,13 +38,57 @@ class Product(Base):
     article = Column(String, index=True, nullable=True)
     rating = Column(Float, nullable=True)
     availability = Column(String, nullable=True)
+    # The price per kilogram or per litre, so that packs of different sizes can be compared.
+    unit_price = Column(Float, nullable=True)
+    unit = Column(String(2), nullable=True)
     store_id = Column(Integer, ForeignKey("stores.id"))
     category_id = Column(Integer, ForeignKey("categories.id"))
+    url = Column(String, nullable=True)
+    fingerprint = Column(String(40), nullable=True)
+    scraped_at = Column(DateTime(timezone=True), nullable=True)
 
     store = relationship("Store", back_populates="products")
     category = relationship("Category", back_populates="products")
 
 
+class ProductCategory(Base):
+    """
+    A further category a product is listed in, besides its own category_id. The product is referenced by its
+    natural key, so the link can be saved before the product itself.
+    """
+    __tablename__ = "product_categories"
+
+    store_id = Column(Integer, ForeignKey("stores.id"), primary_key=True)
+    url = Column(String, primary_key=True)
+    category_id = Column(Integer, ForeignKey("categories.id"), primary_key=True)
+
+
+def product_category_links():
+    """
+    Select every category each product is listed in: its own category and the further ones from product_categories.
+
+    Returns:
+        Subquery: The product_id and category_id of every (product, category) pair, each pair once.
+    """
+    own = select(Product.id.label('product_id'), Product.category_id.label('category_id'))
+    further = select(Product.id, ProductCategory.category_id).join(
+        ProductCategory, and_(ProductCategory.store_id == Product.store_id, ProductCategory.url == Product.url)
+    )
+    return union(own, further).subquery('product_category_links')
+
+
+class ProductMatch(Base):
+    """
+    A pair of products from different stores recognized as the same goods.
+    """
+    __tablename__ = "product_matches"
+
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    matched_product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True, index=True)
+    score = Column(Float, nullable=False)
+    matched_at = Column(DateTime(timezone=True), nullable=True)
+
+
 class StoreCreate(BaseModel):
     name: str
 
@@ -52,13 +100,14 @@ class CategoryCreate(BaseModel):
 class ProductCreate(BaseModel):
     name: str
     description: str = None
-    price_new: float
+    price_new: float = None
     price_old: float = None
     article: str = None
     rating: float = None
     availability: str = None
     store_id: int
     category_id: int
+    url: str = None
 
     class Config:
         from_attributes = True
@@ -0,0 +1,451 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import and_, or_, select, tuple_
+
+from config import WRITER_BATCH_SIZE, WRITER_FLUSH_INTERVAL, WRITER_QUEUE_SIZE
+from utils.data_cleaner import normalize_rows
+from utils.fingerprint import product_fingerprint
+from utils.metrics import metrics
+from .database import async_session, upsert
+from .product import Product, ProductCategory
+from .price_history import PriceObservation
+from .price_aggregates import (
+    AggregateDeltas, apply_aggregate_deltas, load_current_prices, load_further_categories, lock_stores,
+)
+
+# Columns filled by the writer. Every row is padded to this set, so all rows of a batch share the same keys
+# and can be sent as one multi-row INSERT.
+PRODUCT_COLUMNS = [column.name for column in Product.__table__.columns if column.name != 'id']
+
+# Columns that make up the natural key of a product.
+NATURAL_KEY = ('store_id', 'url')
+
+# Derived columns, filled when a batch is normalized.
+DERIVED_COLUMNS = ('unit_price', 'unit')
+
+# Extracted fields that take part in the product fingerprint.
+FINGERPRINT_FIELDS = [
+    column for column in PRODUCT_COLUMNS
+    if column not in NATURAL_KEY + DERIVED_COLUMNS + ('fingerprint', 'scraped_at')
+]
+
+_STOP = object()
+
+
+class CategoryLink(NamedTuple):
+    """
+    A further category of a product, queued with attach().
+    """
+    store_id: int
+    url: str
+    category_id: int
+
+
+class ProductWriter:
+    """
+    A background writer that saves scraped products in batches.
+
+    Products are put into a bounded asyncio queue and flushed to the database with a single multi-row
+    INSERT ... ON CONFLICT (store_id, url) DO UPDATE once the batch is full or the flush interval has passed.
+    A full queue makes put() wait, which slows the parsers down instead of growing memory. If a batch fails,
+    its rows are retried one by one so that only the broken rows are rejected; a batch that cannot be saved at all,
+    e.g. after the connection is lost, is rejected as a whole and the writer goes on with the next one. If the
+    background task stops anyway, put(), attach() and sync() raise RuntimeError instead of waiting forever.
+
+    Prices and ratings arrive as scraped text and are parsed for the whole batch at once before it is written;
+    values that cannot be parsed are stored as NULL, so they stay out of the aggregates. The price per kilogram
+    or litre is derived at the same time.
+
+    Every product gets a fingerprint of its extracted fields. Products whose fingerprint matches the one
+    already stored are skipped without touching the database. A product is stamped with the time of the write unless
+    it carries its own scraped_at, e.g. when archived pages are parsed again; such a product does not overwrite one
+    that was scraped later. Every inserted or changed product also gets
+    a price observation in the price history, and the per-store/per-category price aggregates are adjusted
+    by the difference, in the same transaction.
+
+    Further categories of a product that was found in several sections are queued with attach() and saved
+    to product_categories with the same batches. The price of a product counts in the aggregates of all its
+    categories, so the price of a saved product is added to the aggregates of a category linked to it later.
+
+    Attributes:
+        batch_size (int): The maximum number of products in one INSERT.
+        flush_interval (float): The maximum time in seconds a product waits in a partial batch.
+        written (int): The number of saved products.
+        skipped (int): The number of unchanged products that were not written.
+        failures (List[Tuple[Dict[str, Any], str]]): The rejected rows together with the error message.
+    """
+
+    def __init__(self, batch_size: int = WRITER_BATCH_SIZE, flush_interval: float = WRITER_FLUSH_INTERVAL,
+                 queue_size: int = WRITER_QUEUE_SIZE):
+        """
+        Initialize the writer. The background task is started in start().
+
+        Args:
+            batch_size (int): The maximum number of products in one INSERT.
+            flush_interval (float): The maximum time in seconds a product waits in a partial batch.
+            queue_size (int): The maximum number of products waiting in the queue.
+        """
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.skipped = 0
+        self.failures: List[Tuple[Dict[str, Any], str]] = []
+        self._fingerprints: Dict[Tuple[int, str], str] = {}
+        self._queue = asyncio.Queue(maxsize=queue_size)
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """
+        Load the fingerprints of the stored products and start the background flush task.
+        """
+        if self._task is None:
+            await self.load_fingerprints()
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """
+        Flush all queued products and stop the background task.
+        """
+        if self._task is None:
+            return
+        try:
+            await self._put(_STOP)
+        except RuntimeError:
+            # The task has stopped already, its error is raised below.
+            pass
+        task, self._task = self._task, None
+        if not task.cancelled():
+            await task
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def load_fingerprints(self):
+        """
+        Load the fingerprints of all stored products, keyed by (store_id, url).
+        """
+        async with async_session() as session:
+            result = await session.stream(
+                select(Product.store_id, Product.url, Product.fingerprint).where(Product.url.is_not(None))
+            )
+            async for store_id, url, fingerprint in result:
+                self._fingerprints[(store_id, url)] = fingerprint
+
+    def is_known(self, store_id: int, url: str) -> bool:
+        """
+        Check whether a product is already stored.
+
+        Args:
+            store_id (int): The ID of the store.
+            url (str): The normalized URL of the product.
+
+        Returns:
+            bool: True if the product has been saved before.
+        """
+        return (store_id, url) in self._fingerprints
+
+    async def put(self, product) -> bool:
+        """
+        Queue a product for saving unless it is unchanged. Waits while the queue is full.
+
+        Args:
+            product (ProductRecord): The product, including store_id, category_id and url.
+
+        Returns:
+            bool: True if the product was queued, False if it is unchanged and was skipped.
+        """
+        row = {column: getattr(product, column, None) for column in PRODUCT_COLUMNS}
+        row['fingerprint'] = product_fingerprint(row, FINGERPRINT_FIELDS)
+        key = (row['store_id'], row['url'])
+        if self._fingerprints.get(key) == row['fingerprint']:
+            self.skipped += 1
+            metrics.increment('persist', 'unchanged')
+            return False
+        self._fingerprints[key] = row['fingerprint']
+        metrics.increment('persist', 'queued')
+        await self._put(row)
+        return True
+
+    async def attach(self, store_id: int, url: str, category_id: int):
+        """
+        Queue a further category of a product. Waits while the queue is full.
+
+        Args:
+            store_id (int): The ID of the store.
+            url (str): The normalized URL of the product.
+            category_id (int): The ID of the category.
+        """
+        await self._put(CategoryLink(store_id, url, category_id))
+
+    async def sync(self):
+        """
+        Wait until the products queued so far are saved.
+
+        Raises:
+            RuntimeError: If the background task has stopped.
+        """
+        if self._task is None:
+            return
+        barrier = asyncio.get_running_loop().create_future()
+        await self._put(barrier)
+        await self._wait(barrier)
+
+    def _check(self):
+        """
+        Raise if the background task has stopped, as nothing would take the queued items any more.
+        """
+        if self._task is not None and self._task.done():
+            error = self._task.exception() if not self._task.cancelled() else None
+            raise RuntimeError('Фоновая запись товаров остановлена') from error
+
+    async def _wait(self, awaitable):
+        """
+        Wait for an awaitable, or raise if the background task stops first.
+        """
+        self._check()
+        future = asyncio.ensure_future(awaitable)
+        if self._task is not None:
+            await asyncio.wait((future, self._task), return_when=asyncio.FIRST_COMPLETED)
+            if not future.done():
+                future.cancel()
+                self._check()
+        return await future
+
+    async def _put(self, item):
+        """
+        Queue an item, waiting while the queue is full.
+        """
+        self._check()
+        if self._queue.full():
+            await self._wait(self._queue.put(item))
+        else:
+            self._queue.put_nowait(item)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopped = False
+        while not stopped:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+            if isinstance(item, asyncio.Future):
+                item.set_result(None)
+                continue
+            batch = [item]
+            barrier = None
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stopped = True
+                    break
+                if isinstance(item, asyncio.Future):
+                    # sync() is waiting, so the partial batch is saved right away.
+                    barrier = item
+                    break
+                batch.append(item)
+            try:
+                await self._flush(batch)
+            except Exception as e:
+                # The task must survive a failed batch, otherwise put() and sync() would wait forever.
+                self._reject(batch, e)
+            finally:
+                if barrier is not None:
+                    barrier.set_result(None)
+
+    def _reject(self, batch: List[Any], error: Exception):
+        """
+        Record the products of a batch that could not be saved.
+        """
+        rows = [row for row in batch if not isinstance(row, CategoryLink)]
+        for row in rows:
+            self.failures.append((row, str(error)))
+            self._fingerprints.pop((row['store_id'], row['url']), None)
+        metrics.increment('persist', 'error', len(rows))
+        print(f'Ошибка при сохранении пакета товаров ({len(rows)}): {error}')
+
+    @staticmethod
+    def _upsert_statement(rows: List[Dict[str, Any]]):
+        """
+        Build a multi-row upsert on the natural key that only touches rows whose fingerprint changed and that were
+        not scraped later than the new ones. The statement returns the prices of the inserted and updated rows.
+        """
+        stmt = upsert(Product).values(rows)
+        return stmt.on_conflict_do_update(
+            index_elements=list(NATURAL_KEY),
+            set_={column: stmt.excluded[column] for column in PRODUCT_COLUMNS if column not in NATURAL_KEY},
+            where=and_(
+                Product.fingerprint.is_distinct_from(stmt.excluded.fingerprint),
+                or_(Product.scraped_at.is_(None), Product.scraped_at <= stmt.excluded.scraped_at),
+            ),
+        ).returning(
+            Product.id, Product.store_id, Product.category_id, Product.url,
+            Product.price_new, Product.price_old, Product.scraped_at,
+        )
+
+    async def _write_rows(self, session, rows: List[Dict[str, Any]]) -> int:
+        """
+        Upsert the rows, record the price observations of the changed products and update the price aggregates.
+
+        Returns:
+            int: The number of inserted or updated rows. The others were scraped later or are unchanged.
+        """
+        urls_by_store = {}
+        for row in rows:
+            urls_by_store.setdefault(row['store_id'], []).append(row['url'])
+        await lock_stores(session, urls_by_store)
+        current_prices = {}
+        further_categories = {}
+        for store_id, urls in urls_by_store.items():
+            for url, current in (await load_current_prices(session, store_id, urls)).items():
+                current_prices[(store_id, url)] = current
+            for url, categories in (await load_further_categories(session, store_id, urls)).items():
+                further_categories[(store_id, url)] = categories
+
+        result = await session.execute(self._upsert_statement(rows))
+        observations = []
+        deltas = AggregateDeltas()
+        written = set()
+        for product_id, store_id, category_id, url, price_new, price_old, scraped_at in result:
+            written.add((store_id, url))
+            observations.append(
+                {'product_id': product_id, 'observed_at': scraped_at, 'price_new': price_new, 'price_old': price_old}
+            )
+            further = further_categories.get((store_id, url), set())
+            if (store_id, url) in current_prices:
+                old_category_id, old_price = current_prices[(store_id, url)]
+                for old_category in further | {old_category_id}:
+                    deltas.remove(store_id, old_category, old_price)
+            for new_category in further | {category_id}:
+                deltas.add(store_id, new_category, price_new)
+        if observations:
+            await session.execute(
+                upsert(PriceObservation).values(observations).on_conflict_do_nothing()
+            )
+        await apply_aggregate_deltas(session, deltas)
+
+        kept = [(row['store_id'], row['url']) for row in rows if (row['store_id'], row['url']) not in written]
+        if kept:
+            # The stored products stay as they are, so are their fingerprints.
+            stored = await session.execute(
+                select(Product.store_id, Product.url, Product.fingerprint)
+                .where(tuple_(Product.store_id, Product.url).in_(kept))
+            )
+            for store_id, url, fingerprint in stored:
+                self._fingerprints[(store_id, url)] = fingerprint
+        return len(written)
+
+    async def _flush(self, batch: List[Dict[str, Any]]):
+        """
+        Save a batch with one multi-row upsert, falling back to row-by-row upserts if it fails.
+
+        Args:
+            batch (List[Dict[str, Any]]): The rows to save.
+        """
+        scraped_at = datetime.now(timezone.utc)
+        # A row may appear twice in one batch, but one upsert cannot update the same row twice.
+        rows = {}
+        links = set()
+        for row in batch:
+            if isinstance(row, CategoryLink):
+                links.add(row)
+                continue
+            if row['scraped_at'] is None:
+                row['scraped_at'] = scraped_at
+            rows[(row['store_id'], row['url'])] = row
+        batch = list(rows.values())
+        if links:
+            await self._write_links(list(links))
+        if not batch:
+            return
+        with metrics.timer('clean'):
+            normalize_rows(batch)
+
+        started_at = time.perf_counter()
+        try:
+            await self._write_batch(batch)
+        finally:
+            metrics.observe('persist', time.perf_counter() - started_at)
+
+    async def _write_links(self, links: List[CategoryLink]):
+        """
+        Save further categories of products and add the prices of the already saved products to the aggregates
+        of the categories that are new to them.
+        """
+        async with async_session() as session:
+            try:
+                await lock_stores(session, {link.store_id for link in links})
+                result = await session.execute(
+                    upsert(ProductCategory).values([link._asdict() for link in links]).on_conflict_do_nothing()
+                    .returning(ProductCategory.store_id, ProductCategory.url, ProductCategory.category_id)
+                )
+                added_by_store = {}
+                for store_id, url, category_id in result:
+                    added_by_store.setdefault(store_id, []).append((url, category_id))
+                deltas = AggregateDeltas()
+                for store_id, added in added_by_store.items():
+                    current_prices = await load_current_prices(session, store_id, [url for url, _ in added])
+                    for url, category_id in added:
+                        if url in current_prices and current_prices[url][0] != category_id:
+                            deltas.add(store_id, category_id, current_prices[url][1])
+                await apply_aggregate_deltas(session, deltas)
+                await session.commit()
+            except Exception as e:
+                await session.rollback()
+                print(f'Ошибка при сохранении категорий товаров: {e}')
+
+    async def _write_batch(self, batch: List[Dict[str, Any]]):
+        async with async_session() as session:
+            try:
+                written = await self._write_rows(session, batch)
+                await session.commit()
+                self._count(written, len(batch))
+                return
+            except Exception as e:
+                await session.rollback()
+                print(f'Ошибка при пакетном сохранении товаров, сохраняем по одному: {e}')
+
+        saved = []
+        written = 0
+        async with async_session() as session:
+            for row in batch:
+                try:
+                    async with session.begin_nested():
+                        written += await self._write_rows(session, [row])
+                    saved.append(row)
+                except Exception as e:
+                    self.failures.append((row, str(e)))
+                    metrics.increment('persist', 'error')
+                    self._fingerprints.pop((row['store_id'], row['url']), None)
+                    print(f"Ошибка при сохранении товара {row.get('name')}: {e}")
+            try:
+                await session.commit()
+            except Exception as e:
+                await session.rollback()
+                self._reject(saved, e)
+                return
+        self._count(written, len(saved))
+
+    def _count(self, written: int, saved: int):
+        """
+        Count the rows of a committed batch. Rows that were not written were scraped later or are unchanged.
+        """
+        self.written += written
+        self.skipped += saved - written
+        metrics.increment('persist', 'success', written)
+        if saved > written:
+            metrics.increment('persist', 'unchanged', saved - written)
+        print(f'Сохранено товаров: {written}')
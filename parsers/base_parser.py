@@ -1,7 +1,17 @@
+import asyncio
 from abc import ABC, abstractmethod
 import aiohttp
-from typing import List, Dict, Any
-from bs4 import BeautifulSoup
+from typing import List, Dict, Any, Optional
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from .http_client import HttpClient, HttpResponse
+from .page_archive import PageArchive, PRODUCT_PAGE, SECTION_PAGE
+from .parse_pool import ParsePool
+from .product_record import ProductRecord
+from .structured_data import StructuredData
+
+# Returned by get_product_details() instead of the details when the page has not changed since it was last saved.
+NOT_MODIFIED = object()
 
 
 class BaseParser(ABC):
@@ -11,104 +21,181 @@ class BaseParser(ABC):
     Attributes:
         base_url (str): The base URL for the website to be parsed.
         section_url (str): The specific section of the website to be parsed.
-        soup (BeautifulSoup): BeautifulSoup object that holds the parsed HTML of the current page.
+        http_client (HttpClient): The shared HTTP client used for all requests.
+        parse_pool (ParsePool): The worker pool that parses HTML off the event loop.
+        structured_data (StructuredData): The embedded JSON the store ships its products in, read before
+            the selectors. None to use the selectors only.
+        archive (PageArchive): The archive every fetched page is appended to. None if archiving is off.
     """
 
-    def __init__(self, base_url: str, section_url: str):
+    def __init__(self, base_url: str, section_url: str, http_client: HttpClient, parse_pool: ParsePool,
+                 structured_data: Optional[StructuredData] = None, archive: Optional[PageArchive] = None):
         """
         Initialize the parser with the base and section URLs.
 
         Args:
             base_url (str): The base URL for the website to be parsed.
             section_url (str): The specific section of the website to be parsed.
+            http_client (HttpClient): The shared HTTP client used for all requests.
+            parse_pool (ParsePool): The worker pool that parses HTML off the event loop.
+            structured_data (StructuredData, optional): The embedded JSON of the store, see parsers/structured_data.py.
+            archive (PageArchive, optional): The archive every fetched page is appended to.
         """
         self.base_url = base_url
         self.section_url = section_url
-        self.soup = None
+        self.http_client = http_client
+        self.parse_pool = parse_pool
+        self.structured_data = structured_data
+        self.archive = archive
 
-    async def fetch_html(self, url: str) -> str:
+    async def fetch_page(self, url: str, kind: Optional[str] = None,
+                         revalidate: bool = False) -> Optional[HttpResponse]:
         """
-        Fetch the HTML content of the given URL.
+        Fetch the given URL. In archive mode, the page is also appended to the archive,
+        including pages served from the HTTP cache, so the archive holds every page the crawl parsed.
 
         Args:
-            url (str): The URL to fetch the HTML from.
+            url (str): The URL to fetch.
+            kind (str, optional): SECTION_PAGE or PRODUCT_PAGE, recorded in the archive.
+            revalidate (bool): If True, a fresh cached page is revalidated with the server instead of served as is.
 
         Returns:
-            str: The HTML content of the page. None if there was an error fetching the page.
+            HttpResponse: The response of the server. None if there was an error fetching the page.
         """
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as response:
-                    response.raise_for_status()
-                    html = await response.text()
-                    self.soup = BeautifulSoup(html, 'html.parser')
-                    return html
-        except aiohttp.ClientError as e:
+            response = await self.http_client.get(url, revalidate)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
             print(f'Ошибка при запросе URL: {e}')
             return None
+        if self.archive is not None and response.text:
+            await self.archive.append(url, kind, response.status, response.headers, response.text,
+                                      response.fetched_at)
+        return response
 
-    async def get_product_links(self, product_elements: List[Dict[str, str]]) -> List[str]:
+    async def fetch_html(self, url: str, kind: Optional[str] = None) -> str:
         """
         Fetch the HTML content of the given URL.
 
         Args:
             url (str): The URL to fetch the HTML from.
+            kind (str, optional): SECTION_PAGE or PRODUCT_PAGE, recorded in the archive.
 
         Returns:
             str: The HTML content of the page. None if there was an error fetching the page.
         """
+        response = await self.fetch_page(url, kind)
+        return response.text if response else None
+
+    def section_page_url(self, page: int, pagination: Dict[str, Any]) -> str:
+        """
+        Build the URL of a page of the section.
+
+        Args:
+            page (int): The page number.
+            pagination (Dict[str, Any]): The pagination settings of the store: the query parameter name ('param')
+                and the number of the first page ('start').
+
+        Returns:
+            str: The URL of the page. The first page is the plain section URL.
+        """
         full_url = self.base_url + self.section_url
-        html_content = await self.fetch_html(full_url)
-        if not html_content:
-            return []
+        if page == pagination.get('start', 1):
+            return full_url
+        scheme, netloc, path, query, fragment = urlsplit(full_url)
+        query_params = [(key, value) for key, value in parse_qsl(query) if key != pagination['param']]
+        query_params.append((pagination['param'], str(page)))
+        return urlunsplit((scheme, netloc, path, urlencode(query_params), fragment))
+
+    async def get_page_links(self, page_url: str, product_elements: List[Dict[str, str]]) -> Optional[List[str]]:
+        """
+        Get the product links of a single section page.
+        Absolute links, as given in the embedded JSON, are kept, relative ones are joined with the base URL.
 
-        product_links = []
-        product_elements_found = self.soup.find_all(*product_elements)
-        for element in product_elements_found:
-            link = element.get('href')
-            if link:
-                link = link.lstrip('/')
-                full_link = self.base_url + link
-                product_links.append(full_link)
+        Args:
+            page_url (str): The URL of the section page.
+            product_elements (List[Dict[str, str]]): The selector of the product link elements.
 
-        return product_links[:3]
+        Returns:
+            List[str]: The full product links in page order. None if there was an error fetching the page.
+        """
+        html_content = await self.fetch_html(page_url, SECTION_PAGE)
+        if not html_content:
+            return None
 
-    async def get_product_details(self, product_url: str, details_elements: Dict[str, Any]) -> Dict[str, Any]:
+        product_links = []
+        for link in await self.parse_pool.extract_links(html_content, product_elements, self.structured_data):
+            if link.startswith(('http://', 'https://')):
+                product_links.append(link)
+                continue
+            link = link.lstrip('/')
+            full_link = self.base_url + link
+            product_links.append(full_link)
+        return product_links
+
+    async def get_product_details(self, product_url: str, details_elements: Dict[str, Any],
+                                  skip_unchanged: bool = False, revalidate: bool = False) -> Optional[ProductRecord]:
         """
         Get the details of a specific product.
 
+        The parser keeps no state between calls: the page is parsed in the parse pool, and only the extracted
+        record is returned, so neither the HTML nor the tree outlives the call and concurrent calls never interfere.
+
         Args:
             product_url (str): The URL of the product.
             details_elements (Dict[str, Any]): Dictionary of HTML elements to search for product details.
+            skip_unchanged (bool): If True and the page was served from the HTTP cache, the page is not parsed.
+            revalidate (bool): If True, a fresh cached page is revalidated with the server instead of served as is.
 
         Returns:
-            Dict[str, Any]: Dictionary of product details. None if there was an error fetching the page.
+            ProductRecord: The product details. None if there was an error fetching the page.
+                NOT_MODIFIED if skip_unchanged is set and the page has not changed.
         """
-        html_content = await self.fetch_html(product_url)
-        if not html_content:
+        response = await self.fetch_page(product_url, PRODUCT_PAGE, revalidate)
+        if not response or not response.text:
             return None
+        if skip_unchanged and response.from_cache:
+            return NOT_MODIFIED
 
-        product_details = {}
-        for detail, element in details_elements.items():
-            detail_element = self.soup.find(*element)
-            product_details[detail] = detail_element.get_text(strip=True) if detail_element else f'{detail.capitalize()} не найдено'
+        extracted = await self.parse_pool.extract_details(response.text, details_elements, self.structured_data)
+        return ProductRecord.from_fields(product_url, extracted)
 
-        return product_details
+    @property
+    @abstractmethod
+    def first_page(self) -> int:
+        """
+        The number of the first page of the section.
+        """
+        pass
 
     @abstractmethod
-    async def parse_product_links(self) -> List[str]:
+    def page_url(self, page: int) -> str:
         """
-        Abstract method to parse product links.
+        Abstract method to build the URL of a section page.
 
-        This method should be implemented by any class that inherits from BaseParser.
+        Args:
+            page (int): The page number.
+
+        Returns:
+            str: The URL of the page.
+        """
+        pass
+
+    @abstractmethod
+    async def parse_page_links(self, page: int) -> Optional[List[str]]:
+        """
+        Abstract method to parse the product links of a single section page.
+
+        Args:
+            page (int): The page number.
 
         Returns:
-            List[str]: List of product links.
+            List[str]: Product links. None if there was an error fetching the page.
         """
         pass
 
     @abstractmethod
-    async def parse_product_details(self, product_url: str) -> Dict[str, Any]:
+    async def parse_product_details(self, product_url: str, skip_unchanged: bool = False,
+                                    revalidate: bool = False) -> Optional[ProductRecord]:
         """
         Abstract method to parse product details.
 
@@ -116,8 +203,10 @@ class BaseParser(ABC):
 
         Args:
             product_url (str): The URL of the product.
+            skip_unchanged (bool): If True, NOT_MODIFIED is returned for pages that have not changed.
+            revalidate (bool): If True, a fresh cached page is revalidated with the server instead of served as is.
 
         Returns:
-            Dict[str, Any]: Dictionary of product details.
+            ProductRecord: The product details.
         """
         pass
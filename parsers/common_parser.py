@@ -1,6 +1,10 @@
 from .base_parser import BaseParser
-from utils.data_cleaner import clean_price, clean_rating
-from typing import List, Dict, Any
+from .http_client import HttpClient
+from .parse_pool import ParsePool
+from .product_record import ProductRecord
+from .page_archive import PageArchive
+from .structured_data import StructuredData
+from typing import Dict, Any, List, Optional
 
 
 class CommonParser(BaseParser):
@@ -10,7 +14,9 @@ class CommonParser(BaseParser):
     Attributes:
         selectors (Dict[str, Any]): A dictionary of selectors used for parsing.
     """
-    def __init__(self, base_url: str, section_url: str, selectors: Dict[str, Any]):
+    def __init__(self, base_url: str, section_url: str, selectors: Dict[str, Any], http_client: HttpClient,
+                 parse_pool: ParsePool, structured_data: Optional[StructuredData] = None,
+                 archive: Optional[PageArchive] = None):
         """
         Initialize the parser with the base and section URLs and selectors.
 
@@ -18,35 +24,46 @@ class CommonParser(BaseParser):
             base_url (str): The base URL for the website to be parsed.
             section_url (str): The specific section of the website to be parsed.
             selectors (Dict[str, Any]): A dictionary of selectors used for parsing.
+            http_client (HttpClient): The shared HTTP client used for all requests.
+            parse_pool (ParsePool): The worker pool that parses HTML off the event loop.
+            structured_data (StructuredData, optional): The embedded JSON of the store, read before the selectors.
+            archive (PageArchive, optional): The archive every fetched page is appended to.
         """
-        super().__init__(base_url, section_url)
+        super().__init__(base_url, section_url, http_client, parse_pool, structured_data, archive)
         self.selectors = selectors
 
-    async def parse_product_links(self) -> List[str]:
+    @property
+    def first_page(self) -> int:
+        return self.selectors['pagination'].get('start', 1)
+
+    def page_url(self, page: int) -> str:
+        return self.section_page_url(page, self.selectors['pagination'])
+
+    async def parse_page_links(self, page: int) -> Optional[List[str]]:
         """
-        Parse product links using the 'product_links' selector.
+        Parse the product links of a single section page using the 'product_links' selector.
+
+        Args:
+            page (int): The page number.
 
         Returns:
-            List[str]: List of product links.
+            List[str]: Product links. None if there was an error fetching the page.
         """
-        return await self.get_product_links(self.selectors['product_links'])
+        return await self.get_page_links(self.page_url(page), self.selectors['product_links'])
 
-    async def parse_product_details(self, product_url: str) -> Dict[str, Any]:
+    async def parse_product_details(self, product_url: str, skip_unchanged: bool = False,
+                                    revalidate: bool = False) -> Optional[ProductRecord]:
         """
-        Parse product details using the 'product_details' selector and clean the data.
+        Parse product details using the 'product_details' selector.
+        Prices and ratings are kept as scraped: ProductWriter normalizes them for a whole batch at once.
 
         Args:
             product_url (str): The URL of the product.
+            skip_unchanged (bool): If True, NOT_MODIFIED is returned for pages that have not changed.
+            revalidate (bool): If True, a fresh cached page is revalidated with the server instead of served as is.
 
         Returns:
-            Dict[str, Any]: Dictionary of cleaned product details.
+            ProductRecord: The product details.
         """
-        product_details = await self.get_product_details(product_url, self.selectors['product_details'])
-        if product_details:
-            if 'price_new' in product_details:
-                product_details['price_new'] = clean_price(product_details['price_new'])
-            if 'price_old' in product_details:
-                product_details['price_old'] = clean_price(product_details['price_old'])
-            if 'rating' in product_details:
-                product_details['rating'] = clean_rating(product_details['rating'])
-        return product_details
+        return await self.get_product_details(product_url, self.selectors['product_details'], skip_unchanged,
+                                              revalidate)
@@ -0,0 +1,298 @@
+"""
+CPU-bound HTML extraction.
+
+The functions in this module are executed inside the parse pool, so they must stay picklable top-level functions
+and return plain data only (lists and dicts of strings), never parsed trees.
+
+Selectors use the same format as parsers/selectors.py: a (tag_name, {attribute: value}) tuple.
+A set of selectors is compiled once per worker into an ExtractionPlan, which finds all of them in a single pass
+over the document instead of one search per field, and stops as soon as every field is found:
+
+* lxml runs one compiled XPath with a single scan per tag name;
+* selectolax runs one combined CSS selector;
+* html.parser only builds the subtrees whose tag names occur in the plan.
+
+Attribute values are compared exactly, as in a CSS [attr="value"] selector, with every backend. The class attribute
+is compared by whitespace-separated token, as by bs4 and a CSS .name selector: the element must have every class of
+the selector and may have more.
+"""
+from collections import defaultdict
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, List, Tuple, Union
+
+PARSER_BACKENDS = ('html.parser', 'lxml', 'selectolax')
+
+Selector = Tuple[str, Dict[str, str]]
+
+# A compiled attribute condition: the attribute name and its value, or the set of classes for the class attribute.
+Condition = Tuple[str, Union[str, FrozenSet[str]]]
+
+
+def _condition(attr: str, value: str) -> Condition:
+    return (attr, frozenset(value.split())) if attr == 'class' else (attr, value)
+
+
+def _satisfies(attrs: Any, conditions: Tuple[Condition, ...]) -> bool:
+    for attr, expected in conditions:
+        value = attrs.get(attr)
+        if value is None:
+            return False
+        if isinstance(expected, frozenset):
+            if not expected.issubset(value.split()):
+                return False
+        elif value != expected:
+            return False
+    return True
+
+
+def _css_selector(selector: Selector) -> str:
+    """
+    Convert a (tag_name, attributes) selector into a CSS selector.
+    """
+    name, attrs = selector
+    conditions = []
+    for attr, value in attrs.items():
+        operator, values = ('~=', value.split()) if attr == 'class' else ('=', [value])
+        conditions.extend('[{}{}"{}"]'.format(attr, operator, item.replace('"', '\\"')) for item in values)
+    return name + ''.join(conditions)
+
+
+def _xpath_condition(attr: str, value: str) -> str:
+    """
+    Convert an attribute condition into an XPath predicate.
+    """
+    if attr != 'class':
+        return f'@{attr}={_xpath_literal(value)}'
+    return ' and '.join(
+        f"contains(concat(' ', normalize-space(@class), ' '), {_xpath_literal(f' {token} ')})"
+        for token in value.split()
+    )
+
+
+class ExtractionPlan:
+    """
+    Selectors compiled for a single-pass search.
+
+    Attributes:
+        fields (List[str]): The field names in selector order.
+        tags (frozenset): The tag names used by the selectors.
+        css (str): The selectors combined into one CSS selector group, used by selectolax.
+    """
+
+    def __init__(self, selectors: Dict[str, Selector]):
+        self.fields = list(selectors)
+        # Selectors are indexed by tag name, then by the name and value (or one class) of their first attribute,
+        # so an element is checked with one dictionary lookup per attribute name (or class) instead of evaluating
+        # every selector.
+        self._index: Dict[str, Dict[str, Dict[str, List[Tuple[str, Tuple[Condition, ...]]]]]] = {}
+        self._any_attrs: Dict[str, List[str]] = defaultdict(list)
+        for field, (name, attrs) in selectors.items():
+            conditions = tuple(_condition(attr, value) for attr, value in attrs.items())
+            if not conditions:
+                self._any_attrs[name].append(field)
+                continue
+            attr, value = conditions[0]
+            key = min(value) if isinstance(value, frozenset) and value else value
+            by_attr = self._index.setdefault(name, {}).setdefault(attr, {})
+            by_attr.setdefault(key, []).append((field, conditions))
+        self.tags = frozenset(self._index) | frozenset(self._any_attrs)
+        self.css = ', '.join(_css_selector(selector) for selector in selectors.values())
+        self._selectors = selectors
+        self._xpath = None
+
+    @property
+    def xpath(self):
+        """
+        The selectors compiled into one lxml XPath with a single descendant scan per tag name.
+        The matches are returned in document order.
+        """
+        if self._xpath is None:
+            from lxml import etree
+
+            alternatives = defaultdict(list)
+            for name, attrs in self._selectors.values():
+                conditions = ' and '.join(_xpath_condition(attr, value) for attr, value in attrs.items())
+                alternatives[name].append(f'({conditions})' if conditions else 'true()')
+            self._xpath = etree.XPath(' | '.join(
+                f"//{name}[{' or '.join(conditions)}]" for name, conditions in alternatives.items()
+            ))
+        return self._xpath
+
+    def match(self, tag: str, attrs: Any) -> List[str]:
+        """
+        Get the fields whose selector matches an element.
+
+        Args:
+            tag (str): The tag name of the element.
+            attrs: A mapping of the element attributes with their raw string values.
+
+        Returns:
+            List[str]: The matching fields in selector order.
+        """
+        fields = list(self._any_attrs.get(tag, ()))
+        for attr, by_value in self._index.get(tag, {}).items():
+            value = attrs.get(attr)
+            if value is None:
+                continue
+            for key in set(value.split()) if attr == 'class' else (value,):
+                for field, conditions in by_value.get(key, ()):
+                    if _satisfies(attrs, conditions):
+                        fields.append(field)
+        return fields
+
+
+@lru_cache(maxsize=64)
+def _compile(frozen_selectors: Tuple[Tuple[str, str, Tuple[Tuple[str, str], ...]], ...]) -> ExtractionPlan:
+    return ExtractionPlan({field: (name, dict(attrs)) for field, name, attrs in frozen_selectors})
+
+
+def compile_plan(selectors: Dict[str, Selector]) -> ExtractionPlan:
+    """
+    Get the compiled plan of a set of selectors. Plans are cached, so each worker compiles a set only once.
+
+    Args:
+        selectors (Dict[str, Selector]): The selectors keyed by field name.
+
+    Returns:
+        ExtractionPlan: The compiled plan.
+    """
+    return _compile(tuple((field, name, tuple(attrs.items())) for field, (name, attrs) in selectors.items()))
+
+
+def _xpath_literal(value: str) -> str:
+    if "'" not in value:
+        return f"'{value}'"
+    if '"' not in value:
+        return f'"{value}"'
+    # XPath 1.0 has no escapes, a value with both quotes is concatenated from parts without single quotes.
+    parts = value.split("'")
+    return 'concat(' + ', "\'", '.join(f"'{part}'" for part in parts) + ')'
+
+
+@lru_cache(maxsize=1)
+def _utf8_parser():
+    import lxml.html
+
+    return lxml.html.HTMLParser(encoding='utf-8')
+
+
+def _parse_lxml(html: str):
+    """
+    Parse a document with lxml. None if the document is empty.
+    """
+    import lxml.etree
+    import lxml.html
+
+    try:
+        try:
+            return lxml.html.fromstring(html)
+        except ValueError:
+            # lxml refuses text with an XML encoding declaration, the text is parsed as UTF-8 bytes instead.
+            return lxml.html.fromstring(html.encode('utf-8'), parser=_utf8_parser())
+    except lxml.etree.ParserError:
+        return None
+
+
+def _run_lxml(html: str, plan: ExtractionPlan, first_only: bool) -> List[Tuple[str, Any]]:
+    matches: List[Tuple[str, Any]] = []
+    root = _parse_lxml(html)
+    if root is None:
+        return matches
+    pending = set(plan.fields)
+    for element in plan.xpath(root):
+        for field in plan.match(element.tag, element.attrib):
+            if not first_only:
+                matches.append((field, element.attrib))
+            elif field in pending:
+                pending.discard(field)
+                matches.append((field, ''.join(text.strip() for text in element.itertext())))
+        if first_only and not pending:
+            break
+    return matches
+
+
+def _run_selectolax(html: str, plan: ExtractionPlan, first_only: bool) -> List[Tuple[str, Any]]:
+    try:
+        from selectolax.lexbor import LexborHTMLParser
+    except ImportError as e:
+        raise ValueError('Для парсера selectolax необходимо установить пакет selectolax') from e
+
+    matches: List[Tuple[str, Any]] = []
+    pending = set(plan.fields)
+    for node in LexborHTMLParser(html).css(plan.css):
+        attrs = node.attributes
+        for field in plan.match(node.tag, attrs):
+            if not first_only:
+                matches.append((field, attrs))
+            elif field in pending:
+                pending.discard(field)
+                matches.append((field, node.text(deep=True, separator='', strip=True)))
+        if first_only and not pending:
+            break
+    return matches
+
+
+def _run_bs4(html: str, plan: ExtractionPlan, first_only: bool) -> List[Tuple[str, Any]]:
+    from bs4 import BeautifulSoup, SoupStrainer
+
+    soup = BeautifulSoup(html, 'html.parser', parse_only=SoupStrainer(list(plan.tags)))
+    matches: List[Tuple[str, Any]] = []
+    pending = set(plan.fields)
+    for element in soup.find_all(list(plan.tags)):
+        # bs4 splits multi-valued attributes such as class, the selectors compare raw values.
+        attrs = {key: ' '.join(value) if isinstance(value, list) else value for key, value in element.attrs.items()}
+        for field in plan.match(element.name, attrs):
+            if not first_only:
+                matches.append((field, attrs))
+            elif field in pending:
+                pending.discard(field)
+                matches.append((field, element.get_text(strip=True)))
+        if first_only and not pending:
+            break
+    return matches
+
+
+def _run_plan(html: str, plan: ExtractionPlan, first_only: bool, backend: str) -> List[Tuple[str, Any]]:
+    if backend == 'lxml':
+        return _run_lxml(html, plan, first_only)
+    if backend == 'selectolax':
+        return _run_selectolax(html, plan, first_only)
+    if backend == 'html.parser':
+        return _run_bs4(html, plan, first_only)
+    raise ValueError(f'Неизвестный HTML-парсер: {backend}')
+
+
+def extract_links(html: str, selector: Selector, backend: str = 'html.parser') -> List[str]:
+    """
+    Extract the href attributes of all elements matching the selector.
+
+    Args:
+        html (str): The HTML content of the page.
+        selector (Selector): The selector of the link elements.
+        backend (str): The parser backend, one of PARSER_BACKENDS.
+
+    Returns:
+        List[str]: The href values in document order.
+    """
+    plan = compile_plan({'link': selector})
+    return [attrs['href'] for _, attrs in _run_plan(html, plan, False, backend) if attrs.get('href')]
+
+
+def extract_details(html: str, selectors: Dict[str, Selector], backend: str = 'html.parser') -> Dict[str, str]:
+    """
+    Extract the text of the first element matching each selector in a single pass over the document.
+
+    Args:
+        html (str): The HTML content of the page.
+        selectors (Dict[str, Selector]): The selectors of the product fields, keyed by field name.
+        backend (str): The parser backend, one of PARSER_BACKENDS.
+
+    Returns:
+        Dict[str, str]: The extracted text of each field. Missing fields get a "не найдено" placeholder.
+    """
+    plan = compile_plan(selectors)
+    found = dict(_run_plan(html, plan, True, backend))
+    return {
+        detail: found[detail] if detail in found else f'{detail.capitalize()} не найдено'
+        for detail in plan.fields
+    }
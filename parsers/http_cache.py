@@ -0,0 +1,286 @@
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from email.utils import parsedate_to_datetime
+from typing import Dict, Mapping, Optional, Tuple
+
+from config import HTTP_CACHE_DIR, HTTP_CACHE_MAX_BYTES, HTTP_CACHE_DEFAULT_TTL
+
+
+@dataclass
+class CacheEntry:
+    """
+    Metadata of a cached response.
+
+    Attributes:
+        url (str): The URL of the response.
+        etag (str): The ETag header, used for If-None-Match.
+        last_modified (str): The Last-Modified header, used for If-Modified-Since.
+        expires_at (float): The Unix time until which the response is fresh.
+        size (int): The size of the cached body in bytes.
+        fetched_at (float): The Unix time the server last sent or confirmed the body. 0 for entries cached
+            before it was recorded.
+    """
+    url: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    expires_at: float
+    size: int = 0
+    fetched_at: float = 0.0
+
+    def is_fresh(self) -> bool:
+        return time.time() < self.expires_at
+
+    def conditional_headers(self) -> Dict[str, str]:
+        """
+        Build the headers of a conditional revalidation request.
+        """
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+def freshness_lifetime(headers: Mapping[str, str], default_ttl: float = HTTP_CACHE_DEFAULT_TTL) -> Optional[float]:
+    """
+    Calculate how long a response stays fresh from its Cache-Control and Expires headers.
+
+    Args:
+        headers (Mapping[str, str]): The response headers.
+        default_ttl (float): The lifetime used when the server gives no freshness information.
+
+    Returns:
+        float: The freshness lifetime in seconds. None if the response must not be stored.
+    """
+    directives = {}
+    for directive in headers.get('Cache-Control', '').lower().split(','):
+        key, _, value = directive.strip().partition('=')
+        if key:
+            directives[key] = value.strip('"')
+    if 'no-store' in directives:
+        return None
+    if 'no-cache' in directives:
+        return 0.0
+    for key in ('s-maxage', 'max-age'):
+        if key in directives:
+            try:
+                return max(float(directives[key]), 0.0)
+            except ValueError:
+                return 0.0
+    if 'Expires' in headers:
+        try:
+            return max(parsedate_to_datetime(headers['Expires']).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            return 0.0
+    return default_ttl
+
+
+class HttpCache:
+    """
+    An on-disk cache of HTTP responses with conditional revalidation and LRU eviction.
+
+    Each response is stored as two files named by the hash of its URL: the body and a JSON file with the
+    ETag/Last-Modified/expiry metadata. The least recently used entries are evicted once the total size
+    of the bodies exceeds max_bytes.
+
+    Files are written to unique temporary files and renamed into place, so concurrent stores of the same URL,
+    also from the processes of a sharded crawl sharing the directory, never see a partial file. The size budget
+    is kept by each process separately, so with CRAWL_SHARDS processes the cache can grow up to CRAWL_SHARDS
+    times max_bytes. A failed write only leaves the response uncached.
+
+    Attributes:
+        directory (str): The directory of the cache.
+        max_bytes (int): The byte budget of the cached bodies.
+    """
+
+    def __init__(self, directory: str = HTTP_CACHE_DIR, max_bytes: int = HTTP_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[str, CacheEntry]' = OrderedDict()
+        self._total_bytes = 0
+        self._loaded = False
+
+    @staticmethod
+    def _key(url: str) -> str:
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.directory, key[:2], key + suffix)
+
+    async def load(self):
+        """
+        Read the metadata of all cached responses, ordering them by last access time.
+        """
+        if not self._loaded:
+            entries = await asyncio.to_thread(self._scan)
+            for key, entry in entries:
+                self._entries[key] = entry
+                self._total_bytes += entry.size
+            self._loaded = True
+
+    def _scan(self):
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for root, _, files in os.walk(self.directory):
+            for file_name in files:
+                if not file_name.endswith('.json'):
+                    continue
+                key = file_name[:-len('.json')]
+                body_path = self._path(key, '.body')
+                try:
+                    with open(os.path.join(root, file_name), encoding='utf-8') as meta_file:
+                        entry = CacheEntry(**json.load(meta_file))
+                    accessed_at = os.stat(body_path).st_mtime
+                except (OSError, ValueError, TypeError):
+                    continue
+                entries.append((accessed_at, key, entry))
+        entries.sort(key=lambda item: item[0])
+        return [(key, entry) for _, key, entry in entries]
+
+    async def get(self, url: str) -> Optional[Tuple[CacheEntry, str]]:
+        """
+        Get a cached response.
+
+        Args:
+            url (str): The URL of the response.
+
+        Returns:
+            Tuple[CacheEntry, str]: The metadata and the body. None if the URL is not cached.
+        """
+        await self.load()
+        key = self._key(url)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        try:
+            body = await asyncio.to_thread(self._read_body, key)
+        except OSError:
+            self._forget(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry, body
+
+    def _read_body(self, key: str) -> str:
+        path = self._path(key, '.body')
+        with open(path, encoding='utf-8') as body_file:
+            body = body_file.read()
+        os.utime(path)
+        return body
+
+    async def store(self, url: str, headers: Mapping[str, str], body: str):
+        """
+        Store a response unless its headers forbid it, evicting old entries if the cache is over budget.
+
+        Args:
+            url (str): The URL of the response.
+            headers (Mapping[str, str]): The response headers.
+            body (str): The decoded body.
+        """
+        lifetime = freshness_lifetime(headers)
+        if lifetime is None or (lifetime == 0 and 'ETag' not in headers and 'Last-Modified' not in headers):
+            # Such a response could neither be served nor revalidated.
+            return
+        await self.load()
+        key = self._key(url)
+        data = body.encode('utf-8')
+        now = time.time()
+        entry = CacheEntry(
+            url=url,
+            etag=headers.get('ETag'),
+            last_modified=headers.get('Last-Modified'),
+            expires_at=now + lifetime,
+            size=len(data),
+            fetched_at=now,
+        )
+        if entry.size > self.max_bytes:
+            return
+        try:
+            await asyncio.to_thread(self._write, key, entry, data)
+        except OSError as e:
+            print(f'Ошибка при сохранении ответа в кеш {url}: {e}')
+            return
+        self._forget(key, delete=False)
+        self._entries[key] = entry
+        self._total_bytes += entry.size
+        await self._evict()
+
+    async def revalidated(self, url: str, headers: Mapping[str, str]):
+        """
+        Refresh the metadata of a cached response after a 304 Not Modified answer.
+
+        Args:
+            url (str): The URL of the response.
+            headers (Mapping[str, str]): The headers of the 304 response.
+        """
+        key = self._key(url)
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        lifetime = freshness_lifetime(headers)
+        entry.fetched_at = time.time()
+        entry.expires_at = entry.fetched_at + (lifetime or 0.0)
+        entry.etag = headers.get('ETag', entry.etag)
+        entry.last_modified = headers.get('Last-Modified', entry.last_modified)
+        try:
+            await asyncio.to_thread(self._write_meta, key, entry)
+        except OSError as e:
+            print(f'Ошибка при обновлении кеша {url}: {e}')
+
+    @staticmethod
+    def _replace(path: str, data: bytes):
+        """
+        Write a file atomically through a temporary file of its own in the same directory.
+        """
+        descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + '.',
+                                                 suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                file.write(data)
+            os.replace(temporary, path)
+        except BaseException:
+            try:
+                os.remove(temporary)
+            except OSError:
+                pass
+            raise
+
+    def _write(self, key: str, entry: CacheEntry, data: bytes):
+        body_path = self._path(key, '.body')
+        os.makedirs(os.path.dirname(body_path), exist_ok=True)
+        self._replace(body_path, data)
+        self._write_meta(key, entry)
+
+    def _write_meta(self, key: str, entry: CacheEntry):
+        self._replace(self._path(key, '.json'), json.dumps(asdict(entry), ensure_ascii=False).encode('utf-8'))
+
+    def _forget(self, key: str, delete: bool = True):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._total_bytes -= entry.size
+        if delete:
+            self._delete_files([key])
+
+    async def _evict(self):
+        evicted = []
+        while self._total_bytes > self.max_bytes and self._entries:
+            key, entry = self._entries.popitem(last=False)
+            self._total_bytes -= entry.size
+            evicted.append(key)
+        if evicted:
+            await asyncio.to_thread(self._delete_files, evicted)
+
+    def _delete_files(self, keys):
+        for key in keys:
+            for suffix in ('.body', '.json'):
+                try:
+                    os.remove(self._path(key, suffix))
+                except OSError:
+                    pass
@@ -0,0 +1,256 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from config import (
+    STORES,
+    HTTP_POOL_LIMIT,
+    HTTP_LIMIT_PER_HOST,
+    HTTP_HOST_LIMITS,
+    HTTP_DNS_CACHE_TTL,
+    HTTP_KEEPALIVE_TIMEOUT,
+    HTTP_TIMEOUT,
+    HTTP_HEADERS,
+    HTTP_CACHE_ENABLED,
+    HTTP_MAX_RETRIES,
+    RATE_LIMIT_RPS,
+    HTTP_HOST_RATE_LIMITS,
+)
+from utils.metrics import metrics
+from .http_cache import CacheEntry, HttpCache
+from .rate_limiter import HostController, SharedRateLimit, backoff_delay, parse_retry_after
+
+# Statuses that mean the server is overloaded or throttling us: the request is retried after a backoff.
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+@dataclass(slots=True)
+class HttpResponse:
+    """
+    The result of a single HTTP request.
+
+    Attributes:
+        url (str): The requested URL.
+        status (int): The HTTP status code.
+        text (str): The decoded body of the response.
+        headers (Dict[str, str]): The response headers.
+        from_cache (bool): True if the body was served from the on-disk cache, either because it was still
+            fresh or because the server answered 304 Not Modified.
+        latency (float): The network round-trip of the request up to the end of the body, sec.
+            None if the body was served from the cache.
+        fetched_at (float): The Unix time the server sent or confirmed the body. For a fresh cached response,
+            the time it was cached or last revalidated; None if the cache entry does not record it.
+    """
+    url: str
+    status: int
+    text: str
+    headers: Dict[str, str] = field(default_factory=dict)
+    from_cache: bool = False
+    latency: Optional[float] = None
+    fetched_at: Optional[float] = None
+
+
+class HttpClient:
+    """
+    A long-lived HTTP client shared by all parsers.
+
+    The client owns a single aiohttp session with a pooled connector, so keep-alive connections,
+    the DNS cache and TLS sessions are reused between requests. Connections are limited globally
+    and per host, and individual stores can get their own limits via HTTP_HOST_LIMITS.
+    Every host has a HostController that adapts its request rate and concurrency to throttling answers,
+    errors and latency. Failed requests are retried with jittered exponential backoff, honoring Retry-After.
+    Responses go through an optional on-disk cache: fresh entries are served locally and stale ones
+    are revalidated with If-None-Match/If-Modified-Since.
+    In a sharded crawl, the clients of all processes also pass a SharedRateLimit, so the request rate
+    of each host stays within its limit in total.
+
+    Attributes:
+        limit (int): The total number of simultaneous connections.
+        limit_per_host (int): The default number of simultaneous connections per host.
+        host_limits (Dict[str, int]): Per-host connection limits, keyed by host name.
+        host_rate_limits (Dict[str, float]): Per-host maximum request rates, keyed by host name.
+        controllers (Dict[str, HostController]): Rate and concurrency controllers, keyed by host name.
+        cache (HttpCache): The response cache. None if caching is disabled.
+        shared_rate_limit (SharedRateLimit): The rate limits shared with other processes. None in a single process.
+    """
+
+    def __init__(self, limit: int = HTTP_POOL_LIMIT, limit_per_host: int = HTTP_LIMIT_PER_HOST,
+                 host_limits: Optional[Dict[str, int]] = None, cache: Optional[HttpCache] = None,
+                 shared_rate_limit: Optional[SharedRateLimit] = None):
+        """
+        Initialize the client. The session itself is created in start().
+
+        Args:
+            limit (int): The total number of simultaneous connections.
+            limit_per_host (int): The default number of simultaneous connections per host.
+            host_limits (Dict[str, int], optional): Per-host connection limits, keyed by host name.
+                Defaults to HTTP_HOST_LIMITS resolved against STORES.
+            cache (HttpCache, optional): The response cache. Defaults to a new HttpCache if HTTP_CACHE_ENABLED is set.
+            shared_rate_limit (SharedRateLimit, optional): The rate limits shared with other processes.
+        """
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.host_limits = host_limits if host_limits is not None else self._resolve_store_limits(HTTP_HOST_LIMITS)
+        self.host_rate_limits = self._resolve_store_limits(HTTP_HOST_RATE_LIMITS)
+        self.controllers: Dict[str, HostController] = {}
+        self.cache = cache if cache is not None else (HttpCache() if HTTP_CACHE_ENABLED else None)
+        self.shared_rate_limit = shared_rate_limit
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @staticmethod
+    def _resolve_store_limits(store_limits: Dict[str, float]) -> Dict[str, float]:
+        """
+        Convert limits keyed by store name into limits keyed by host name.
+
+        Args:
+            store_limits (Dict[str, float]): Limits keyed by store name, as in config.py.
+
+        Returns:
+            Dict[str, float]: Limits keyed by host name.
+        """
+        return {
+            urlsplit(STORES[store_name]).hostname: value
+            for store_name, value in store_limits.items()
+            if store_name in STORES
+        }
+
+    def controller(self, host: str) -> HostController:
+        """
+        Get the rate and concurrency controller of a host, creating it on first use.
+
+        Args:
+            host (str): The host name.
+
+        Returns:
+            HostController: The controller of the host.
+        """
+        controller = self.controllers.get(host)
+        if controller is None:
+            controller = HostController(
+                host,
+                max_rate=self.host_rate_limits.get(host, RATE_LIMIT_RPS),
+                max_concurrency=self.host_limits.get(host, self.limit_per_host),
+            )
+            self.controllers[host] = controller
+        return controller
+
+    async def start(self):
+        """
+        Create the pooled connector and the shared session.
+        """
+        if self._session is not None:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            headers=HTTP_HEADERS,
+            timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT),
+        )
+
+    async def close(self):
+        """
+        Close the session and all pooled connections.
+        """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def get(self, url: str, revalidate: bool = False) -> HttpResponse:
+        """
+        Perform a GET request through the shared session.
+
+        A fresh cached response is served right away, without taking a slot or a rate token of the host and
+        without counting towards its latency, unless revalidate is set. Other requests wait for the rate and
+        concurrency limits of their host. Throttling answers, server errors, connection errors and timeouts
+        are retried up to HTTP_MAX_RETRIES times.
+
+        Args:
+            url (str): The URL to fetch.
+            revalidate (bool): If True, a cached response is always revalidated with a conditional request,
+                even if it is still fresh.
+
+        Returns:
+            HttpResponse: The response of the server.
+
+        Raises:
+            aiohttp.ClientError: If the request fails or the server returns an error status.
+            asyncio.TimeoutError: If the last attempt timed out.
+        """
+        if self._session is None:
+            await self.start()
+        cached = await self.cache.get(url) if self.cache is not None else None
+        if cached is not None and not revalidate and cached[0].is_fresh():
+            metrics.increment('fetch', 'cache_hit')
+            return HttpResponse(url=url, status=200, text=cached[1], from_cache=True,
+                                fetched_at=cached[0].fetched_at or None)
+        host = urlsplit(url).hostname
+        controller = self.controller(host)
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        while True:
+            retry_after = None
+            wait_started_at = loop.time()
+            async with controller.slot():
+                if self.shared_rate_limit is not None:
+                    await self.shared_rate_limit.wait(host)
+                metrics.observe('slot_wait', loop.time() - wait_started_at)
+                try:
+                    response = await self._request(url, cached)
+                except aiohttp.ClientResponseError as e:
+                    if e.status not in RETRY_STATUSES:
+                        raise
+                    retry_after = parse_retry_after(e.headers)
+                    controller.on_throttle(retry_after)
+                    if retry_after and self.shared_rate_limit is not None:
+                        self.shared_rate_limit.pause(host, retry_after)
+                    if attempt >= HTTP_MAX_RETRIES:
+                        raise
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                    controller.on_error()
+                    if attempt >= HTTP_MAX_RETRIES:
+                        raise
+                else:
+                    controller.on_success(response.latency)
+                    return response
+            await asyncio.sleep(backoff_delay(attempt, retry_after))
+            attempt += 1
+
+    async def _request(self, url: str, cached: Optional[Tuple[CacheEntry, str]]) -> HttpResponse:
+        # A stale cached response is revalidated with a conditional request.
+        request_headers = cached[0].conditional_headers() if cached is not None else None
+
+        loop = asyncio.get_running_loop()
+        with metrics.timer('fetch'):
+            started_at = loop.time()
+            async with self._session.get(url, headers=request_headers) as response:
+                if response.status == 304 and cached is not None:
+                    await self.cache.revalidated(url, response.headers)
+                    return HttpResponse(url=url, status=304, text=cached[1], headers=dict(response.headers),
+                                        from_cache=True, fetched_at=time.time())
+                response.raise_for_status()
+                body = await response.read()
+                latency = loop.time() - started_at
+                fetched_at = time.time()
+        metrics.add_bytes(len(body))
+        with metrics.timer('decode'):
+            text = body.decode(response.get_encoding())
+        if self.cache is not None:
+            await self.cache.store(url, response.headers, text)
+        return HttpResponse(url=url, status=response.status, text=text, headers=dict(response.headers),
+                            latency=latency, fetched_at=fetched_at)
@@ -0,0 +1,263 @@
+"""
+An append-only archive of fetched pages, so they can be parsed again without fetching them.
+
+Pages are appended to segment files under ARCHIVE_DIR/<crawl date>/. Every process writes its own segments,
+named by the start time of its run, its PID and a sequence number, and starts a new segment once the current one
+reaches ARCHIVE_SEGMENT_BYTES. Segments are never modified after they are written.
+
+A record of a segment is a fixed header (magic, metadata length, body length, CRC32 of the body),
+the metadata as JSON (URL, page kind, store, category, status, headers, fetch time) and the zlib-compressed body.
+Next to each segment, an .idx file holds one JSON line per record with its offset, so a reader can find the pages
+it needs without decompressing the others. A segment whose index is missing or truncated is indexed by scanning
+the record headers.
+"""
+import asyncio
+import glob
+import json
+import mmap
+import os
+import struct
+import time
+import zlib
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from config import ARCHIVE_DIR, ARCHIVE_SEGMENT_BYTES, ARCHIVE_COMPRESSION_LEVEL
+from utils.metrics import current_labels
+
+SECTION_PAGE = 'section'
+PRODUCT_PAGE = 'product'
+
+SEGMENT_SUFFIX = '.pages'
+INDEX_SUFFIX = '.idx'
+
+_MAGIC = b'PGA1'
+_HEADER = struct.Struct('<4sIII')
+
+
+@dataclass
+class ArchiveEntry:
+    """
+    The index entry of an archived page.
+
+    Attributes:
+        offset (int): The offset of the record in its segment.
+        url (str): The URL of the page.
+        kind (str): SECTION_PAGE, PRODUCT_PAGE or None if unknown.
+        store (str): The name of the store the page was fetched for.
+        category (str): The name of the category the page was fetched for.
+        fetched_at (float): The Unix time of the fetch.
+    """
+    offset: int
+    url: str
+    kind: Optional[str]
+    store: str
+    category: str
+    fetched_at: float
+
+
+class PageArchive:
+    """
+    The writer of the page archive. Records are compressed and appended in a worker thread.
+
+    Attributes:
+        directory (str): The directory of the segments of the current crawl date.
+        segment_bytes (int): The size after which a new segment is started.
+        compression_level (int): The zlib compression level.
+        pages (int): The number of pages archived by this writer.
+    """
+
+    def __init__(self, directory: str = ARCHIVE_DIR, segment_bytes: int = ARCHIVE_SEGMENT_BYTES,
+                 compression_level: int = ARCHIVE_COMPRESSION_LEVEL):
+        started_at = datetime.now()
+        self.directory = os.path.join(directory, f'{started_at:%Y-%m-%d}')
+        self.segment_bytes = segment_bytes
+        self.compression_level = compression_level
+        self.pages = 0
+        self._prefix = f'{started_at:%Y%m%dT%H%M%S}-{os.getpid()}'
+        self._sequence = 0
+        self._segment = None
+        self._index = None
+        self._lock = asyncio.Lock()
+
+    async def append(self, url: str, kind: Optional[str], status: int, headers: Dict[str, str], text: str,
+                     fetched_at: Optional[float] = None):
+        """
+        Archive a fetched page. The store and category are taken from the crawl labels of the current job.
+
+        Args:
+            url (str): The URL of the page.
+            kind (str, optional): SECTION_PAGE or PRODUCT_PAGE.
+            status (int): The HTTP status.
+            headers (Dict[str, str]): The response headers.
+            text (str): The decoded body.
+            fetched_at (float, optional): The Unix time the server sent or confirmed the page, e.g. the time
+                a page served from the HTTP cache was cached. Defaults to now.
+        """
+        store, category = current_labels()
+        meta = {
+            'url': url, 'kind': kind, 'store': store, 'category': category,
+            'status': status, 'headers': headers, 'fetched_at': fetched_at or time.time(),
+        }
+        async with self._lock:
+            await asyncio.to_thread(self._append, meta, text)
+        self.pages += 1
+
+    def _append(self, meta: Dict[str, Any], text: str):
+        body = zlib.compress(text.encode('utf-8'), self.compression_level)
+        meta_data = json.dumps(meta, ensure_ascii=False).encode('utf-8')
+        if self._segment is None or self._segment.tell() >= self.segment_bytes:
+            self._open_segment()
+        offset = self._segment.tell()
+        self._segment.write(_HEADER.pack(_MAGIC, len(meta_data), len(body), zlib.crc32(body)))
+        self._segment.write(meta_data)
+        self._segment.write(body)
+        self._segment.flush()
+        entry = ArchiveEntry(offset, meta['url'], meta['kind'], meta['store'], meta['category'], meta['fetched_at'])
+        self._index.write(json.dumps(asdict(entry), ensure_ascii=False) + '\n')
+        self._index.flush()
+
+    def _open_segment(self):
+        self._close_files()
+        os.makedirs(self.directory, exist_ok=True)
+        self._sequence += 1
+        path = os.path.join(self.directory, f'{self._prefix}-{self._sequence:04d}')
+        self._segment = open(path + SEGMENT_SUFFIX, 'ab')
+        self._index = open(path + INDEX_SUFFIX, 'a', encoding='utf-8')
+
+    def _close_files(self):
+        for file in (self._segment, self._index):
+            if file is not None:
+                file.close()
+        self._segment = self._index = None
+
+    async def close(self):
+        async with self._lock:
+            await asyncio.to_thread(self._close_files)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+
+def find_segments(directory: str = ARCHIVE_DIR, date: Optional[str] = None) -> List[str]:
+    """
+    Find the archive segments, oldest first.
+
+    Args:
+        directory (str): The archive directory.
+        date (str, optional): Only the segments of this crawl date, YYYY-MM-DD.
+
+    Returns:
+        List[str]: The paths of the segments.
+    """
+    pattern = os.path.join(directory, date or '*', '*' + SEGMENT_SUFFIX)
+    return sorted(glob.glob(pattern), key=lambda path: (os.path.basename(os.path.dirname(path)),
+                                                        os.path.basename(path)))
+
+
+def read_index(segment_path: str) -> List[ArchiveEntry]:
+    """
+    Read the index of a segment, scanning the segment itself for the records the index lacks.
+
+    Args:
+        segment_path (str): The path of the segment.
+
+    Returns:
+        List[ArchiveEntry]: The entries in the order of the records.
+    """
+    entries: List[ArchiveEntry] = []
+    index_path = segment_path[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX
+    try:
+        with open(index_path, encoding='utf-8') as index:
+            for line in index:
+                try:
+                    entries.append(ArchiveEntry(**json.loads(line)))
+                except (ValueError, TypeError):
+                    # The last line of an interrupted write.
+                    break
+    except OSError:
+        pass
+    start = entries[-1].offset if entries else 0
+    with open(segment_path, 'rb') as segment:
+        if os.fstat(segment.fileno()).st_size <= start:
+            return entries
+        with mmap.mmap(segment.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if entries:
+                start = _next_record(data, start)
+            while start is not None:
+                meta = _read_meta(data, start)
+                if meta is None:
+                    break
+                entries.append(ArchiveEntry(start, meta['url'], meta.get('kind'), meta.get('store', ''),
+                                            meta.get('category', ''), meta.get('fetched_at', 0.0)))
+                start = _next_record(data, start)
+    return entries
+
+
+def _next_record(data, offset: int) -> Optional[int]:
+    if offset + _HEADER.size > len(data):
+        return None
+    magic, meta_length, body_length, _ = _HEADER.unpack_from(data, offset)
+    if magic != _MAGIC:
+        return None
+    end = offset + _HEADER.size + meta_length + body_length
+    return end if end + _HEADER.size <= len(data) else None
+
+
+def _read_meta(data, offset: int) -> Optional[Dict[str, Any]]:
+    if offset + _HEADER.size > len(data):
+        return None
+    magic, meta_length, body_length, _ = _HEADER.unpack_from(data, offset)
+    start = offset + _HEADER.size
+    if magic != _MAGIC or start + meta_length + body_length > len(data):
+        return None
+    return json.loads(data[start:start + meta_length])
+
+
+def read_record(data, offset: int) -> Tuple[Dict[str, Any], str]:
+    """
+    Read a record from a memory-mapped segment.
+
+    Args:
+        data: The segment, e.g. an mmap.
+        offset (int): The offset of the record.
+
+    Returns:
+        Tuple[Dict[str, Any], str]: The metadata and the decoded body.
+
+    Raises:
+        ValueError: If the record is damaged.
+    """
+    magic, meta_length, body_length, checksum = _HEADER.unpack_from(data, offset)
+    if magic != _MAGIC:
+        raise ValueError(f'Повреждённая запись архива по смещению {offset}')
+    start = offset + _HEADER.size
+    meta = json.loads(data[start:start + meta_length])
+    body = data[start + meta_length:start + meta_length + body_length]
+    if zlib.crc32(body) != checksum:
+        raise ValueError(f'Повреждённая запись архива по смещению {offset}')
+    return meta, zlib.decompress(body).decode('utf-8')
+
+
+def iter_records(segment_path: str, offsets: List[int]) -> Iterator[Tuple[Dict[str, Any], str]]:
+    """
+    Read records of a segment through a memory map. Damaged records are skipped.
+
+    Args:
+        segment_path (str): The path of the segment.
+        offsets (List[int]): The offsets of the records.
+
+    Yields:
+        Tuple[Dict[str, Any], str]: The metadata and the decoded body of each record.
+    """
+    with open(segment_path, 'rb') as segment, \
+            mmap.mmap(segment.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        for offset in offsets:
+            try:
+                yield read_record(data, offset)
+            except (ValueError, struct.error, zlib.error) as e:
+                print(f'Пропущена запись {segment_path}:{offset}: {e}')
@@ -0,0 +1,114 @@
+import asyncio
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Dict, List, Optional
+
+from config import PARSE_EXECUTOR, PARSE_WORKERS, PARSER_BACKEND
+from utils.metrics import metrics
+from .html_extractor import PARSER_BACKENDS, Selector, extract_details, extract_links
+from .structured_data import StructuredData, extract_details_with_fallback, extract_links_with_fallback
+
+
+class ParsePool:
+    """
+    A pool of workers that parses HTML documents off the event loop.
+
+    Parsing is CPU-bound, so running it on the event loop blocks all in-flight downloads.
+    ParsePool sends every document to a process or thread pool and returns only the extracted fields.
+
+    Attributes:
+        executor_type (str): 'process' or 'thread'.
+        workers (int): The number of workers in the pool.
+        backend (str): The HTML parser backend, one of PARSER_BACKENDS.
+    """
+
+    def __init__(self, executor_type: str = PARSE_EXECUTOR, workers: Optional[int] = PARSE_WORKERS,
+                 backend: str = PARSER_BACKEND):
+        """
+        Initialize the pool. The executor itself is created in start().
+
+        Args:
+            executor_type (str): 'process' or 'thread'.
+            workers (int, optional): The number of workers. Defaults to the number of CPU cores.
+            backend (str): The HTML parser backend, one of PARSER_BACKENDS.
+
+        Raises:
+            ValueError: If the executor type or the backend is unknown.
+        """
+        if executor_type not in ('process', 'thread'):
+            raise ValueError(f'Неизвестный тип пула парсинга: {executor_type}')
+        if backend not in PARSER_BACKENDS:
+            raise ValueError(f'Неизвестный HTML-парсер: {backend}')
+        self.executor_type = executor_type
+        self.workers = workers or os.cpu_count() or 1
+        self.backend = backend
+        self._executor: Optional[Executor] = None
+
+    def start(self):
+        """
+        Create the underlying executor.
+        """
+        if self._executor is not None:
+            return
+        if self.executor_type == 'process':
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='parse')
+
+    def close(self):
+        """
+        Shut the executor down and wait for running parse jobs.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    async def _run(self, func, *args):
+        if self._executor is None:
+            self.start()
+        loop = asyncio.get_running_loop()
+        with metrics.timer('parse'):
+            return await loop.run_in_executor(self._executor, partial(func, *args, backend=self.backend))
+
+    async def extract_links(self, html: str, selector: Selector,
+                            structured_data: Optional[StructuredData] = None) -> List[str]:
+        """
+        Extract the href attributes of all elements matching the selector in a worker.
+
+        Args:
+            html (str): The HTML content of the page.
+            selector (Selector): The selector of the link elements.
+            structured_data (StructuredData, optional): The embedded JSON of the store to read the links from first.
+
+        Returns:
+            List[str]: The href values in document order.
+        """
+        if structured_data:
+            return await self._run(extract_links_with_fallback, html, selector, structured_data)
+        return await self._run(extract_links, html, selector)
+
+    async def extract_details(self, html: str, selectors: Dict[str, Selector],
+                              structured_data: Optional[StructuredData] = None) -> Dict[str, str]:
+        """
+        Extract the product fields in a worker.
+
+        Args:
+            html (str): The HTML content of the page.
+            selectors (Dict[str, Selector]): The selectors of the product fields, keyed by field name.
+            structured_data (StructuredData, optional): The embedded JSON of the store to read the fields from first.
+                The selectors are used only for the fields it lacks.
+
+        Returns:
+            Dict[str, str]: The extracted text of each field.
+        """
+        if structured_data:
+            return await self._run(extract_details_with_fallback, html, selectors, structured_data)
+        return await self._run(extract_details, html, selectors)
@@ -1,20 +1,29 @@
 from .common_parser import CommonParser
-from .selectors import magnit_selectors, perekrestok_selectors
+from config import PARSE_STRUCTURED_DATA
+from .selectors import magnit_selectors, perekrestok_selectors, magnit_structured_data, perekrestok_structured_data
+from .http_client import HttpClient
+from .parse_pool import ParsePool
+from .page_archive import PageArchive
 
 
 # The ParserFactory class is responsible for creating and returning an instance of the CommonParser class.
-# It uses the store_name parameter to determine which selectors to use when creating the CommonParser instance.
+# It uses the store_name parameter to determine which selectors and which embedded JSON to use when creating
+# the CommonParser instance. The embedded JSON is skipped if PARSE_STRUCTURED_DATA is off.
 class ParserFactory:
-    # The create_parser method is a static method that takes three parameters: store_name, base_url, and section_url.
+    # The create_parser method is a static method that takes store_name, base_url, section_url and the shared
+    # http_client, parse_pool and optional page archive, which are injected into the parser.
     # It returns an instance of the CommonParser class.
     @staticmethod
-    def create_parser(store_name: str, base_url: str, section_url: str) -> CommonParser:
+    def create_parser(store_name: str, base_url: str, section_url: str, http_client: HttpClient,
+                      parse_pool: ParsePool, archive: PageArchive = None) -> CommonParser:
         # If the store_name is "Магнит", it creates a CommonParser instance with the magnit_selectors.
         if store_name == "Магнит":
-            return CommonParser(base_url, section_url, magnit_selectors)
+            return CommonParser(base_url, section_url, magnit_selectors, http_client, parse_pool,
+                                magnit_structured_data if PARSE_STRUCTURED_DATA else None, archive)
         # If the store_name is "Перекрёсток", it creates a CommonParser instance with the perekrestok_selectors.
         elif store_name == "Перекрёсток":
-            return CommonParser(base_url, section_url, perekrestok_selectors)
+            return CommonParser(base_url, section_url, perekrestok_selectors, http_client, parse_pool,
+                                perekrestok_structured_data if PARSE_STRUCTURED_DATA else None, archive)
         # If the store_name is neither "Магнит" nor "Перекрёсток", it raises a ValueError.
         else:
             raise ValueError(f"Неизвестный магазин: {store_name}")
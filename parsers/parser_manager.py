@@ -1,21 +1,163 @@
 import asyncio
-from config import STORES, SECTIONS
+from dataclasses import dataclass, field
+from typing import Optional, Set
+from config import (
+    STORES,
+    SECTIONS,
+    CRAWL_INCREMENTAL,
+    CRAWL_JOURNAL,
+    FRONTIER_ENABLED,
+    CRAWL_MAX_PAGES_PER_CATEGORY,
+    CRAWL_MAX_PRODUCTS_PER_CATEGORY,
+    METRICS_PORT,
+    METRICS_DUMP_PATH,
+    METRICS_LOOP_LAG_INTERVAL,
+    ARCHIVE_ENABLED,
+)
+from parsers.base_parser import BaseParser, NOT_MODIFIED
 from parsers.parser_factory import ParserFactory
+from parsers.http_client import HttpClient
+from parsers.parse_pool import ParsePool
+from parsers.page_archive import PageArchive
+from parsers.url_frontier import UrlFrontier
+from parsers.scheduler import CrawlScheduler, CrawlJob, SECTION_JOB, PRODUCT_JOB, section_priority
+from models.crawl_journal import CrawlJournal, JOB_PENDING, JOB_DONE, JOB_FAILED
 from models.database import async_session
-from models.product import Store, Category, Product
-from sqlalchemy.future import select
-from sqlalchemy.exc import IntegrityError
-from contextlib import asynccontextmanager
+from models.dimension_cache import DimensionCache
+from models.product_writer import ProductWriter
+from utils.url_normalizer import normalize_url
+from utils.metrics import MetricsServer, crawl_labels, metrics
+from contextlib import AsyncExitStack, asynccontextmanager
+
+
+@dataclass
+class SectionCrawl:
+    """
+    The state of the crawl of one section of one store.
+
+    Attributes:
+        store_name (str): The name of the store.
+        category_name (str): The name of the category.
+        store_id (int): The ID of the store.
+        category_id (int): The ID of the category.
+        parser (BaseParser): The parser of the section.
+        priority (int): The priority of the category in the crawl scheduler.
+        first_page (int): The first page of the section to crawl.
+        last_page (int): The last page of the section to crawl.
+        seen_links (Set[str]): The product links already submitted.
+        max_products (int): The number of product links after which the section ends.
+        end_page (int, optional): The page where the section turned out to end: the first page without new links,
+            or the page after the one that reached max_products. None while unknown.
+    """
+    store_name: str
+    category_name: str
+    store_id: int
+    category_id: int
+    parser: BaseParser
+    priority: int
+    first_page: int
+    last_page: int
+    seen_links: Set[str] = field(default_factory=set)
+    max_products: int = CRAWL_MAX_PRODUCTS_PER_CATEGORY
+    end_page: Optional[int] = None
 
 
 class ParserManager:
     """
     The ParserManager class is responsible for managing the parsing process.
-    It includes methods for creating sessions, getting or creating instances of models,
-    processing individual products, processing all products for a given store and category,
+    It includes methods for creating sessions, processing individual products and section pages,
     and running the entire parsing process.
+
+    Attributes:
+        stores (dict): Base URLs keyed by store name.
+        sections (dict): Section URLs keyed by category and store name.
+        http_client (HttpClient): The HTTP client shared by all parsers. It exists only while run() is executing.
+        parse_pool (ParsePool): The HTML parse pool shared by all parsers. It exists only while run() is executing.
+        writer (ProductWriter): The background writer that saves products in batches.
+            It exists only while run() is executing.
+        dimensions (DimensionCache): The in-memory cache of Store and Category IDs, loaded at the start of run().
+        scheduler (CrawlScheduler): The global crawl scheduler. It exists only while run() is executing.
+        archive (PageArchive): The archive of the fetched pages. It exists only while run() is executing
+            with ARCHIVE_ENABLED.
+        resume (int): The ID of the crawl run to resume, 0 for the latest unfinished one. None to start a new run.
+        journal (CrawlJournal): The journal of the crawl run. It exists only while run() is executing
+            with CRAWL_JOURNAL.
+        frontier (UrlFrontier): The frontier that deduplicates product links across sections. It exists only
+            while run() is executing with FRONTIER_ENABLED.
+        revalidate_products (bool): If True, product pages are always revalidated with the server,
+            even if the HTTP cache still holds a fresh copy.
     """
 
+    revalidate_products = False
+
+    def __init__(self, stores=None, sections=None, resume: Optional[int] = None):
+        """
+        Initialize the manager.
+
+        Args:
+            stores (dict, optional): Base URLs keyed by store name. Defaults to STORES from config.py.
+            sections (dict, optional): Section URLs keyed by category and store name. Defaults to SECTIONS.
+            resume (int, optional): The ID of the crawl run to resume, 0 for the latest unfinished one.
+        """
+        self.stores = stores if stores is not None else STORES
+        self.sections = sections if sections is not None else SECTIONS
+        self.resume = resume
+        self.http_client = None
+        self.parse_pool = None
+        self.writer = None
+        self.dimensions = DimensionCache()
+        self.scheduler = None
+        self.archive = None
+        self.journal = None
+        self.frontier = None
+
+    def create_parse_pool(self) -> ParsePool:
+        """
+        Create the parse pool of a run. Subclasses can override it, e.g. to time the parsing in benchmarks.
+        """
+        return ParsePool()
+
+    def create_http_client(self) -> HttpClient:
+        """
+        Create the HTTP client of a run. Subclasses can override it, e.g. to share rate limits between processes.
+        """
+        return HttpClient()
+
+    def create_section(self, category_name: str, store_name: str, offset: int = 0,
+                       pages: int = CRAWL_MAX_PAGES_PER_CATEGORY,
+                       max_products: int = CRAWL_MAX_PRODUCTS_PER_CATEGORY) -> SectionCrawl:
+        """
+        Create the crawl state of a section. Must be called while run() is executing.
+
+        Args:
+            category_name (str): The name of the category.
+            store_name (str): The name of the store.
+            offset (int): The number of section pages to skip.
+            pages (int): The number of section pages to crawl, starting after the skipped ones.
+            max_products (int): The number of product links after which the crawl of the section ends.
+
+        Returns:
+            SectionCrawl: The state of the section crawl.
+
+        Raises:
+            ValueError: If the store is unknown.
+        """
+        parser = ParserFactory.create_parser(
+            store_name, self.stores[store_name], self.sections[category_name][store_name],
+            self.http_client, self.parse_pool, self.archive
+        )
+        return SectionCrawl(
+            store_name=store_name,
+            category_name=category_name,
+            store_id=self.dimensions.store_id(store_name),
+            category_id=self.dimensions.category_id(category_name),
+            parser=parser,
+            priority=section_priority(category_name),
+            first_page=parser.first_page + offset,
+            last_page=parser.first_page + offset + pages - 1,
+            max_products=max_products,
+        )
+
     @asynccontextmanager
     async def get_session(self):
         """
@@ -25,105 +167,250 @@ class ParserManager:
         async with async_session() as session:
             yield session
 
-    async def get_or_create(self, session, model, name: str):
-        """
-        Asynchronous method to get or create an instance of a model.
-        If the instance does not exist, it is created and added to the session.
-        If an IntegrityError occurs during the creation, the session is rolled back and the instance is retrieved again.
-
-        Args:
-            session: The session to use for database operations.
-            model: The model class of the instance to get or create.
-            name: The name of the instance to get or create.
-
-        Returns:
-            The instance that was gotten or created.
-        """
-        result = await session.execute(select(model).filter(model.name == name))
-        instance = result.scalars().first()
-        if not instance:
-            instance = model(name=name)
-            try:
-                session.add(instance)
-                await session.commit()
-                await session.refresh(instance)
-            except IntegrityError:
-                await session.rollback()
-                result = await session.execute(select(model).filter(model.name == name))
-                instance = result.scalars().first()
-        return instance
-
-    async def process_product(self, store_id, category_id, parser, product_url, semaphore):
+    async def process_product(self, store_id, category_id, parser, product_url):
         """
         Asynchronous method to process a single product.
-        The product details are parsed and then added to the session.
-        If an error occurs during this process, the session is rolled back.
+        The product details are parsed and then queued to the batch writer.
+        In incremental mode, known products whose page has not changed since the last crawl are skipped
+        without parsing, and the writer skips products whose extracted fields have not changed.
 
         Args:
             store_id: The ID of the store the product belongs to.
             category_id: The ID of the category the product belongs to.
             parser: The parser to use for parsing the product details.
             product_url: The URL of the product to parse.
-            semaphore: The semaphore to use for limiting the number of concurrent tasks.
-        """
-        async with semaphore:
-            product_details = await parser.parse_product_details(product_url)
-            if product_details:
-                product_details['store_id'] = store_id
-                product_details['category_id'] = category_id
-                async with self.get_session() as session:
-                    try:
-                        product = Product(**product_details)
-                        session.add(product)
-                        await session.commit()
-                        print(f"Товар {product_details['name']} сохранен.")
-                    except Exception as e:
-                        print(f"Ошибка при сохранении товара: {e}")
-                        await session.rollback()
-                print(f'Товар:')
-                for key, value in product_details.items():
+
+        Returns:
+            ProductRecord: The parsed product. NOT_MODIFIED if the page has not changed, None if it could not be parsed.
+        """
+        url = normalize_url(product_url)
+        skip_unchanged = CRAWL_INCREMENTAL and self.writer.is_known(store_id, url)
+        product = await parser.parse_product_details(product_url, skip_unchanged, self.revalidate_products)
+        if product is NOT_MODIFIED:
+            print(f'Товар не изменился: {product_url}')
+        elif product:
+            product.store_id = store_id
+            product.category_id = category_id
+            product.url = url
+            if not await self.writer.put(product):
+                print(f'Товар не изменился: {product_url}')
+                return product
+            print(f'Товар:')
+            for key, value in product.items():
+                if value is not None:
                     print(f'{key.capitalize()}: {value}')
-                print('---')
+            print('---')
+        else:
+            print(f'Не удалось получить данные для товара: {product_url}')
+        return product
+
+    async def process_section_page(self, section, page):
+        """
+        Asynchronous method to process a single section page.
+        New product links of the page are submitted to the scheduler, followed by the next page of the section.
+        With a frontier, a product already found in another section is not fetched again, its category is only
+        attached to it. A product whose fetch failed in the section that claimed it is claimed again by the next
+        section that finds it.
+        The section ends when a page brings no new links, its last page is reached or
+        section.max_products links are found.
+
+        Args:
+            section (SectionCrawl): The state of the section crawl.
+            page (int): The page number.
+
+        Returns:
+            bool: False if the page could not be fetched.
+        """
+        page_links = await section.parser.parse_page_links(page)
+        if page_links is None:
+            return False
+        new_links = [link for link in page_links if link not in section.seen_links]
+        if not new_links:
+            section.end_page = page
+            return True
+        claimed = await self.frontier.claim(new_links) if self.frontier is not None else None
+        for link in new_links:
+            section.seen_links.add(link)
+            if claimed is None or link in claimed:
+                self.submit_product(section, link)
             else:
-                print(f'Не удалось получить данные для товара: {product_url}')
+                await self.writer.attach(section.store_id, normalize_url(link), section.category_id)
+            if len(section.seen_links) >= section.max_products:
+                section.end_page = page + 1
+                return True
+        if page < section.last_page:
+            self.submit_section_page(section, page + 1)
+        return True
+
+    def submit_product(self, section, link):
+        if self.journal is not None:
+            self.journal.record(PRODUCT_JOB, link, section.store_name, section.category_name, JOB_PENDING)
+        self.scheduler.submit(PRODUCT_JOB, link, section.priority, section)
 
-    async def process_products(self, store_name, base_url, section_url, category_name):
+    def submit_section_page(self, section, page):
+        url = section.parser.page_url(page)
+        if self.journal is not None:
+            self.journal.record(SECTION_JOB, url, section.store_name, section.category_name, JOB_PENDING, page)
+        self.scheduler.submit(SECTION_JOB, url, section.priority, section, page)
+
+    async def handle_job(self, job: CrawlJob):
         """
-        Asynchronous method to process all products for a given store and category.
-        A parser is created for the store and category, and then all product links are parsed and processed.
+        Asynchronous method that executes a job of the crawl scheduler.
 
         Args:
-            store_name: The name of the store to process products for.
-            base_url: The base URL of the store.
-            section_url: The URL of the section to process products for.
-            category_name: The name of the category to process products for.
-        """
-        parser = ParserFactory.create_parser(store_name, base_url, section_url)
-        async with self.get_session() as session:
-            store = await self.get_or_create(session, Store, store_name)
-            category = await self.get_or_create(session, Category, category_name)
-            store_id = store.id
-            category_id = category.id
-
-        product_links = await parser.parse_product_links()
-        semaphore = asyncio.Semaphore(10)
-        tasks = [self.process_product(store_id, category_id, parser, product_url, semaphore) for product_url in product_links]
-        await asyncio.gather(*tasks)
+            job (CrawlJob): A section page or product page job.
+        """
+        section = job.context
+        succeeded = False
+        try:
+            with crawl_labels(section.store_name, section.category_name):
+                if job.kind == SECTION_JOB:
+                    succeeded = await self.process_section_page(section, job.page)
+                else:
+                    product = await self.process_product(section.store_id, section.category_id, section.parser, job.url)
+                    succeeded = product is not None
+        except Exception:
+            self.record_job(job, False)
+            raise
+        self.record_job(job, succeeded)
+
+    def record_job(self, job: CrawlJob, succeeded: bool):
+        # A product that could not be fetched is released, so another section listing it may fetch it.
+        if self.frontier is not None and job.kind == PRODUCT_JOB and not succeeded:
+            self.frontier.release(job.url)
+        # A job interrupted by the end of the run is not recorded, so it stays pending in the journal.
+        if self.journal is not None:
+            section = job.context
+            self.journal.record(job.kind, job.url, section.store_name, section.category_name,
+                                JOB_DONE if succeeded else JOB_FAILED, job.page)
 
     async def run(self):
         """
         Asynchronous method to run the entire parsing process.
-        For each category and store, a task is created to process all products.
-        All tasks are then run concurrently.
-        """
-        tasks = []
-        for category_name, section_values in SECTIONS.items():
-            for store_name, base_url in STORES.items():
-                task = self.process_products(
-                    store_name,
-                    base_url,
-                    section_values[store_name],
-                    category_name
-                )
-                tasks.append(task)
-        await asyncio.gather(*tasks)
+        Store and category IDs are loaded once into the dimension cache.
+        A single HTTP client, parse pool and product writer are opened for the whole run and shared by all parsers.
+        The first page of each category and store is submitted to the crawl scheduler, whose workers then crawl
+        section pages and product pages from a single priority queue.
+        Stage metrics are collected during the run and summarized at the end. If METRICS_PORT is set, they are
+        served at /metrics while the run lasts; if METRICS_DUMP_PATH is set, they are saved there as JSON.
+        """
+        metrics.reset()
+        server = MetricsServer(metrics, METRICS_PORT) if METRICS_PORT else None
+        if server is not None:
+            await server.start()
+        lag_monitor = asyncio.create_task(metrics.monitor_loop_lag(METRICS_LOOP_LAG_INTERVAL))
+        try:
+            await self.crawl()
+        finally:
+            lag_monitor.cancel()
+            if server is not None:
+                await server.close()
+            print(metrics.summary())
+            if METRICS_DUMP_PATH:
+                metrics.dump(METRICS_DUMP_PATH)
+
+    async def crawl(self):
+        """
+        Asynchronous method that crawls all sections of all stores.
+        With FRONTIER_ENABLED, a product listed in several sections is fetched once. With CRAWL_JOURNAL, the crawl
+        is recorded in the crawl run journal, and a resumed run only crawls the pages that were not done.
+        """
+        await self.dimensions.load(self.stores, self.sections)
+        async with self.crawl_resources():
+            sections = [
+                self.create_section(category_name, store_name)
+                for category_name in self.sections
+                for store_name in self.stores
+            ]
+            async with AsyncExitStack() as stack:
+                if FRONTIER_ENABLED:
+                    self.frontier = await stack.enter_async_context(UrlFrontier())
+                    stack.callback(self.print_frontier_summary)
+                if CRAWL_JOURNAL or self.resume is not None:
+                    self.journal = await stack.enter_async_context(
+                        CrawlJournal(self.resume, before_flush=self.writer.sync)
+                    )
+                    print(f'Обход {self.journal.run_id}')
+                try:
+                    await self.crawl_sections(sections)
+                finally:
+                    self.journal = None
+
+    def print_frontier_summary(self):
+        frontier, self.frontier = self.frontier, None
+        print(f'Ссылок на товары: {frontier.claimed}, впервые найдено: {frontier.new}, '
+              f'найдено повторно в других разделах: {frontier.duplicates}')
+
+    @asynccontextmanager
+    async def crawl_resources(self):
+        """
+        Asynchronous context manager that opens the parse pool, the HTTP client, the product writer and,
+        with ARCHIVE_ENABLED, the page archive of a run and closes them when the block exits.
+        """
+        with self.create_parse_pool() as parse_pool:
+            async with self.create_http_client() as http_client, ProductWriter() as writer:
+                self.http_client = http_client
+                self.parse_pool = parse_pool
+                self.writer = writer
+                self.archive = PageArchive() if ARCHIVE_ENABLED else None
+                try:
+                    yield
+                finally:
+                    if self.archive is not None:
+                        await self.archive.close()
+                        print(f'Страниц сохранено в архив: {self.archive.pages}')
+                    self.http_client = None
+                    self.parse_pool = None
+                    self.writer = None
+                    self.archive = None
+            if writer.failures:
+                print(f'Не удалось сохранить товаров: {len(writer.failures)}')
+
+    async def crawl_sections(self, sections):
+        """
+        Asynchronous method that submits the first page of each section to a new crawl scheduler
+        and runs it until the sections are crawled.
+
+        Args:
+            sections (List[SectionCrawl]): The sections to crawl.
+        """
+        self.scheduler = CrawlScheduler(self.handle_job)
+        try:
+            if self.journal is not None and self.journal.entries:
+                self.resume_sections(sections)
+            else:
+                for section in sections:
+                    self.submit_section_page(section, section.first_page)
+            await self.scheduler.run()
+        finally:
+            self.scheduler = None
+
+    def resume_sections(self, sections):
+        """
+        Submit the unfinished pages of a resumed run. Pending and failed pages are submitted again, and the products
+        found before are not submitted twice. Sections that were not started are crawled from their first page.
+
+        Args:
+            sections (List[SectionCrawl]): The sections to crawl.
+        """
+        by_key = {(section.category_name, section.store_name): section for section in sections}
+        started = set()
+        done = 0
+        for entry in self.journal.entries:
+            section = by_key.get((entry.category, entry.store))
+            if section is None:
+                continue
+            started.add((entry.category, entry.store))
+            if entry.kind == PRODUCT_JOB:
+                section.seen_links.add(entry.url)
+            if entry.status == JOB_DONE:
+                done += 1
+            elif entry.kind == SECTION_JOB:
+                self.submit_section_page(section, entry.page)
+            else:
+                self.submit_product(section, entry.url)
+        for key, section in by_key.items():
+            if key not in started:
+                self.submit_section_page(section, section.first_page)
+        print(f'Продолжение обхода {self.journal.run_id}: выполнено страниц {done}, '
+              f'повторяется {len(self.journal.entries) - done}')
@@ -0,0 +1,62 @@
+from dataclasses import dataclass, fields
+from datetime import datetime
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+
+@dataclass(slots=True)
+class ProductRecord:
+    """
+    The result of parsing one product page.
+
+    A record holds only the extracted values, never the page or its tree, so it can be kept until it is written
+    without holding the HTML in memory. Slots keep it several times smaller than a dict with the same fields.
+
+    Attributes:
+        url (str): The URL of the product page.
+        name (str): The product name.
+        description (str): The product description.
+        price_new (str): The current price as scraped. ProductWriter parses it into a number.
+        price_old (str): The price before the discount as scraped.
+        article (str): The article number of the store.
+        rating (str): The customer rating as scraped.
+        availability (str): The availability text.
+        store_id (int): The ID of the store, set by ParserManager.
+        category_id (int): The ID of the category, set by ParserManager.
+        scraped_at (datetime): The time the page was fetched, set for archived pages. ProductWriter stamps
+            the time of the write otherwise.
+    """
+    url: str
+    name: Optional[str] = None
+    description: Optional[str] = None
+    price_new: Optional[Any] = None
+    price_old: Optional[Any] = None
+    article: Optional[str] = None
+    rating: Optional[Any] = None
+    availability: Optional[str] = None
+    store_id: Optional[int] = None
+    category_id: Optional[int] = None
+    scraped_at: Optional[datetime] = None
+
+    @classmethod
+    def from_fields(cls, url: str, extracted: Dict[str, str]) -> 'ProductRecord':
+        """
+        Build a record from the fields extracted by the parse pool. Fields without a column are dropped.
+
+        Args:
+            url (str): The URL of the product page.
+            extracted (Dict[str, str]): The extracted text of each field, keyed by field name.
+
+        Returns:
+            ProductRecord: The record.
+        """
+        return cls(url, **{name: value for name, value in extracted.items() if name in _FIELD_NAMES and name != 'url'})
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        """
+        Iterate over (field, value) pairs in declaration order.
+        """
+        for name in _FIELD_NAMES:
+            yield name, getattr(self, name)
+
+
+_FIELD_NAMES = tuple(field.name for field in fields(ProductRecord))
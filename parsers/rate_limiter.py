@@ -0,0 +1,237 @@
+import asyncio
+import multiprocessing
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import Dict, Mapping, Optional
+
+from config import (
+    RATE_LIMIT_MIN_RPS,
+    ADAPTIVE_INITIAL_CONCURRENCY,
+    ADAPTIVE_MIN_CONCURRENCY,
+    ADAPTIVE_DECREASE_FACTOR,
+    ADAPTIVE_LATENCY_FACTOR,
+    ADAPTIVE_LATENCY_WINDOW,
+    HTTP_BACKOFF_BASE,
+    HTTP_BACKOFF_MAX,
+)
+
+
+def parse_retry_after(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    """
+    Parse the Retry-After header, given either in seconds or as an HTTP date.
+
+    Args:
+        headers (Mapping[str, str]): The response headers.
+
+    Returns:
+        float: The delay in seconds. None if the header is missing or invalid.
+    """
+    value = (headers or {}).get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """
+    Calculate the delay before a retry: exponential backoff with full jitter, never shorter than Retry-After.
+
+    Args:
+        attempt (int): The number of the failed attempt, starting from 0.
+        retry_after (float, optional): The delay requested by the server.
+
+    Returns:
+        float: The delay in seconds.
+    """
+    delay = random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, HTTP_BACKOFF_MAX))
+    return delay
+
+
+class TokenBucket:
+    """
+    An asyncio token bucket that limits the request rate.
+
+    Attributes:
+        rate (float): Tokens added per second. Can be changed at any time.
+        burst (float): The capacity of the bucket.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """
+        Take one token, waiting until it is available.
+        """
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class HostController:
+    """
+    Adaptive rate and concurrency control for a single host.
+
+    Requests pass a token bucket and an adjustable concurrency limit. Both follow AIMD: every successful
+    request raises them additively up to the configured maximum, while throttling answers (429/503),
+    server errors, timeouts and latency above ADAPTIVE_LATENCY_FACTOR times the base latency cut them
+    multiplicatively. The latency is smoothed with a moving average, and the base latency is the lowest one
+    among the last ADAPTIVE_LATENCY_WINDOW responses, so it follows the host when its normal latency changes.
+    Only network round-trips of full responses are measured. A Retry-After answer also pauses all requests
+    to the host.
+
+    Attributes:
+        host (str): The host name.
+        max_rate (float): The maximum request rate per second.
+        max_concurrency (int): The maximum number of simultaneous requests.
+        concurrency (float): The current concurrency limit.
+    """
+
+    def __init__(self, host: str, max_rate: float, max_concurrency: int):
+        self.host = host
+        self.max_rate = max_rate
+        self.max_concurrency = max_concurrency
+        self.concurrency = float(min(ADAPTIVE_INITIAL_CONCURRENCY, max_concurrency))
+        self.bucket = TokenBucket(max_rate, max(1.0, max_rate))
+        self._in_flight = 0
+        self._condition = asyncio.Condition()
+        self._paused_until = 0.0
+        self._recent_latencies = deque(maxlen=ADAPTIVE_LATENCY_WINDOW)
+        self._latency: Optional[float] = None
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        Wait for a pause to end, a rate token and a free concurrency slot, and hold the slot for one request.
+        """
+        delay = self._paused_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await self.bucket.acquire()
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._in_flight < int(self.concurrency))
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self._in_flight -= 1
+                self._condition.notify_all()
+
+    def on_success(self, latency: Optional[float] = None):
+        """
+        Record a successful request and adapt the limits to its latency.
+
+        Args:
+            latency (float, optional): The network round-trip of a full response, sec. None for answers
+                that say nothing about the load of the host, e.g. 304 Not Modified.
+        """
+        if latency is not None:
+            self._recent_latencies.append(latency)
+            # A moving average keeps a single slow page from cutting the limits.
+            self._latency = latency if self._latency is None else 0.8 * self._latency + 0.2 * latency
+            if self._latency > min(self._recent_latencies) * ADAPTIVE_LATENCY_FACTOR:
+                self._latency = None
+                self._decrease()
+                return
+        self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+        self.bucket.rate = min(self.max_rate, self.bucket.rate + 1 / self.bucket.rate)
+
+    def on_throttle(self, retry_after: Optional[float] = None):
+        """
+        Record a throttling or server error answer.
+        """
+        self._decrease()
+        if retry_after:
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+
+    def on_error(self):
+        """
+        Record a connection error or a timeout.
+        """
+        self._decrease()
+
+    def _decrease(self):
+        self.concurrency = max(ADAPTIVE_MIN_CONCURRENCY, self.concurrency * ADAPTIVE_DECREASE_FACTOR)
+        self.bucket.rate = max(RATE_LIMIT_MIN_RPS, self.bucket.rate * ADAPTIVE_DECREASE_FACTOR)
+
+
+class SharedRateLimit:
+    """
+    Per-host request rate limits shared by the processes of a sharded crawl.
+
+    Every host has a slot in shared memory that holds the earliest time of its next request. A process reserves
+    the next free time under a lock and sleeps until then, so all processes together keep to the rate of the host.
+    time.monotonic() is a system-wide clock, so the times are comparable between processes.
+    The object must be passed to the worker processes when they are created.
+
+    Attributes:
+        intervals (Dict[str, float]): The minimum time between two requests, keyed by host name.
+    """
+
+    def __init__(self, host_rates: Dict[str, float], context=multiprocessing):
+        """
+        Args:
+            host_rates (Dict[str, float]): The maximum request rates per second, keyed by host name.
+                Requests to other hosts are not limited.
+            context: The multiprocessing context of the worker processes.
+        """
+        self.intervals = {host: 1 / rate for host, rate in host_rates.items() if rate > 0}
+        self._slots = {host: index for index, host in enumerate(self.intervals)}
+        self._next = context.Array('d', max(len(self._slots), 1))
+
+    def reserve(self, host: str) -> float:
+        """
+        Reserve the next request time of a host.
+
+        Returns:
+            float: The delay until the reserved time, sec.
+        """
+        index = self._slots.get(host)
+        if index is None:
+            return 0.0
+        with self._next.get_lock():
+            now = time.monotonic()
+            at = max(now, self._next[index])
+            self._next[index] = at + self.intervals[host]
+        return at - now
+
+    def pause(self, host: str, seconds: float):
+        """
+        Hold back the requests of all processes to a host, e.g. after a Retry-After answer.
+        """
+        index = self._slots.get(host)
+        if index is None:
+            return
+        with self._next.get_lock():
+            self._next[index] = max(self._next[index], time.monotonic() + seconds)
+
+    async def wait(self, host: str):
+        """
+        Wait for the next request time of a host.
+        """
+        delay = self.reserve(host)
+        if delay > 0:
+            await asyncio.sleep(delay)
@@ -0,0 +1,441 @@
+"""
+A long-running crawl daemon that recrawls products as often as their prices actually change.
+
+The daemon works in rounds of RECRAWL_INTERVAL seconds. Every RECRAWL_SECTION_INTERVAL, the sections are crawled
+to find new products; their links are added to the recrawl state instead of being fetched right away. Then each store
+gets its share of RECRAWL_BUDGET_PER_HOUR requests, minus the section pages it has just cost, and spends it on
+the products where a price change is most likely to be found.
+
+For every product, the state keeps the number of checks, the number of checks that found a changed price and the
+time the checks covered. The change rate is estimated from them as a Poisson process observed at irregular intervals
+(Cho and Garcia-Molina, "Estimating frequency of change"), shrunk towards the rate of the product's category while
+the product has few checks of its own. A product checked `age` seconds ago has then changed with the probability
+1 - exp(-rate * age), and each store's budget goes to the products with the highest probability. New products
+are checked first. Only the last RECRAWL_HISTORY_CHECKS checks count, so the estimate follows promotions as they
+start and end.
+
+The state is saved to RECRAWL_STATE_PATH after every round, so a restarted daemon keeps its estimates.
+
+Usage:
+    python -m parsers.recrawl --rounds 1
+"""
+import argparse
+import asyncio
+import heapq
+import json
+import math
+import os
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional, Set, Tuple
+
+from config import (
+    RECRAWL_STATE_PATH,
+    RECRAWL_INTERVAL,
+    RECRAWL_BUDGET_PER_HOUR,
+    RECRAWL_STORE_BUDGETS,
+    RECRAWL_SECTION_INTERVAL,
+    RECRAWL_DEFAULT_RATE,
+    RECRAWL_MIN_RATE,
+    RECRAWL_PRIOR_CHECKS,
+    RECRAWL_HISTORY_CHECKS,
+    RECRAWL_MAX_FAILURES,
+)
+from models.database import init_db
+from utils.data_cleaner import clean_price
+from utils.metrics import current_labels, metrics
+from utils.url_normalizer import normalize_url
+from .base_parser import NOT_MODIFIED
+from .parser_manager import ParserManager
+from .scheduler import CrawlScheduler, CrawlJob, SECTION_JOB, PRODUCT_JOB
+
+# The checks, changes and observed seconds summed over the products of a category.
+Totals = Tuple[float, float, float]
+
+
+def change_rate(checks: float, changes: float, observed: float) -> Optional[float]:
+    """
+    Estimate the change rate of a page from checks that only tell whether it has changed since the previous one.
+
+    Counting the changed checks underestimates the rate of a page that changes several times between checks,
+    so the estimator of Cho and Garcia-Molina is used: -log((n - X + 0.5) / (n + 0.5)) / (T / n),
+    where n is the number of checks, X the number of checks that found a change and T the observed time.
+
+    Args:
+        checks (float): The number of checks.
+        changes (float): The number of checks that found a change.
+        observed (float): The time covered by the checks, in seconds.
+
+    Returns:
+        float: The estimated number of changes per second. None without observations.
+    """
+    if checks <= 0 or observed <= 0:
+        return None
+    return max(0.0, -math.log((checks - changes + 0.5) / (checks + 0.5)) * checks / observed)
+
+
+@dataclass
+class UrlStats:
+    """
+    The recrawl state of a product page.
+
+    Attributes:
+        store (str): The name of the store.
+        category (str): The name of the category the product was found in.
+        url (str): The URL of the product page, as found in the section.
+        checked_at (float): The Unix time of the last check. None if the product has not been checked yet.
+        checks (float): The number of checks that followed a previous one.
+        changes (float): The number of those checks that found a changed price.
+        observed (float): The time covered by those checks, in seconds.
+        price (List[float]): The last seen new and old price.
+        failures (int): The number of failed checks in a row.
+    """
+    store: str
+    category: str
+    url: str
+    checked_at: Optional[float] = None
+    checks: float = 0.0
+    changes: float = 0.0
+    observed: float = 0.0
+    price: Optional[List[Optional[float]]] = None
+    failures: int = 0
+
+
+class RecrawlState:
+    """
+    The persisted state of the recrawl scheduler: the change statistics of every known product
+    and the time each section was last crawled.
+
+    Attributes:
+        urls (Dict[Tuple[str, str], UrlStats]): The products keyed by store name and normalized URL.
+        sections (Dict[Tuple[str, str], float]): The Unix time of the last crawl of each section,
+            keyed by category and store name.
+    """
+
+    def __init__(self):
+        self.urls: Dict[Tuple[str, str], UrlStats] = {}
+        self.sections: Dict[Tuple[str, str], float] = {}
+
+    @classmethod
+    def load(cls, path: str) -> 'RecrawlState':
+        """
+        Load the state saved by save(). A missing file gives an empty state.
+        """
+        state = cls()
+        try:
+            with open(path, encoding='utf-8') as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            return state
+        for item in data.get('urls', ()):
+            stats = UrlStats(**item)
+            state.urls[(stats.store, normalize_url(stats.url))] = stats
+        for item in data.get('sections', ()):
+            state.sections[(item['category'], item['store'])] = item['crawled_at']
+        return state
+
+    def save(self, path: str):
+        """
+        Save the state. The file is replaced atomically, so an interrupted save keeps the previous state.
+        """
+        data = {
+            'urls': [asdict(stats) for stats in self.urls.values()],
+            'sections': [
+                {'category': category, 'store': store, 'crawled_at': crawled_at}
+                for (category, store), crawled_at in self.sections.items()
+            ],
+        }
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path + '.tmp', 'w', encoding='utf-8') as file:
+            json.dump(data, file, ensure_ascii=False)
+        os.replace(path + '.tmp', path)
+
+    def section_due(self, category: str, store: str, now: float) -> bool:
+        crawled_at = self.sections.get((category, store))
+        return crawled_at is None or now - crawled_at >= RECRAWL_SECTION_INTERVAL
+
+    def discover(self, store: str, category: str, url: str) -> bool:
+        """
+        Add a product found in a section.
+
+        Returns:
+            bool: True if the product is new.
+        """
+        key = (store, normalize_url(url))
+        if key in self.urls:
+            return False
+        self.urls[key] = UrlStats(store, category, url)
+        return True
+
+    def observe(self, store: str, url: str, price: Optional[List[Optional[float]]], now: float) -> bool:
+        """
+        Record a successful check of a product.
+
+        Args:
+            store (str): The name of the store.
+            url (str): The URL of the product page.
+            price (List[float], optional): The new and old price. None if the page has not changed.
+            now (float): The Unix time of the check.
+
+        Returns:
+            bool: True if the price has changed since the previous check.
+        """
+        key = (store, normalize_url(url))
+        stats = self.urls.get(key)
+        if stats is None:
+            return False
+        changed = price is not None and stats.price is not None and price != stats.price
+        if stats.checked_at is not None:
+            if stats.checks >= RECRAWL_HISTORY_CHECKS:
+                # Older checks fade out, so the estimate follows the current behaviour of the price.
+                scale = (RECRAWL_HISTORY_CHECKS - 1) / RECRAWL_HISTORY_CHECKS
+                stats.checks *= scale
+                stats.changes *= scale
+                stats.observed *= scale
+            stats.checks += 1
+            stats.changes += changed
+            stats.observed += max(0.0, now - stats.checked_at)
+        if price is not None:
+            stats.price = price
+        stats.checked_at = now
+        stats.failures = 0
+        return changed
+
+    def fail(self, store: str, url: str):
+        """
+        Record a failed check. A product that fails RECRAWL_MAX_FAILURES times in a row is forgotten;
+        if it is still listed in its section, it is found again by the next section crawl.
+        """
+        key = (store, normalize_url(url))
+        stats = self.urls.get(key)
+        if stats is None:
+            return
+        stats.failures += 1
+        if stats.failures >= RECRAWL_MAX_FAILURES:
+            del self.urls[key]
+
+    def category_totals(self) -> Dict[Tuple[str, str], Totals]:
+        """
+        Sum the checks, changes and observed time of the products of each category, keyed by store and category.
+        """
+        totals: Dict[Tuple[str, str], List[float]] = defaultdict(lambda: [0.0, 0.0, 0.0])
+        for stats in self.urls.values():
+            total = totals[(stats.store, stats.category)]
+            total[0] += stats.checks
+            total[1] += stats.changes
+            total[2] += stats.observed
+        return {key: tuple(total) for key, total in totals.items()}
+
+    def category_rates(self) -> Dict[Tuple[str, str], float]:
+        """
+        Estimate the change rate of a product of each category, keyed by store and category.
+        Categories without observations are left out.
+        """
+        rates = {}
+        for key, (checks, changes, observed) in self.category_totals().items():
+            rate = change_rate(checks, changes, observed)
+            if rate is not None:
+                rates[key] = rate
+        return rates
+
+    @staticmethod
+    def rate(stats: UrlStats, totals: Dict[Tuple[str, str], Totals]) -> float:
+        """
+        Estimate the change rate of a product. The category contributes RECRAWL_PRIOR_CHECKS average checks,
+        so a product with few checks of its own is estimated mostly from its category.
+        """
+        checks, changes, observed = stats.checks, stats.changes, stats.observed
+        category_checks, category_changes, category_observed = totals.get((stats.store, stats.category), (0, 0, 0))
+        if category_checks > 0:
+            weight = RECRAWL_PRIOR_CHECKS / category_checks
+            checks += RECRAWL_PRIOR_CHECKS
+            changes += category_changes * weight
+            observed += category_observed * weight
+        rate = change_rate(checks, changes, observed)
+        return max(RECRAWL_DEFAULT_RATE if rate is None else rate, RECRAWL_MIN_RATE)
+
+    def plan(self, budgets: Dict[str, int], sections: Set[Tuple[str, str]], now: float) -> Dict[str, List[UrlStats]]:
+        """
+        Choose the products to check in a round.
+
+        Args:
+            budgets (Dict[str, int]): The number of requests each store may get, keyed by store name.
+            sections (Set[Tuple[str, str]]): The crawled sections, as (category, store). Products of other
+                sections are skipped.
+            now (float): The Unix time of the round.
+
+        Returns:
+            Dict[str, List[UrlStats]]: The products of each store, most likely to have changed first.
+        """
+        totals = self.category_totals()
+        candidates: Dict[str, List[Tuple[float, UrlStats]]] = defaultdict(list)
+        for stats in self.urls.values():
+            if (stats.category, stats.store) not in sections:
+                continue
+            if stats.checked_at is None:
+                value = math.inf
+            else:
+                value = 1 - math.exp(-self.rate(stats, totals) * max(0.0, now - stats.checked_at))
+            candidates[stats.store].append((value, stats))
+        return {
+            store: [stats for _, stats in heapq.nlargest(budgets.get(store, 0), values, key=lambda item: item[0])]
+            for store, values in candidates.items()
+        }
+
+
+class RecrawlDaemon(ParserManager):
+    """
+    The RecrawlDaemon class crawls the stores in rounds, spending a fixed request budget per store
+    on the products whose prices are most likely to have changed.
+
+    Attributes:
+        state_path (str): The file of the recrawl state.
+        interval (float): The duration of a round in seconds.
+        rounds (int): The number of rounds to run. None to run until interrupted.
+        state (RecrawlState): The recrawl state. It is loaded at the start of run().
+    """
+
+    # A check must ask the server: a fresh cached page would neither tell whether the price has changed
+    # nor cost a request of the budget. Pages with validators are revalidated with a conditional request.
+    revalidate_products = True
+
+    def __init__(self, stores=None, sections=None, state_path: str = RECRAWL_STATE_PATH,
+                 interval: float = RECRAWL_INTERVAL, rounds: Optional[int] = None):
+        super().__init__(stores, sections)
+        self.state_path = state_path
+        self.interval = interval
+        self.rounds = rounds
+        self.state = RecrawlState()
+        self._credit: Dict[str, float] = {}
+        self._round: Counter = Counter()
+        self._section_pages: Counter = Counter()
+
+    def round_budget(self, store_name: str) -> float:
+        """
+        The number of requests a store may get in one round.
+        """
+        return RECRAWL_STORE_BUDGETS.get(store_name, RECRAWL_BUDGET_PER_HOUR) * self.interval / 3600
+
+    async def crawl(self):
+        """
+        Asynchronous method that runs the rounds, saving the state after each of them.
+        """
+        await self.dimensions.load(self.stores, self.sections)
+        self.state = await asyncio.to_thread(RecrawlState.load, self.state_path)
+        loop = asyncio.get_running_loop()
+        completed = 0
+        async with self.crawl_resources():
+            try:
+                while self.rounds is None or completed < self.rounds:
+                    started_at = loop.time()
+                    await self.crawl_round()
+                    await asyncio.to_thread(self.state.save, self.state_path)
+                    completed += 1
+                    if self.rounds is None or completed < self.rounds:
+                        await asyncio.sleep(max(0.0, started_at + self.interval - loop.time()))
+            except BaseException:
+                self.state.save(self.state_path)
+                raise
+            finally:
+                self.print_category_rates()
+
+    async def crawl_round(self):
+        """
+        Asynchronous method that runs one round: the due sections are crawled for new products, then the budget
+        left to each store is spent on its products. A store that has overspent its budget makes up for it
+        in the next rounds; unused budget is not carried over.
+        """
+        self._round.clear()
+        self._section_pages.clear()
+        for store_name in self.stores:
+            budget = self.round_budget(store_name)
+            self._credit[store_name] = min(self._credit.get(store_name, 0.0) + budget, budget)
+
+        now = time.time()
+        due = [
+            (category_name, store_name)
+            for category_name in self.sections
+            for store_name in self.stores
+            if store_name in self.sections[category_name] and self.state.section_due(category_name, store_name, now)
+        ]
+        if due:
+            await self.crawl_sections([
+                self.create_section(category_name, store_name) for category_name, store_name in due
+            ])
+            for key in due:
+                self.state.sections[key] = now
+            for store_name, pages in self._section_pages.items():
+                self._credit[store_name] -= pages
+
+        budgets = {store_name: max(0, int(credit)) for store_name, credit in self._credit.items()}
+        sections = {
+            (category_name, store_name)
+            for category_name in self.sections
+            for store_name in self.stores
+            if store_name in self.sections[category_name]
+        }
+        planned = self.state.plan(budgets, sections, time.time())
+        crawls = {}
+        self.scheduler = CrawlScheduler(self.handle_job)
+        try:
+            for store_name, products in planned.items():
+                for stats in products:
+                    key = (stats.category, stats.store)
+                    if key not in crawls:
+                        crawls[key] = self.create_section(stats.category, stats.store)
+                    self.scheduler.submit(PRODUCT_JOB, stats.url, crawls[key].priority, crawls[key])
+                self._credit[store_name] -= len(products)
+            await self.scheduler.run()
+        finally:
+            self.scheduler = None
+        print(f"Раунд повторного обхода: страниц разделов {sum(self._section_pages.values())}, "
+              f"новых товаров {self._round['new']}, проверено товаров {self._round['checked']}, "
+              f"изменились цены {self._round['changed']}, всего товаров {len(self.state.urls)}")
+
+    async def handle_job(self, job: CrawlJob):
+        if job.kind == SECTION_JOB:
+            self._section_pages[job.context.store_name] += 1
+        await super().handle_job(job)
+
+    def submit_product(self, section, link):
+        # Links found in sections are only added to the state, the products are checked as the budget allows.
+        if self.state.discover(section.store_name, section.category_name, link):
+            self._round['new'] += 1
+
+    async def process_product(self, store_id, category_id, parser, product_url):
+        """
+        Asynchronous method that processes a product and records the result of the check in the state.
+        """
+        product = await super().process_product(store_id, category_id, parser, product_url)
+        store_name, _ = current_labels()
+        if product is None:
+            self.state.fail(store_name, product_url)
+            return product
+        price = None if product is NOT_MODIFIED else [clean_price(product.price_new), clean_price(product.price_old)]
+        changed = self.state.observe(store_name, product_url, price, time.time())
+        self._round['checked'] += 1
+        self._round['changed'] += changed
+        metrics.increment('recrawl', 'changed' if changed else 'unchanged')
+        return product
+
+    def print_category_rates(self):
+        rates = self.state.category_rates()
+        for (store_name, category_name), rate in sorted(rates.items(), key=lambda item: -item[1]):
+            print(f'{store_name} / {category_name}: изменений цены товара в день {rate * 86400:.2f}')
+
+
+async def main(args):
+    await init_db()
+    daemon = RecrawlDaemon(state_path=args.state, interval=args.interval, rounds=args.rounds)
+    await daemon.run()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Адаптивный повторный обход товаров')
+    parser.add_argument('--rounds', type=int, help='Количество раундов, по умолчанию - до остановки')
+    parser.add_argument('--interval', type=float, default=RECRAWL_INTERVAL, help='Длительность раунда, сек')
+    parser.add_argument('--state', default=RECRAWL_STATE_PATH, help='Файл состояния планировщика')
+    asyncio.run(main(parser.parse_args()))
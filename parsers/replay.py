@@ -0,0 +1,204 @@
+"""
+Parse archived product pages again without fetching them, e.g. after fixing a selector or adding a field.
+
+The pages of the archive (see parsers/page_archive.py) are split into chunks of REPLAY_CHUNK_SIZE records and
+parsed in a process pool. Each worker reads its records straight from the memory-mapped segment and extracts
+the fields with the selectors and the embedded JSON strategy that ParserFactory gives the store's parser.
+Only the latest copy of each product page is parsed. With --write, the products are saved through ProductWriter
+with the time the page was fetched as scraped_at, so only the ones whose fields changed are updated and products
+scraped after the page was archived are left as they are.
+
+Usage:
+    python -m parsers.replay --date 2026-10-18 --write
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timezone
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from config import STORES, ARCHIVE_DIR, PARSER_BACKEND, REPLAY_WORKERS, REPLAY_CHUNK_SIZE
+from models.dimension_cache import DimensionCache
+from models.product_writer import ProductWriter
+from utils.url_normalizer import normalize_url
+from .html_extractor import Selector, extract_details
+from .page_archive import ArchiveEntry, PRODUCT_PAGE, find_segments, iter_records, read_index
+from .parser_factory import ParserFactory
+from .product_record import ProductRecord
+from .structured_data import StructuredData, extract_details_with_fallback
+
+# The product field selectors and the embedded JSON strategy of each store, keyed by store name.
+Extraction = Dict[str, Tuple[Dict[str, Selector], Optional[StructuredData]]]
+
+
+def replay_chunk(segment_path: str, offsets: List[int], extraction: Extraction,
+                 backend: str) -> List[Tuple[str, str, str, float, Optional[Dict[str, str]]]]:
+    """
+    Parse archived product pages of one segment. Executed in the process pool.
+    A page that cannot be parsed gets None instead of its fields, so it does not stop the replay.
+
+    Args:
+        segment_path (str): The path of the segment.
+        offsets (List[int]): The offsets of the records to parse.
+        extraction (Extraction): The extraction settings of each store.
+        backend (str): The HTML parser backend, one of PARSER_BACKENDS.
+
+    Returns:
+        List[Tuple[str, str, str, float, Optional[Dict[str, str]]]]: The store, category, URL, fetch time and
+            extracted fields of each page.
+    """
+    results = []
+    for meta, text in iter_records(segment_path, offsets):
+        selectors, structured_data = extraction[meta['store']]
+        try:
+            if structured_data:
+                fields = extract_details_with_fallback(text, selectors, structured_data, backend)
+            else:
+                fields = extract_details(text, selectors, backend)
+        except Exception as e:
+            print(f"Ошибка при разборе страницы {meta['url']}: {e}")
+            fields = None
+        results.append((meta['store'], meta['category'], meta['url'], meta.get('fetched_at', 0.0), fields))
+    return results
+
+
+class ReplayRunner:
+    """
+    The ReplayRunner class parses the archived product pages again.
+
+    Attributes:
+        stores (dict): Base URLs keyed by store name. Pages of other stores are skipped.
+        directory (str): The archive directory.
+        date (str): Only the pages archived on this crawl date, YYYY-MM-DD. None for the whole archive.
+        workers (int): The number of worker processes. None for the number of CPU cores.
+        backend (str): The HTML parser backend.
+        write (bool): Save the products to the database.
+        pages (int): The number of parsed pages.
+        missing (Counter): The number of pages each field was not found on.
+        errors (int): The number of pages that could not be parsed.
+        categories (Set[str]): The categories of the planned pages.
+    """
+
+    def __init__(self, stores=None, directory: str = ARCHIVE_DIR, date: Optional[str] = None,
+                 workers: Optional[int] = REPLAY_WORKERS, backend: str = PARSER_BACKEND, write: bool = False):
+        self.stores = stores if stores is not None else STORES
+        self.directory = directory
+        self.date = date
+        self.workers = workers
+        self.backend = backend
+        self.write = write
+        self.pages = 0
+        self.missing: Counter = Counter()
+        self.errors = 0
+        self.categories: Set[str] = set()
+
+    def extraction(self) -> Extraction:
+        """
+        Get the extraction settings of each store from the parsers ParserFactory creates for them.
+        """
+        extraction = {}
+        for store_name, base_url in self.stores.items():
+            parser = ParserFactory.create_parser(store_name, base_url, '', None, None)
+            extraction[store_name] = (parser.selectors['product_details'], parser.structured_data)
+        return extraction
+
+    def plan(self) -> List[Tuple[str, List[int]]]:
+        """
+        Find the latest archived copy of each product page and split them into chunks.
+
+        Returns:
+            List[Tuple[str, List[int]]]: The segment path and the record offsets of each chunk.
+        """
+        latest: Dict[Tuple[str, str], Tuple[ArchiveEntry, str]] = {}
+        for segment_path in find_segments(self.directory, self.date):
+            for entry in read_index(segment_path):
+                if entry.kind != PRODUCT_PAGE or entry.store not in self.stores:
+                    continue
+                key = (entry.store, entry.url)
+                if key not in latest or latest[key][0].fetched_at <= entry.fetched_at:
+                    latest[key] = (entry, segment_path)
+        by_segment: Dict[str, List[int]] = {}
+        for entry, segment_path in latest.values():
+            by_segment.setdefault(segment_path, []).append(entry.offset)
+            if entry.category:
+                self.categories.add(entry.category)
+        chunks = []
+        for segment_path, offsets in by_segment.items():
+            # Records are read in file order, so the pages of the memory map are read ahead sequentially.
+            offsets.sort()
+            for start in range(0, len(offsets), REPLAY_CHUNK_SIZE):
+                chunks.append((segment_path, offsets[start:start + REPLAY_CHUNK_SIZE]))
+        return chunks
+
+    async def run(self):
+        """
+        Asynchronous method that parses the archived pages in the process pool and, with write set,
+        saves the products. Prints the number of pages, the speed and the fields that were not found.
+        """
+        started_at = time.perf_counter()
+        chunks = await asyncio.to_thread(self.plan)
+        extraction = self.extraction()
+        loop = asyncio.get_running_loop()
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            futures = [
+                loop.run_in_executor(executor, partial(replay_chunk, segment_path, offsets, extraction, self.backend))
+                for segment_path, offsets in chunks
+            ]
+            if self.write:
+                await self._save(futures)
+            else:
+                for future in asyncio.as_completed(futures):
+                    self._count(await future)
+
+        elapsed = time.perf_counter() - started_at
+        print(f'Разобрано страниц из архива: {self.pages} за {elapsed:.1f} сек ({self.pages / elapsed:.0f} стр/сек)'
+              if elapsed else f'Разобрано страниц из архива: {self.pages}')
+        for field, count in sorted(self.missing.items()):
+            print(f'Поле {field} не найдено на {count} страницах')
+        if self.errors:
+            print(f'Не удалось разобрать страниц: {self.errors}')
+
+    def _count(self, results: List[Tuple[str, str, str, float, Optional[Dict[str, Any]]]]):
+        for *_, fields in results:
+            self.pages += 1
+            if fields is None:
+                self.errors += 1
+                continue
+            for field, value in fields.items():
+                if isinstance(value, str) and value.endswith(' не найдено'):
+                    self.missing[field] += 1
+
+    async def _save(self, futures):
+        dimensions = DimensionCache()
+        await dimensions.load(self.stores, self.categories)
+        async with ProductWriter() as writer:
+            for future in asyncio.as_completed(futures):
+                chunk = await future
+                self._count(chunk)
+                for store_name, category_name, url, fetched_at, fields in chunk:
+                    if fields is None:
+                        continue
+                    product = ProductRecord.from_fields(url, fields)
+                    product.scraped_at = datetime.fromtimestamp(fetched_at, timezone.utc)
+                    product.store_id = dimensions.store_id(store_name)
+                    product.category_id = dimensions.category_id(category_name) if category_name else None
+                    product.url = normalize_url(url)
+                    await writer.put(product)
+        print(f'Сохранено товаров: {writer.written}, без изменений: {writer.skipped}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Повторный разбор страниц из архива')
+    parser.add_argument('--date', help='Дата обхода в формате ГГГГ-ММ-ДД, по умолчанию - весь архив')
+    parser.add_argument('--archive-dir', default=ARCHIVE_DIR, help='Каталог архива')
+    parser.add_argument('--workers', type=int, default=REPLAY_WORKERS, help='Количество процессов разбора')
+    parser.add_argument('--backend', default=PARSER_BACKEND, help='HTML-парсер')
+    parser.add_argument('--write', action='store_true', help='Сохранить товары в базу данных')
+    args = parser.parse_args()
+
+    runner = ReplayRunner(directory=args.archive_dir, date=args.date, workers=args.workers, backend=args.backend,
+                          write=args.write)
+    asyncio.run(runner.run())
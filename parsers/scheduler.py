@@ -0,0 +1,153 @@
+import asyncio
+import itertools
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from urllib.parse import urlsplit
+
+from config import CRAWL_WORKERS, CRAWL_MAX_FRONTIER, SECTION_PRIORITIES, DEFAULT_SECTION_PRIORITY
+
+SECTION_JOB = 'section'
+PRODUCT_JOB = 'product'
+
+
+@dataclass(order=True)
+class CrawlJob:
+    """
+    A single fetch job of the crawl.
+
+    Jobs are ordered by priority (lower first), then by the turn of their host, so that hosts with the
+    same priority take turns, and then by submission order.
+
+    Attributes:
+        priority (int): The priority of the job, lower runs first.
+        turn (int): The round-robin turn of the job's host.
+        sequence (int): The submission number of the job.
+        kind (str): SECTION_JOB for a section page, PRODUCT_JOB for a product page.
+        url (str): The URL to fetch.
+        context (Any): Data the job handler needs, e.g. the section the job belongs to.
+        page (int): The page number of a section job.
+    """
+    priority: int
+    turn: int
+    sequence: int
+    kind: str = field(compare=False)
+    url: str = field(compare=False)
+    context: Any = field(default=None, compare=False)
+    page: Optional[int] = field(default=None, compare=False)
+
+    @property
+    def host(self) -> str:
+        return urlsplit(self.url).hostname or ''
+
+
+def section_priority(category_name: str) -> int:
+    """
+    Get the priority of a category from SECTION_PRIORITIES, lower runs first.
+    """
+    return SECTION_PRIORITIES.get(category_name, DEFAULT_SECTION_PRIORITY)
+
+
+class CrawlScheduler:
+    """
+    A global crawl scheduler with a single priority queue of fetch jobs and a fixed pool of workers.
+
+    Product jobs of a category run before its next section page, so the frontier drains before it grows.
+    Jobs of the same priority are taken from the hosts in turn, so a large store does not starve the others.
+    The number of outstanding product jobs of the whole crawl is limited by max_frontier: while it is reached,
+    section pages are set aside instead of being expanded, which keeps memory bounded whatever the number
+    of sections. A section page may still exceed the budget by the links of one page.
+
+    Attributes:
+        handler (Callable[[CrawlJob], Awaitable[None]]): The coroutine that executes a job.
+        workers (int): The number of worker tasks.
+        max_frontier (int): The maximum number of outstanding product jobs.
+    """
+
+    def __init__(self, handler: Callable[[CrawlJob], Awaitable[None]], workers: int = CRAWL_WORKERS,
+                 max_frontier: int = CRAWL_MAX_FRONTIER):
+        self.handler = handler
+        self.workers = workers
+        self.max_frontier = max(1, max_frontier)
+        self._queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self._sequence = itertools.count()
+        self._host_turns: Dict[str, int] = defaultdict(int)
+        self._current_turn = 0
+        self._pending_products = 0
+        self._outstanding = 0
+        self._deferred: List[CrawlJob] = []
+        self._done = asyncio.Event()
+        self._done.set()
+
+    @property
+    def pending_products(self) -> int:
+        return self._pending_products
+
+    def frontier_full(self) -> bool:
+        return self._pending_products >= self.max_frontier
+
+    def submit(self, kind: str, url: str, priority: int, context: Any = None, page: Optional[int] = None):
+        """
+        Add a job to the queue.
+
+        Args:
+            kind (str): SECTION_JOB or PRODUCT_JOB.
+            url (str): The URL to fetch.
+            priority (int): The priority of the category; product jobs run before section pages of equal priority.
+            context (Any): Data the job handler needs.
+            page (int, optional): The page number of a section job.
+        """
+        host = urlsplit(url).hostname or ''
+        # A host that has been idle joins at the current turn instead of jumping ahead of the others.
+        turn = max(self._host_turns[host], self._current_turn)
+        self._host_turns[host] = turn + 1
+        job_priority = priority * 2 + (1 if kind == SECTION_JOB else 0)
+        self._put(CrawlJob(job_priority, turn, next(self._sequence), kind, url, context, page))
+        if kind == PRODUCT_JOB:
+            self._pending_products += 1
+
+    def _put(self, job: CrawlJob):
+        self._outstanding += 1
+        self._done.clear()
+        self._queue.put_nowait(job)
+
+    def _finish(self, job: CrawlJob):
+        if job.kind == PRODUCT_JOB:
+            self._pending_products -= 1
+            if self._deferred and not self.frontier_full():
+                for deferred in self._deferred:
+                    self._queue.put_nowait(deferred)
+                self._deferred.clear()
+        self._outstanding -= 1
+        if self._outstanding == 0:
+            self._done.set()
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                if job.kind == SECTION_JOB and self.frontier_full():
+                    # The section page waits aside until the product jobs drain, so that it can neither add
+                    # more of them nor keep the workers busy picking it up again.
+                    self._deferred.append(job)
+                    continue
+                self._current_turn = job.turn
+                try:
+                    await self.handler(job)
+                except Exception as e:
+                    print(f'Ошибка при обработке {job.url}: {e}')
+                self._finish(job)
+            finally:
+                self._queue.task_done()
+
+    async def run(self):
+        """
+        Run the workers until all submitted jobs, including the ones submitted while running, are done.
+        """
+        workers = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        try:
+            await self._done.wait()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
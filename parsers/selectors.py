@@ -1,5 +1,6 @@
 magnit_selectors = {
     'product_links': ('a', {'class': 'app-link product-card product-list__item'}),
+    'pagination': {'param': 'page', 'start': 1},
     'product_details': {
         'name': ('h1', {'class': 'm-page-header__title text--h1'}),
         'description': ('div', {'class': 'product-detail-text'}),
@@ -11,6 +12,7 @@ magnit_selectors = {
 
 perekrestok_selectors = {
     'product_links': ('a', {'class': 'product-card__link'}),
+    'pagination': {'param': 'page', 'start': 1},
     'product_details': {
         'name': ('h1', {'class': 'sc-fubCzh ibFUIH product__title'}),
         'price_new': ('div', {'class': 'price-new'}),
@@ -19,3 +21,28 @@ perekrestok_selectors = {
         'availability': ('div', {'class': 'price-card-balance-state'}),
     }
 }
+
+# Embedded JSON the stores ship their products in, read before the selectors (see parsers/structured_data.py).
+# The selectors above are used for the fields and links missing from it.
+magnit_structured_data = {
+    'json_ld': True,
+}
+
+perekrestok_structured_data = {
+    'json_ld': True,
+    'state': {
+        'script_id': '__NEXT_DATA__',
+        'product': 'props.pageProps.product',
+        'fields': {
+            'name': 'title',
+            'description': 'description',
+            'price_new': 'priceTag.price',
+            'price_old': 'priceTag.grossPrice',
+            'rating': 'rating',
+            'availability': 'balanceStateText',
+            'article': 'plu',
+        },
+        'products': 'props.pageProps.products',
+        'url': 'url',
+    },
+}
@@ -0,0 +1,338 @@
+"""
+Sharded crawling across several processes.
+
+A crawl is split into work units: a section of a store, or with CRAWL_SHARD_PAGES a range of its pages.
+ShardCoordinator hands the units out to CRAWL_SHARDS worker processes through a multiprocessing queue.
+Each worker has its own event loop, HTTP client, parse pool and database connection pool, and crawls one unit
+at a time with the regular ParserManager pipeline. The units of one section are handed out one after another,
+together with the number of products the section may still bring, so CRAWL_MAX_PRODUCTS_PER_CATEGORY holds
+for the whole section and not for each range of its pages. Per-host request rates are limited across all workers by a
+SharedRateLimit, and the metrics of the workers are merged into the metrics of the coordinator.
+
+The workers do not journal their pages, so with CRAWL_JOURNAL the coordinator only records the run itself as sharded:
+python main.py --resume refuses to continue it rather than resuming an older run.
+"""
+import asyncio
+import multiprocessing
+import os
+import queue
+from collections import deque
+from contextlib import AsyncExitStack
+from dataclasses import dataclass, replace
+from typing import Deque, Dict, List, Optional, Set, Tuple
+from urllib.parse import urlsplit
+
+from config import (
+    STORES,
+    SECTIONS,
+    CRAWL_SHARDS,
+    CRAWL_SHARD_PAGES,
+    CRAWL_JOURNAL,
+    CRAWL_MAX_PAGES_PER_CATEGORY,
+    CRAWL_MAX_PRODUCTS_PER_CATEGORY,
+    PARSE_WORKERS,
+    RATE_LIMIT_RPS,
+    HTTP_HOST_RATE_LIMITS,
+    METRICS_PORT,
+    METRICS_DUMP_PATH,
+    METRICS_LOOP_LAG_INTERVAL,
+)
+from models.crawl_journal import CrawlJournal
+from models.dimension_cache import DimensionCache
+from utils.metrics import MetricsServer, metrics
+from .http_client import HttpClient
+from .parse_pool import ParsePool
+from .parser_manager import ParserManager
+from .rate_limiter import SharedRateLimit
+from .scheduler import section_priority
+
+# Messages sent by the workers to the coordinator.
+STARTED = 'started'  # (STARTED, worker_id, unit)
+DONE = 'done'  # (DONE, worker_id, unit, end_offset, links, metrics)
+FINISHED = 'finished'  # (FINISHED, worker_id, metrics)
+
+
+@dataclass(frozen=True)
+class WorkUnit:
+    """
+    A range of pages of one section of one store.
+
+    Attributes:
+        category_name (str): The name of the category.
+        store_name (str): The name of the store.
+        offset (int): The number of section pages before the range.
+        pages (int): The number of pages in the range.
+        max_products (int): The number of product links the section may still bring, set when the unit is handed out.
+    """
+    category_name: str
+    store_name: str
+    offset: int
+    pages: int
+    max_products: int = CRAWL_MAX_PRODUCTS_PER_CATEGORY
+
+    @property
+    def section(self) -> Tuple[str, str]:
+        return self.category_name, self.store_name
+
+
+def plan_work_units(stores: Dict[str, str], sections: Dict[str, Dict[str, str]],
+                    pages_per_unit: int = CRAWL_SHARD_PAGES) -> List[WorkUnit]:
+    """
+    Split a crawl into work units.
+
+    The units are ordered by their offset first, so the first pages of all sections are crawled before the
+    later ranges, and the later ranges of a section that has turned out to be short can be dropped before
+    they are handed out. Units with the same offset are ordered by the section priority.
+
+    Args:
+        stores (Dict[str, str]): Base URLs keyed by store name.
+        sections (Dict[str, Dict[str, str]]): Section URLs keyed by category and store name.
+        pages_per_unit (int): The number of pages in a unit. 0 puts whole sections into units.
+
+    Returns:
+        List[WorkUnit]: The work units in the order they should be handed out.
+    """
+    size = pages_per_unit or CRAWL_MAX_PAGES_PER_CATEGORY
+    units = [
+        WorkUnit(category_name, store_name, offset, min(size, CRAWL_MAX_PAGES_PER_CATEGORY - offset))
+        for category_name in sections
+        for store_name in stores
+        for offset in range(0, CRAWL_MAX_PAGES_PER_CATEGORY, size)
+    ]
+    units.sort(key=lambda unit: (unit.offset, section_priority(unit.category_name)))
+    return units
+
+
+def host_rate_limits(stores: Dict[str, str]) -> Dict[str, float]:
+    """
+    Get the maximum request rate of each store host, as configured by RATE_LIMIT_RPS and HTTP_HOST_RATE_LIMITS.
+
+    Args:
+        stores (Dict[str, str]): Base URLs keyed by store name.
+
+    Returns:
+        Dict[str, float]: The maximum request rates per second, keyed by host name.
+    """
+    return {
+        urlsplit(base_url).hostname: HTTP_HOST_RATE_LIMITS.get(store_name, RATE_LIMIT_RPS)
+        for store_name, base_url in stores.items()
+    }
+
+
+class ShardWorker(ParserManager):
+    """
+    The ParserManager of a worker process. It crawls the work units it takes from the coordinator queue
+    one at a time, keeping the HTTP client, the parse pool and the product writer open between them.
+
+    Attributes:
+        worker_id (int): The number of the worker.
+        shards (int): The total number of workers.
+        tasks: The queue of work units. None tells the worker to stop.
+        results: The queue of messages to the coordinator.
+        rate_limit (SharedRateLimit): The rate limits shared by all workers.
+    """
+
+    def __init__(self, stores, sections, worker_id: int, shards: int, tasks, results, rate_limit: SharedRateLimit):
+        super().__init__(stores, sections)
+        self.worker_id = worker_id
+        self.shards = shards
+        self.tasks = tasks
+        self.results = results
+        self.rate_limit = rate_limit
+
+    def create_parse_pool(self) -> ParsePool:
+        # The cores are divided between the workers instead of every worker starting a process per core.
+        return ParsePool(workers=max(1, (PARSE_WORKERS or os.cpu_count() or 1) // self.shards))
+
+    def create_http_client(self) -> HttpClient:
+        return HttpClient(shared_rate_limit=self.rate_limit)
+
+    async def run(self):
+        """
+        Asynchronous method that crawls work units until the coordinator tells the worker to stop,
+        then sends the rest of its metrics to the coordinator.
+        """
+        metrics.reset()
+        lag_monitor = asyncio.create_task(metrics.monitor_loop_lag(METRICS_LOOP_LAG_INTERVAL))
+        try:
+            await self.crawl()
+        finally:
+            lag_monitor.cancel()
+            self.results.put((FINISHED, self.worker_id, metrics.to_dict()))
+
+    async def crawl(self):
+        """
+        Asynchronous method that crawls the work units. After each unit, the page where its section ended,
+        if known, the number of product links it found and the metrics collected since the previous report
+        are sent to the coordinator.
+        """
+        loop = asyncio.get_running_loop()
+        await self.dimensions.load(self.stores, self.sections)
+        async with self.crawl_resources():
+            while True:
+                unit = await loop.run_in_executor(None, self.tasks.get)
+                if unit is None:
+                    break
+                self.results.put((STARTED, self.worker_id, unit))
+                section = self.create_section(unit.category_name, unit.store_name, unit.offset, unit.pages,
+                                              unit.max_products)
+                await self.crawl_sections([section])
+                end_offset = section.end_page - section.parser.first_page if section.end_page is not None else None
+                self.results.put((DONE, self.worker_id, unit, end_offset, len(section.seen_links), metrics.to_dict()))
+                metrics.reset()
+
+
+def run_shard_worker(stores, sections, worker_id: int, shards: int, tasks, results, rate_limit: SharedRateLimit):
+    """
+    The entry point of a worker process.
+    """
+    asyncio.run(ShardWorker(stores, sections, worker_id, shards, tasks, results, rate_limit).run())
+
+
+class ShardCoordinator:
+    """
+    The ShardCoordinator class runs a crawl in several worker processes.
+    It has the same interface as ParserManager, so main.py can use either of them.
+
+    Attributes:
+        stores (dict): Base URLs keyed by store name.
+        sections (dict): Section URLs keyed by category and store name.
+        shards (int): The number of worker processes.
+        pages_per_unit (int): The number of section pages in a work unit, 0 for whole sections.
+        dimensions (DimensionCache): The cache of Store and Category IDs. The coordinator creates the missing rows
+            before the workers start, so they do not race to insert them.
+    """
+
+    def __init__(self, stores=None, sections=None, shards: int = CRAWL_SHARDS, pages_per_unit: int = CRAWL_SHARD_PAGES):
+        self.stores = stores if stores is not None else STORES
+        self.sections = sections if sections is not None else SECTIONS
+        self.shards = max(1, shards)
+        self.pages_per_unit = pages_per_unit
+        self.dimensions = DimensionCache()
+
+    async def run(self):
+        """
+        Asynchronous method to run the sharded crawl.
+        The merged metrics of all workers are summarized at the end, served at /metrics while the run lasts
+        if METRICS_PORT is set, and saved to METRICS_DUMP_PATH if it is set. With CRAWL_JOURNAL, the run is
+        recorded as a sharded crawl run.
+        """
+        metrics.reset()
+        server = MetricsServer(metrics, METRICS_PORT) if METRICS_PORT else None
+        if server is not None:
+            await server.start()
+        try:
+            async with AsyncExitStack() as stack:
+                if CRAWL_JOURNAL:
+                    journal = await stack.enter_async_context(CrawlJournal(sharded=True))
+                    print(f'Обход {journal.run_id}')
+                await self.crawl()
+        finally:
+            if server is not None:
+                await server.close()
+            print(metrics.summary())
+            if METRICS_DUMP_PATH:
+                metrics.dump(METRICS_DUMP_PATH)
+
+    async def crawl(self):
+        """
+        Asynchronous method that starts the workers, hands out the work units and waits for the workers to finish.
+
+        A unit is handed out only while fewer units than workers are waiting in the queue, and only while no other
+        unit of its section is waiting or running. It gets the number of product links its section may still bring,
+        and units of a section that has ended or reached CRAWL_MAX_PRODUCTS_PER_CATEGORY are dropped. The unit of
+        a worker that dies or fails is handed out once more to another worker.
+        """
+        await self.dimensions.load(self.stores, self.sections)
+        # Workers are spawned rather than forked, so they do not inherit the event loop and the database pool.
+        context = multiprocessing.get_context('spawn')
+        tasks = context.Queue()
+        results = context.Queue()
+        rate_limit = SharedRateLimit(host_rate_limits(self.stores), context)
+        workers = {
+            worker_id: context.Process(
+                target=run_shard_worker,
+                args=(self.stores, self.sections, worker_id, self.shards, tasks, results, rate_limit),
+                name=f'crawl-shard-{worker_id}',
+            )
+            for worker_id in range(self.shards)
+        }
+        for process in workers.values():
+            process.start()
+
+        pending: Deque[WorkUnit] = deque(plan_work_units(self.stores, self.sections, self.pages_per_unit))
+        section_ends: Dict[Tuple[str, str], int] = {}
+        section_links: Dict[Tuple[str, str], int] = {}
+        queued: Set[WorkUnit] = set()
+        assigned: Dict[int, WorkUnit] = {}
+        retried = set()
+        running = set(workers)
+        stopping = False
+        loop = asyncio.get_running_loop()
+
+        def retry(unit: Optional[WorkUnit]):
+            if unit is not None and (unit.section, unit.offset) not in retried:
+                retried.add((unit.section, unit.offset))
+                pending.appendleft(unit)
+
+        try:
+            while running:
+                busy = {unit.section for unit in queued} | {unit.section for unit in assigned.values()}
+                for unit in list(pending):
+                    if len(queued) >= len(running) or stopping:
+                        break
+                    if unit.section in busy:
+                        continue
+                    pending.remove(unit)
+                    remaining = CRAWL_MAX_PRODUCTS_PER_CATEGORY - section_links.get(unit.section, 0)
+                    if unit.offset >= section_ends.get(unit.section, unit.offset + 1) or remaining <= 0:
+                        continue
+                    unit = replace(unit, max_products=remaining)
+                    tasks.put(unit)
+                    queued.add(unit)
+                    busy.add(unit.section)
+                if not pending and not queued and not assigned and not stopping:
+                    for _ in running:
+                        tasks.put(None)
+                    stopping = True
+
+                message = await loop.run_in_executor(None, self._receive, results)
+                if message is None:
+                    for worker_id in [worker_id for worker_id in running if not workers[worker_id].is_alive()]:
+                        running.discard(worker_id)
+                        print(f'Процесс обхода {worker_id} завершился с кодом {workers[worker_id].exitcode}')
+                        retry(assigned.pop(worker_id, None))
+                    continue
+                kind, worker_id = message[0], message[1]
+                if kind == STARTED:
+                    assigned[worker_id] = message[2]
+                    queued.discard(message[2])
+                elif kind == DONE:
+                    _, _, unit, end_offset, links, data = message
+                    assigned.pop(worker_id, None)
+                    metrics.merge(data)
+                    section_links[unit.section] = section_links.get(unit.section, 0) + links
+                    if end_offset is not None:
+                        section_ends[unit.section] = min(section_ends.get(unit.section, end_offset), end_offset)
+                elif kind == FINISHED:
+                    # A worker that failed in the middle of a unit finishes without reporting it as done.
+                    metrics.merge(message[2])
+                    running.discard(worker_id)
+                    retry(assigned.pop(worker_id, None))
+        except BaseException:
+            for process in workers.values():
+                if process.is_alive():
+                    process.terminate()
+            raise
+        finally:
+            for process in workers.values():
+                await loop.run_in_executor(None, process.join)
+        if pending or assigned:
+            print(f'Не обработано единиц работы: {len(pending) + len(assigned)}')
+
+    @staticmethod
+    def _receive(results) -> Optional[tuple]:
+        try:
+            return results.get(timeout=1)
+        except queue.Empty:
+            return None
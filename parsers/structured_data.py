@@ -0,0 +1,263 @@
+"""
+Product data embedded in pages as JSON.
+
+Store pages carry their products as schema.org JSON-LD blocks and as the hydration state of their JavaScript
+frontend. Both are found by searching the raw HTML for their <script> tags with str.find(), without building
+a DOM or running a regex over the whole page, and decoded with orjson when it is installed. Fields that are
+missing from the JSON are extracted with the selectors, so a page without embedded data is parsed as before.
+
+The functions in this module are executed inside the parse pool, like the ones in parsers/html_extractor.py.
+
+A strategy is a dictionary of the same kind as the selectors in parsers/selectors.py:
+
+* 'json_ld': read schema.org Product and ItemList blocks;
+* 'state': read the hydration state, with the keys
+    * 'script_id': the id of the <script type="application/json"> tag holding the state, or
+    * 'variable': the name of the window variable the state is assigned to;
+    * 'product': the dotted path of the product object in the state of a product page;
+    * 'fields': the dotted paths of the product fields in the product object, keyed by field name;
+    * 'products': the dotted path of the product list in the state of a section page;
+    * 'url': the dotted path of the product link in an item of the list.
+"""
+import json
+from typing import Any, Dict, Iterator, List, Optional
+
+from .html_extractor import Selector, extract_details, extract_links
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+StructuredData = Dict[str, Any]
+
+# schema.org availability values, as the stores show them on the page.
+_AVAILABILITY = {
+    'InStock': 'В наличии',
+    'InStoreOnly': 'В наличии',
+    'OnlineOnly': 'В наличии',
+    'LimitedAvailability': 'Осталось мало',
+    'OutOfStock': 'Нет в наличии',
+    'SoldOut': 'Нет в наличии',
+    'Discontinued': 'Нет в наличии',
+    'PreOrder': 'Предзаказ',
+}
+
+
+def _loads(text: str) -> Any:
+    return orjson.loads(text) if orjson is not None else json.loads(text)
+
+
+def _decode(text: str) -> Any:
+    try:
+        return _loads(text.strip())
+    except ValueError:
+        return None
+
+
+def _script_bodies(html: str, marker: str) -> Iterator[str]:
+    """
+    Iterate over the contents of the <script> tags whose opening tag contains the marker.
+    """
+    start = 0
+    while True:
+        index = html.find(marker, start)
+        if index < 0:
+            return
+        tag_start = html.rfind('<', 0, index)
+        tag_end = html.find('>', index)
+        if tag_end < 0:
+            return
+        start = tag_end + 1
+        if tag_start < 0 or html.find('>', tag_start, index) >= 0 or html[tag_start:tag_start + 7].lower() != '<script':
+            continue
+        close = html.find('</script', start)
+        if close < 0:
+            close = html.find('</SCRIPT', start)
+        if close < 0:
+            return
+        yield html[start:close]
+        start = close
+
+
+def _state(html: str, strategy: StructuredData) -> Any:
+    state = strategy.get('state')
+    if not state:
+        return None
+    if 'script_id' in state:
+        for body in _script_bodies(html, state['script_id']):
+            return _decode(body)
+        return None
+    index = html.find(f"window.{state['variable']}")
+    if index < 0:
+        return None
+    assignment = html.find('=', index)
+    close = html.find('</script', assignment)
+    if assignment < 0 or close < 0:
+        return None
+    return _decode(html[assignment + 1:close].strip().rstrip(';'))
+
+
+def _path(data: Any, path: str) -> Any:
+    for key in path.split('.') if path else ():
+        if isinstance(data, dict):
+            data = data.get(key)
+        elif isinstance(data, list) and key.isdigit() and int(key) < len(data):
+            data = data[int(key)]
+        else:
+            return None
+    return data
+
+
+def _json_ld_items(html: str) -> Iterator[Dict[str, Any]]:
+    """
+    Iterate over the JSON-LD objects of a page, including the ones in lists and @graph.
+    """
+    for body in _script_bodies(html, 'application/ld+json'):
+        pending = [_decode(body)]
+        while pending:
+            item = pending.pop()
+            if isinstance(item, list):
+                pending.extend(reversed(item))
+            elif isinstance(item, dict):
+                yield item
+                if isinstance(item.get('@graph'), list):
+                    pending.extend(reversed(item['@graph']))
+
+
+def _has_type(item: Dict[str, Any], type_name: str) -> bool:
+    types = item.get('@type')
+    return type_name in types if isinstance(types, list) else types == type_name
+
+
+def _text(value: Any) -> Optional[str]:
+    if value is None or isinstance(value, (dict, list)):
+        return None
+    text = str(value).strip()
+    return text or None
+
+
+def _first(value: Any) -> Any:
+    return value[0] if isinstance(value, list) and value else value
+
+
+def _json_ld_product(item: Dict[str, Any]) -> Dict[str, str]:
+    offer = _first(item.get('offers')) or {}
+    price = offer.get('price', offer.get('lowPrice'))
+    old_price = None
+    for specification in offer.get('priceSpecification') or ():
+        if isinstance(specification, dict) and str(specification.get('priceType', '')).endswith(
+                ('StrikethroughPrice', 'ListPrice')):
+            old_price = specification.get('price')
+    availability = _text(offer.get('availability'))
+    if availability is not None:
+        availability = availability.rstrip('/').rsplit('/', 1)[-1]
+        availability = _AVAILABILITY.get(availability, availability)
+    fields = {
+        'name': _text(item.get('name')),
+        'description': _text(item.get('description')),
+        'price_new': _text(price),
+        'price_old': _text(old_price),
+        'article': _text(item.get('sku') or item.get('productID') or item.get('mpn')),
+        'rating': _text((item.get('aggregateRating') or {}).get('ratingValue')),
+        'availability': availability,
+    }
+    return {field: value for field, value in fields.items() if value is not None}
+
+
+def extract_structured_fields(html: str, strategy: StructuredData) -> Dict[str, str]:
+    """
+    Extract the product fields embedded in a product page as JSON.
+
+    Args:
+        html (str): The HTML content of the page.
+        strategy (StructuredData): The sources of embedded data of the store.
+
+    Returns:
+        Dict[str, str]: The fields found in the JSON-LD Product block, completed with the hydration state.
+    """
+    found: Dict[str, str] = {}
+    if strategy.get('json_ld'):
+        for item in _json_ld_items(html):
+            if _has_type(item, 'Product'):
+                found = _json_ld_product(item)
+                break
+    state = strategy.get('state')
+    if state and 'product' in state:
+        product = _path(_state(html, strategy), state['product'])
+        if isinstance(product, dict):
+            for field, path in state.get('fields', {}).items():
+                value = _text(_path(product, path))
+                if value is not None:
+                    found.setdefault(field, value)
+    return found
+
+
+def extract_structured_links(html: str, strategy: StructuredData) -> List[str]:
+    """
+    Extract the product links embedded in a section page as JSON.
+
+    Args:
+        html (str): The HTML content of the page.
+        strategy (StructuredData): The sources of embedded data of the store.
+
+    Returns:
+        List[str]: The links of the JSON-LD ItemList, or of the product list of the hydration state.
+    """
+    if strategy.get('json_ld'):
+        for item in _json_ld_items(html):
+            if _has_type(item, 'ItemList'):
+                links = []
+                for element in item.get('itemListElement') or ():
+                    if isinstance(element, dict):
+                        link = _text(element.get('url') or _path(element, 'item.url') or _path(element, 'item.@id'))
+                        if link:
+                            links.append(link)
+                if links:
+                    return links
+    state = strategy.get('state')
+    if state and 'products' in state:
+        products = _path(_state(html, strategy), state['products'])
+        if isinstance(products, list):
+            links = [_text(_path(product, state.get('url', 'url'))) for product in products]
+            return [link for link in links if link]
+    return []
+
+
+def extract_details_with_fallback(html: str, selectors: Dict[str, Selector], strategy: StructuredData,
+                                  backend: str = 'html.parser') -> Dict[str, str]:
+    """
+    Extract the product fields from the embedded JSON and the missing ones with the selectors.
+    The page is parsed into a tree only if some of the fields are missing from the JSON.
+
+    Args:
+        html (str): The HTML content of the page.
+        selectors (Dict[str, Selector]): The selectors of the product fields, keyed by field name.
+        strategy (StructuredData): The sources of embedded data of the store.
+        backend (str): The parser backend of the fallback, one of PARSER_BACKENDS.
+
+    Returns:
+        Dict[str, str]: The extracted text of each field. Missing fields get a "не найдено" placeholder.
+    """
+    found = extract_structured_fields(html, strategy)
+    missing = {field: selector for field, selector in selectors.items() if field not in found}
+    if missing:
+        found.update(extract_details(html, missing, backend))
+    return found
+
+
+def extract_links_with_fallback(html: str, selector: Selector, strategy: StructuredData,
+                                backend: str = 'html.parser') -> List[str]:
+    """
+    Extract the product links from the embedded JSON, or with the selector if the page has none.
+
+    Args:
+        html (str): The HTML content of the page.
+        selector (Selector): The selector of the link elements.
+        strategy (StructuredData): The sources of embedded data of the store.
+        backend (str): The parser backend of the fallback, one of PARSER_BACKENDS.
+
+    Returns:
+        List[str]: The links in page order.
+    """
+    return extract_structured_links(html, strategy) or extract_links(html, selector, backend)
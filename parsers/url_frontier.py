@@ -0,0 +1,189 @@
+"""
+The frontier of product links: every product is fetched once per crawl, however many sections list it.
+
+Links are canonicalized with normalize_url() (scheme and host case, fragment, tracking parameters, trailing slash)
+and claimed by the first section that finds them; the other sections only attach their category to the product.
+If the product cannot be fetched, its link is released, and the next section that finds it claims it again.
+
+Every link ever found is kept in an exact set on disk, a SQLite table of the canonical URLs with the number of the
+run that last claimed them. Two Bloom filters keep the lookups in memory: one of the links claimed in the current run,
+and one of all links ever found, saved next to the table between runs. Both take a fixed amount of memory whatever
+the number of links. The table is only read when the filter of the run reports a link as already claimed, which
+is either a true duplicate or a rare false positive; new links are written to the table in batches.
+"""
+import asyncio
+import os
+import sqlite3
+from typing import Dict, Iterable, Optional, Set
+
+from config import FRONTIER_PATH, FRONTIER_RUN_CAPACITY, FRONTIER_CAPACITY, FRONTIER_ERROR_RATE, FRONTIER_BATCH_SIZE
+from utils.bloom_filter import BloomFilter
+from utils.url_normalizer import normalize_url
+
+BLOOM_SUFFIX = '.bloom'
+
+# SQLite limits the number of parameters of a statement.
+_LOOKUP_CHUNK = 500
+
+
+class UrlFrontier:
+    """
+    The UrlFrontier class deduplicates the product links of a crawl across sections and runs.
+
+    Attributes:
+        path (str): The SQLite file of the set of all links.
+        run (int): The number of the current run. Set by open().
+        claimed (int): The number of links claimed in this run.
+        new (int): The number of claimed links that were never found before.
+        duplicates (int): The number of links found again in another section of this run.
+    """
+
+    def __init__(self, path: str = FRONTIER_PATH, run_capacity: int = FRONTIER_RUN_CAPACITY,
+                 capacity: int = FRONTIER_CAPACITY, error_rate: float = FRONTIER_ERROR_RATE,
+                 batch_size: int = FRONTIER_BATCH_SIZE):
+        self.path = path
+        self.run: Optional[int] = None
+        self.claimed = 0
+        self.new = 0
+        self.duplicates = 0
+        self._capacity = capacity
+        self._error_rate = error_rate
+        self._batch_size = batch_size
+        self._run_filter = BloomFilter(run_capacity, error_rate)
+        self._seen_filter: Optional[BloomFilter] = None
+        self._connection: Optional[sqlite3.Connection] = None
+        self._unwritten: Dict[str, int] = {}
+        # The Bloom filter of the run cannot forget a link, so released links are kept apart.
+        self._released: Set[str] = set()
+        self._lock = asyncio.Lock()
+
+    async def open(self):
+        """
+        Open the set of all links, load the filter of all links and start a new run.
+        """
+        async with self._lock:
+            await asyncio.to_thread(self._open)
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.executescript(
+            'CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY, run INTEGER NOT NULL) WITHOUT ROWID;'
+            'CREATE TABLE IF NOT EXISTS runs (run INTEGER PRIMARY KEY);'
+        )
+        self.run = self._connection.execute('INSERT INTO runs DEFAULT VALUES').lastrowid
+        self._connection.commit()
+        try:
+            with open(self.path + BLOOM_SUFFIX, 'rb') as file:
+                self._seen_filter = BloomFilter.from_bytes(file.read(), self._capacity, self._error_rate)
+        except (OSError, ValueError):
+            # The filter is missing, or the settings have changed since it was saved.
+            self._seen_filter = BloomFilter(self._capacity, self._error_rate)
+            for (url,) in self._connection.execute('SELECT url FROM urls'):
+                self._seen_filter.add(url)
+
+    async def claim(self, links: Iterable[str]) -> Set[str]:
+        """
+        Claim the links of a section page for the current run.
+
+        Args:
+            links (Iterable[str]): The product links.
+
+        Returns:
+            Set[str]: The links, as given, that were not claimed in this run before and should be fetched.
+        """
+        claimed: Set[str] = set()
+        maybe_claimed: Dict[str, str] = {}
+        for link in links:
+            url = normalize_url(link)
+            if url in self._released:
+                self._released.discard(url)
+                self._claim(url)
+                claimed.add(link)
+            elif url in maybe_claimed or url in self._unwritten:
+                self.duplicates += 1
+            elif self._run_filter.add(url):
+                maybe_claimed[url] = link
+            else:
+                self._claim(url)
+                claimed.add(link)
+        if maybe_claimed:
+            async with self._lock:
+                runs = await asyncio.to_thread(self._lookup, list(maybe_claimed))
+            for url, link in maybe_claimed.items():
+                if runs.get(url) == self.run or url in self._unwritten:
+                    self.duplicates += 1
+                else:
+                    # A false positive of the filter.
+                    self._claim(url)
+                    claimed.add(link)
+        if len(self._unwritten) >= self._batch_size:
+            await self.flush()
+        return claimed
+
+    def release(self, link: str):
+        """
+        Give up the claim of a link whose product could not be fetched, so another section may claim it.
+
+        Args:
+            link (str): The product link.
+        """
+        self._released.add(normalize_url(link))
+        self.claimed -= 1
+
+    def _claim(self, url: str):
+        self.claimed += 1
+        if not self._seen_filter.add(url):
+            self.new += 1
+        self._unwritten[url] = self.run
+
+    def _lookup(self, urls) -> Dict[str, int]:
+        runs = {}
+        for start in range(0, len(urls), _LOOKUP_CHUNK):
+            chunk = urls[start:start + _LOOKUP_CHUNK]
+            placeholders = ','.join('?' * len(chunk))
+            runs.update(self._connection.execute(f'SELECT url, run FROM urls WHERE url IN ({placeholders})', chunk))
+        return runs
+
+    async def flush(self):
+        """
+        Write the claimed links to disk.
+        """
+        if not self._unwritten:
+            return
+        async with self._lock:
+            rows, self._unwritten = self._unwritten, {}
+            await asyncio.to_thread(self._write, rows)
+
+    def _write(self, rows: Dict[str, int]):
+        self._connection.executemany(
+            'INSERT INTO urls (url, run) VALUES (?, ?) ON CONFLICT (url) DO UPDATE SET run = excluded.run',
+            rows.items(),
+        )
+        self._connection.commit()
+
+    async def close(self):
+        """
+        Write the claimed links and the filter of all links and close the set.
+        """
+        await self.flush()
+        async with self._lock:
+            await asyncio.to_thread(self._close)
+
+    def _close(self):
+        if self._connection is None:
+            return
+        self._connection.close()
+        self._connection = None
+        with open(self.path + BLOOM_SUFFIX + '.tmp', 'wb') as file:
+            file.write(self._seen_filter.to_bytes())
+        os.replace(self.path + BLOOM_SUFFIX + '.tmp', self.path + BLOOM_SUFFIX)
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
@@ -0,0 +1,55 @@
+"""
+Tests of the vectorized price statistics against the definitions of the SQL aggregates they replace.
+"""
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from comparator.services.columnar import group_statistics
+
+
+def percentile_cont(prices, q):
+    prices = sorted(prices)
+    position = q * (len(prices) - 1)
+    lower = int(position)
+    upper = min(lower + 1, len(prices) - 1)
+    return prices[lower] + (position - lower) * (prices[upper] - prices[lower])
+
+
+def percent_rank(price, prices):
+    if len(prices) == 1:
+        return 0.0
+    return sum(other < price for other in prices) / (len(prices) - 1)
+
+
+def sql_statistics(prices, trim_fraction):
+    mean = sum(prices) / len(prices)
+    kept = [price for price in prices if trim_fraction <= percent_rank(price, prices) <= 1 - trim_fraction]
+    return {
+        'count': len(prices),
+        'mean': mean,
+        'median': percentile_cont(prices, 0.5),
+        'trimmed_mean': sum(kept) / len(kept) if kept else mean,
+        'p10': percentile_cont(prices, 0.1),
+        'p90': percentile_cont(prices, 0.9),
+        'min_price': min(prices),
+        'max_price': max(prices),
+    }
+
+
+@pytest.mark.parametrize('trim_fraction', [0.0, 0.1, 0.25, 0.5])
+def test_group_statistics_match_sql_definitions(trim_fraction):
+    rng = np.random.default_rng(7)
+    sizes = [1, 2, 3, 5, 10, 37]
+    codes = np.repeat(np.arange(len(sizes)), sizes)
+    # Rounded prices give ties, which percent_rank ranks together.
+    prices = np.round(rng.uniform(10, 20, len(codes)), 0)
+    shuffle = rng.permutation(len(codes))
+    codes, prices = codes[shuffle], prices[shuffle]
+
+    statistics = group_statistics(codes, prices, trim_fraction)
+
+    for code in range(len(sizes)):
+        expected = sql_statistics(prices[codes == code].tolist(), trim_fraction)
+        for name, value in expected.items():
+            assert statistics[name][code] == pytest.approx(value), (code, name)
@@ -0,0 +1,34 @@
+"""
+Tests of the price and rating normalization of scraped columns.
+"""
+import pytest
+
+from utils.data_cleaner import clean_price, clean_prices, clean_ratings
+
+
+@pytest.mark.parametrize('text, price', [
+    ('1 299,90 ₽', 1299.9),
+    ('2 349,00 ₽', 2349.0),
+    ('1.299,00', 1299.0),
+    ('1,299.00', 1299.0),
+    ('1299.90', 1299.9),
+    ('12,5', 12.5),
+    ('89 ₽ 90 коп', 89.9),
+    ('89 ₽ 9 коп', 89.09),
+    (449.99, 449.99),
+    ('Price_old не найдено', None),
+    ('0,00 ₽', None),
+    (None, None),
+])
+def test_clean_price(text, price):
+    assert clean_price(text) == price
+
+
+def test_clean_prices_keeps_one_value_per_row():
+    assert clean_prices(['99,99 ₽', None, '', 'нет в наличии', 'a\x00 1.299,00', 15]) == [
+        99.99, None, None, None, 1299.0, 15.0,
+    ]
+
+
+def test_clean_ratings():
+    assert clean_ratings(['4,5', '4.5 из 5', '7', 4.8, None, 'Rating не найдено']) == [4.5, 4.5, None, 4.8, None, None]
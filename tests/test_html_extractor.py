@@ -0,0 +1,54 @@
+"""
+Tests of the single-pass extraction with every parser backend.
+"""
+import os
+
+import pytest
+
+from parsers.html_extractor import PARSER_BACKENDS, extract_details, extract_links
+from parsers.selectors import perekrestok_selectors
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def load(name: str) -> str:
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as file:
+        return file.read()
+
+
+@pytest.mark.parametrize('backend', PARSER_BACKENDS)
+def test_class_is_matched_by_token(backend):
+    assert extract_details(load('multi_class.html'), perekrestok_selectors['product_details'], backend) == {
+        'name': 'Сыр Российский 45% 200 г',
+        'price_new': '189,99 ₽',
+        'price_old': '229,99 ₽',
+        'rating': '4.7',
+        'availability': 'Availability не найдено',
+    }
+
+
+@pytest.mark.parametrize('backend', PARSER_BACKENDS)
+def test_links_are_matched_by_class_token(backend):
+    assert extract_links(load('multi_class.html'), perekrestok_selectors['product_links'], backend) == [
+        '/cat/1/p/syr-1',
+        '/cat/1/p/syr-2',
+    ]
+
+
+@pytest.mark.parametrize('backend', PARSER_BACKENDS)
+@pytest.mark.parametrize('html', ['', '   \n', '<!-- пусто -->'])
+def test_empty_document_has_no_matches(backend, html):
+    assert extract_details(html, {'name': ('h1', {})}, backend) == {'name': 'Name не найдено'}
+    assert extract_links(html, ('a', {}), backend) == []
+
+
+@pytest.mark.parametrize('backend', PARSER_BACKENDS)
+def test_document_with_xml_declaration(backend):
+    html = '<?xml version="1.0" encoding="windows-1251"?><html><body><h1 class="title">Сыр</h1></body></html>'
+    assert extract_details(html, {'name': ('h1', {'class': 'title'})}, backend) == {'name': 'Сыр'}
+
+
+@pytest.mark.parametrize('backend', PARSER_BACKENDS)
+def test_attribute_value_with_both_quotes(backend):
+    html = '<html><body><div title="it&apos;s &quot;new&quot;">Новинка</div></body></html>'
+    assert extract_details(html, {'label': ('div', {'title': 'it\'s "new"'})}, backend) == {'label': 'Новинка'}
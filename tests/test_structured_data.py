@@ -0,0 +1,156 @@
+"""
+Tests of the extraction of the embedded product data, with the selectors as the fallback, on saved pages.
+"""
+import os
+
+import pytest
+
+from parsers.selectors import (
+    magnit_selectors, magnit_structured_data, perekrestok_selectors, perekrestok_structured_data,
+)
+from parsers.structured_data import (
+    _script_bodies, extract_details_with_fallback, extract_links_with_fallback, extract_structured_fields,
+    extract_structured_links,
+)
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+STORES = {
+    'magnit': (magnit_selectors, magnit_structured_data),
+    'perekrestok': (perekrestok_selectors, perekrestok_structured_data),
+}
+
+BACKENDS = ['html.parser', 'lxml']
+
+
+def load(store: str, name: str) -> str:
+    with open(os.path.join(FIXTURES, store, f'{name}.html'), encoding='utf-8') as file:
+        return file.read()
+
+
+def details(store: str, name: str, backend: str):
+    selectors, structured = STORES[store]
+    return extract_details_with_fallback(load(store, name), selectors['product_details'], structured, backend)
+
+
+def links(store: str, name: str, backend: str):
+    selectors, structured = STORES[store]
+    return extract_links_with_fallback(load(store, name), selectors['product_links'], structured, backend)
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_magnit_product_from_json_ld_graph(backend):
+    assert details('magnit', 'product_json', backend) == {
+        'name': 'Кофе молотый Jacobs Monarch 230 г',
+        'description': 'Натуральный жареный молотый кофе средней обжарки.',
+        'price_new': '449.99',
+        'price_old': '599.99',
+        'article': '1000123456',
+        'availability': 'В наличии',
+    }
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_magnit_product_partial_json_ld_completed_by_selectors(backend):
+    assert details('magnit', 'product_partial', backend) == {
+        'name': 'Молоко пастеризованное Простоквашино 2.5% 930 мл',
+        'price_new': '89.99',
+        'description': 'Молоко коровье пастеризованное, массовая доля жира 2,5%.',
+        'price_old': '109,99 ₽',
+        'article': '1000654321',
+    }
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_magnit_product_without_product_json_ld(backend):
+    assert extract_structured_fields(load('magnit', 'product_no_json'), magnit_structured_data) == {}
+    assert details('magnit', 'product_no_json', backend) == {
+        'name': 'Салат Цезарь с курицей 200 г',
+        'description': 'Салат из листьев романо, куриного филе и сухариков с соусом.',
+        'price_new': '219,99 ₽',
+        'price_old': 'Price_old не найдено',
+        'article': '1000777888',
+    }
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_magnit_section_links_from_item_list(backend):
+    assert links('magnit', 'section_json', backend) == [
+        'https://dostavka.magnit.ru/express/product/1000123456-kofe-jacobs-monarch',
+        'https://dostavka.magnit.ru/express/product/1000123457-kofe-egoiste',
+        'https://dostavka.magnit.ru/express/product/1000123458-kofe-lavazza',
+    ]
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_magnit_section_links_from_selectors(backend):
+    assert extract_structured_links(load('magnit', 'section_no_json'), magnit_structured_data) == []
+    assert links('magnit', 'section_no_json', backend) == [
+        '/express/product/1000654321-moloko-prostokvashino',
+        '/express/product/1000654322-moloko-domik-v-derevne',
+    ]
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_perekrestok_product_from_next_data(backend):
+    assert details('perekrestok', 'product_json', backend) == {
+        'name': 'Молоко Домик в деревне пастеризованное 3.2% 930 мл',
+        'description': 'Молоко питьевое пастеризованное.',
+        'price_new': '99.99',
+        'price_old': '129.99',
+        'rating': '4.8',
+        'availability': 'В наличии',
+        'article': '3078911',
+    }
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_perekrestok_product_partial_json_completed_by_selectors(backend):
+    assert details('perekrestok', 'product_partial', backend) == {
+        'name': 'Кофе в зёрнах Lavazza Qualita Oro 1 кг',
+        'price_new': '1899.00',
+        'availability': 'Осталось мало',
+        'article': '1075932',
+        'price_old': '2 349,00 ₽',
+        'rating': 'Rating не найдено',
+    }
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_perekrestok_product_without_next_data(backend):
+    assert extract_structured_fields(load('perekrestok', 'product_no_json'), perekrestok_structured_data) == {}
+    assert details('perekrestok', 'product_no_json', backend) == {
+        'name': 'Плов с курицей 300 г',
+        'price_new': '259,99 ₽',
+        'price_old': 'Price_old не найдено',
+        'rating': '4.6',
+        'availability': 'В наличии',
+    }
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_perekrestok_section_links_from_next_data(backend):
+    assert links('perekrestok', 'section_json', backend) == [
+        '/cat/114/p/moloko-domik-v-derevne-3078911',
+        '/cat/114/p/moloko-prostokvashino-3078912',
+        '/cat/114/p/moloko-parmalat-3078914',
+    ]
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_perekrestok_section_links_from_selectors(backend):
+    assert extract_structured_links(load('perekrestok', 'section_no_json'), perekrestok_structured_data) == []
+    assert links('perekrestok', 'section_no_json', backend) == [
+        '/cat/mc/25/p/plov-s-kuricey-4011',
+        '/cat/mc/25/p/salat-olive-4012',
+    ]
+
+
+def test_script_bodies_skips_marker_outside_script_tag():
+    html = (
+        '<p data-id="__NEXT_DATA__">text</p>'
+        '<script>var id = "__NEXT_DATA__";</script>'
+        '<SCRIPT id="__NEXT_DATA__" type="application/json">{"a": 1}</SCRIPT>'
+        '<script id="__NEXT_DATA__">{"b": 2}'
+    )
+    assert list(_script_bodies(html, '__NEXT_DATA__')) == ['{"a": 1}']
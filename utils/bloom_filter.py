@@ -0,0 +1,74 @@
+# utils/bloom_filter.py
+import hashlib
+import math
+
+
+class BloomFilter:
+    """
+    A Bloom filter of strings: a set that takes a fixed amount of memory whatever the number of keys added,
+    at the cost of false positives. A key that was added is always found; a key that was not is found
+    with the probability error_rate once capacity keys have been added.
+
+    Positions are derived from one BLAKE2b digest per key by double hashing.
+
+    Attributes:
+        capacity (int): The number of keys the filter is sized for.
+        error_rate (float): The false positive rate at capacity.
+        size (int): The number of bits.
+        hashes (int): The number of bits set per key.
+        count (int): The number of keys added that were not already found.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = max(1, capacity)
+        self.error_rate = error_rate
+        self.size = max(8, math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def __contains__(self, key: str) -> bool:
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def add(self, key: str) -> bool:
+        """
+        Add a key.
+
+        Returns:
+            bool: True if the key was already found, i.e. it has been added before or is a false positive.
+        """
+        found = True
+        bits = self._bits
+        for position in self._positions(key):
+            mask = 1 << (position & 7)
+            if not bits[position >> 3] & mask:
+                bits[position >> 3] |= mask
+                found = False
+        if not found:
+            self.count += 1
+        return found
+
+    def to_bytes(self) -> bytes:
+        return bytes(self._bits)
+
+    @classmethod
+    def from_bytes(cls, data: bytes, capacity: int, error_rate: float, count: int = 0) -> 'BloomFilter':
+        """
+        Restore a filter saved with to_bytes().
+
+        Raises:
+            ValueError: If the data does not match the size given by capacity and error_rate.
+        """
+        bloom = cls(capacity, error_rate)
+        if len(data) != len(bloom._bits):
+            raise ValueError('Размер фильтра Блума не совпадает с настройками')
+        bloom._bits[:] = data
+        bloom.count = count
+        return bloom
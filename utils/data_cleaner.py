@@ -1,14 +1,144 @@
 # utils/data_cleaner.py
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
-def clean_price(price_text: str) -> float:
-    try:
-        return float(''.join(char for char in price_text if char.isdigit() or char == ',').replace(',', '.'))
-    except ValueError:
-        return 0.0
+from .name_normalizer import normalize_name
 
+# Rubles with optional thousands separators (space, no-break space, thin space, or a dot or comma followed by
+# exactly three digits) and kopecks after a comma or dot, or given separately as "89 ₽ 90 коп".
+_PRICE = (
+    r'(\d{1,3}(?:[ \u00a0\u2009\u202f.,]\d{3}(?!\d))+|\d+)(?:[.,](\d{1,2})(?!\d))?'
+    r'(?:\s*(?:₽|руб\.?|р\.)?\s*(\d{1,2})\s*коп)?'
+)
+# Columns are parsed in one pass over their values joined by NUL: each match consumes exactly one value, skipping
+# the text before its first number and everything after the price or rating.
+_CELL = '\x00'
+_PRICE_COLUMN_RE = re.compile(_CELL + r'[^\x00\d]*(?:' + _PRICE + r')?[^\x00]*')
+_RATING_COLUMN_RE = re.compile(_CELL + r'[^\x00\d]*(\d+(?:[.,]\d+)?)?[^\x00]*')
+# A price given per unit of goods sold by weight or volume: "₽/кг", "за кг", "за 100 г", "/ л".
+_PER_UNIT_RE = re.compile(r'(?:/|\bза)\s*(\d+(?:[.,]\d+)?)?\s*(кг|г|л|мл)(?![а-я])', re.IGNORECASE)
+_SEPARATORS_RE = re.compile(r'[ \u00a0\u2009\u202f.,]')
 
-def clean_rating(rating_text: str) -> float | None:
-    try:
-        return float(rating_text.replace(',', '.')) if rating_text else None
-    except ValueError:
-        return None
+# Unit prices are given per kilogram for goods measured by weight and per litre for goods measured by volume.
+_UNITS = {'кг': ('кг', 1.0), 'г': ('кг', 0.001), 'л': ('л', 1.0), 'мл': ('л', 0.001)}
+
+MAX_RATING = 5.0
+
+
+def _join_column(texts: Sequence[Any]) -> str:
+    return ''.join(_CELL + (text.replace(_CELL, '') if isinstance(text, str) else '') for text in texts)
+
+
+def clean_price(price_text: Optional[str]) -> Optional[float]:
+    """
+    Parse a price shown by a store, e.g. "1 299,90 ₽", "1.299,00" or "89 ₽ 90 коп".
+
+    Returns:
+        float: The price in rubles. None if the text holds no positive price.
+    """
+    return clean_prices([price_text])[0]
+
+
+def clean_rating(rating_text: Optional[str]) -> Optional[float]:
+    """
+    Parse a rating, e.g. "4,5" or "4.5 из 5".
+
+    Returns:
+        float: The rating. None if the text holds no rating between 0 and MAX_RATING.
+    """
+    return clean_ratings([rating_text])[0]
+
+
+def clean_prices(price_texts: Sequence[Optional[str]]) -> List[Optional[float]]:
+    """
+    Parse a column of prices.
+
+    The whole column is matched in one regex pass over the joined texts; only the conversion of the matched
+    digits to floats is done per value. Numbers are taken as they are.
+
+    Returns:
+        List[float]: The prices in rubles, None where a text holds no positive price.
+    """
+    prices = []
+    for text, (rubles, fraction, kopecks) in zip(price_texts, _PRICE_COLUMN_RE.findall(_join_column(price_texts))):
+        if isinstance(text, (int, float)):
+            price = float(text)
+        elif rubles:
+            price = float(_SEPARATORS_RE.sub('', rubles))
+            price += int(fraction.ljust(2, '0') if fraction else kopecks or 0) / 100
+        else:
+            price = 0.0
+        prices.append(round(price, 2) if price > 0 else None)
+    return prices
+
+
+def clean_ratings(rating_texts: Sequence[Optional[str]]) -> List[Optional[float]]:
+    """
+    Parse a column of ratings in one regex pass over the joined texts.
+
+    Returns:
+        List[float]: The ratings, None where a text holds no rating between 0 and MAX_RATING.
+    """
+    texts = [str(text) if isinstance(text, (int, float)) else text for text in rating_texts]
+    ratings = []
+    for value in _RATING_COLUMN_RE.findall(_join_column(texts)):
+        rating = float(value.replace(',', '.')) if value else None
+        ratings.append(rating if rating is not None and 0 <= rating <= MAX_RATING else None)
+    return ratings
+
+
+def unit_price(price: Optional[float], price_text: Optional[str],
+               name: Optional[str]) -> Tuple[Optional[float], Optional[str]]:
+    """
+    Calculate the price per kilogram or per litre.
+
+    A price shown per unit ("₽/кг", "за 100 г") is converted to the base unit. Otherwise the pack size
+    is taken from the product name, e.g. "Молоко 3,2% 900 мл" or "Йогурт 4 шт x 125 г".
+
+    Args:
+        price (float): The parsed price.
+        price_text (str): The price as shown by the store.
+        name (str): The product name.
+
+    Returns:
+        Tuple[float, str]: The unit price and its unit, 'кг' or 'л'. (None, None) if the size is unknown.
+    """
+    if price is None:
+        return None, None
+    match = _PER_UNIT_RE.search(price_text) if isinstance(price_text, str) else None
+    if match is not None:
+        quantity, unit = match.groups()
+        base_unit, factor = _UNITS[unit.lower()]
+        amount = float(quantity.replace(',', '.')) * factor if quantity else factor
+        return (round(price / amount, 2), base_unit) if amount > 0 else (None, None)
+
+    normalized = normalize_name(name)
+    count = normalized.pack_count or 1
+    if normalized.volume_ml:
+        return round(price / (normalized.volume_ml / 1000 * count), 2), 'л'
+    if normalized.weight_g:
+        return round(price / (normalized.weight_g / 1000 * count), 2), 'кг'
+    return None, None
+
+
+def normalize_rows(rows: List[Dict[str, Any]]):
+    """
+    Normalize a batch of scraped products in place, column by column.
+
+    The price and rating columns are parsed from the scraped text, invalid values become None so they stay
+    out of aggregates, and the unit_price and unit columns are derived from the current price.
+
+    Args:
+        rows (List[Dict[str, Any]]): Rows with raw price_new, price_old and rating text and the product name.
+    """
+    price_texts = [row.get('price_new') for row in rows]
+    prices = clean_prices(price_texts)
+    old_prices = clean_prices([row.get('price_old') for row in rows])
+    ratings = clean_ratings([row.get('rating') for row in rows])
+    unit_prices = [unit_price(price, text, row.get('name')) for price, text, row in zip(prices, price_texts, rows)]
+    for row, price, old_price, rating, (per_unit, unit) in zip(rows, prices, old_prices, ratings, unit_prices):
+        row['price_new'] = price
+        row['price_old'] = old_price
+        row['rating'] = rating
+        row['unit_price'] = per_unit
+        row['unit'] = unit
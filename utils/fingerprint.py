@@ -0,0 +1,20 @@
+# utils/fingerprint.py
+import hashlib
+from typing import Any, Dict, Iterable
+
+
+def product_fingerprint(product_details: Dict[str, Any], fields: Iterable[str]) -> str:
+    """
+    Calculate a stable fingerprint of the extracted product fields.
+
+    Args:
+        product_details (Dict[str, Any]): The product fields.
+        fields (Iterable[str]): The names of the fields that take part in the fingerprint.
+
+    Returns:
+        str: The SHA-1 hex digest of the fields.
+    """
+    digest = hashlib.sha1()
+    for field in sorted(fields):
+        digest.update(f'{field}={product_details.get(field)!r}\x1f'.encode('utf-8'))
+    return digest.hexdigest()
@@ -0,0 +1,310 @@
+# utils/metrics.py
+"""
+In-process metrics of the crawl pipeline.
+
+Every stage (fetch, decode, parse, clean, persist) records its latency into a histogram and its outcome into
+a counter, labelled by store and category. The labels are taken from a context variable that ParserManager sets
+for each crawl job, so HttpClient, ParsePool and the parsers do not have to pass them around.
+"""
+import asyncio
+import json
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from aiohttp import web
+
+# Upper bounds of the histogram buckets, sec. The last bucket is +Inf.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+STAGES = ('slot_wait', 'fetch', 'decode', 'parse', 'clean', 'persist', 'loop_lag')
+
+Labels = Tuple[str, str]
+
+_labels: ContextVar[Labels] = ContextVar('crawl_labels', default=('', ''))
+
+
+@contextmanager
+def crawl_labels(store: str, category: str) -> Iterator[None]:
+    """
+    Label the metrics recorded inside the block, including in the coroutines it awaits, with a store and category.
+    """
+    token = _labels.set((store, category))
+    try:
+        yield
+    finally:
+        _labels.reset(token)
+
+
+def current_labels() -> Labels:
+    """
+    Get the (store, category) labels of the current crawl job.
+    """
+    return _labels.get()
+
+
+class Histogram:
+    """
+    A cumulative latency histogram with fixed buckets.
+
+    Attributes:
+        counts (List[int]): The number of observations per bucket, the last one being +Inf.
+        count (int): The total number of observations.
+        sum (float): The sum of the observed values.
+    """
+    __slots__ = ('counts', 'count', 'sum')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def merge(self, other: 'Histogram'):
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.count += other.count
+        self.sum += other.sum
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Estimate a quantile by linear interpolation inside its bucket.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = BUCKETS[index - 1] if index else 0.0
+                upper = BUCKETS[index] if index < len(BUCKETS) else BUCKETS[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return BUCKETS[-1]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class CrawlMetrics:
+    """
+    The registry of the crawl metrics.
+
+    Attributes:
+        histograms (Dict[Tuple[str, str, str], Histogram]): Latencies keyed by (stage, store, category).
+        counters (Dict[Tuple[str, str, str, str], int]): Outcomes keyed by (stage, outcome, store, category).
+        bytes_received (Dict[Tuple[str, str], int]): Downloaded bytes keyed by (store, category).
+    """
+
+    def __init__(self):
+        self.histograms: Dict[Tuple[str, str, str], Histogram] = defaultdict(Histogram)
+        self.counters: Dict[Tuple[str, str, str, str], int] = defaultdict(int)
+        self.bytes_received: Dict[Labels, int] = defaultdict(int)
+        self.started_at = time.monotonic()
+
+    def reset(self):
+        self.histograms.clear()
+        self.counters.clear()
+        self.bytes_received.clear()
+        self.started_at = time.monotonic()
+
+    def observe(self, stage: str, seconds: float):
+        self.histograms[(stage, *_labels.get())].observe(seconds)
+
+    def increment(self, stage: str, outcome: str, amount: int = 1):
+        self.counters[(stage, outcome, *_labels.get())] += amount
+
+    def add_bytes(self, amount: int):
+        self.bytes_received[_labels.get()] += amount
+
+    @contextmanager
+    def timer(self, stage: str) -> Iterator[None]:
+        """
+        Time the block as a stage and count it as a success or, if it raises, as an error.
+        """
+        started_at = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.increment(stage, 'error')
+            raise
+        else:
+            self.increment(stage, 'success')
+        finally:
+            self.observe(stage, time.perf_counter() - started_at)
+
+    async def monitor_loop_lag(self, interval: float):
+        """
+        Measure how late the event loop wakes up a sleeping task. Runs until cancelled.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            started_at = loop.time()
+            await asyncio.sleep(interval)
+            self.observe('loop_lag', max(loop.time() - started_at - interval, 0.0))
+
+    def _stage_totals(self, by_store: bool) -> Dict[Tuple[str, str], Histogram]:
+        totals: Dict[Tuple[str, str], Histogram] = defaultdict(Histogram)
+        for (stage, store, _), histogram in self.histograms.items():
+            totals[(stage, store if by_store else '')].merge(histogram)
+        return totals
+
+    def _outcomes(self, stage: str, store: Optional[str] = None) -> Dict[str, int]:
+        outcomes: Dict[str, int] = defaultdict(int)
+        for (counter_stage, outcome, counter_store, _), value in self.counters.items():
+            if counter_stage == stage and (store is None or counter_store == store):
+                outcomes[outcome] += value
+        return outcomes
+
+    def summary(self) -> str:
+        """
+        Format a report of the run: the latency and outcomes of each stage, then the stages of each store.
+        """
+        elapsed = time.monotonic() - self.started_at
+        lines = [f'Метрики обхода за {elapsed:.1f} сек:']
+        header = f"{'':<28}{'count':>8}{'total, s':>10}{'p50, ms':>10}{'p95, ms':>10}{'p99, ms':>10}  исходы"
+        totals = self._stage_totals(by_store=False)
+        by_store = self._stage_totals(by_store=True)
+        stores = sorted(
+            {store for _, store in by_store if store} | {store for store, _ in self.bytes_received if store}
+        )
+        for store in [None] + stores:
+            lines.append('Этапы:' if store is None else f'Магазин {store}:')
+            lines.append(header)
+            for stage in STAGES:
+                histogram = (totals.get((stage, '')) if store is None else by_store.get((stage, store))) or Histogram()
+                outcomes = self._outcomes(stage, store)
+                if not histogram.count and not outcomes:
+                    continue
+                timings = [histogram.quantile(q) for q in (0.5, 0.95, 0.99)] if histogram.count else [0.0] * 3
+                lines.append(
+                    f'  {stage:<26}{histogram.count:>8}{histogram.sum:>10.2f}'
+                    + ''.join(f'{value * 1000:>10.1f}' for value in timings)
+                    + '  ' + ', '.join(f'{outcome}={value}' for outcome, value in sorted(outcomes.items()))
+                )
+            if store is not None:
+                received = sum(value for (label_store, _), value in self.bytes_received.items() if label_store == store)
+                lines.append(f'  получено: {received / 1024 / 1024:.2f} МБ')
+        return '\n'.join(lines)
+
+    def to_prometheus(self) -> str:
+        """
+        Render the metrics in the Prometheus text exposition format.
+        """
+        lines = [
+            '# HELP crawl_stage_seconds Latency of the crawl pipeline stages.',
+            '# TYPE crawl_stage_seconds histogram',
+        ]
+        for (stage, store, category), histogram in sorted(self.histograms.items()):
+            labels = f'stage="{_escape(stage)}",store="{_escape(store)}",category="{_escape(category)}"'
+            cumulative = 0
+            for index, count in enumerate(histogram.counts):
+                cumulative += count
+                bound = repr(BUCKETS[index]) if index < len(BUCKETS) else '+Inf'
+                lines.append(f'crawl_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'crawl_stage_seconds_sum{{{labels}}} {histogram.sum}')
+            lines.append(f'crawl_stage_seconds_count{{{labels}}} {histogram.count}')
+        lines += [
+            '# HELP crawl_stage_total Outcomes of the crawl pipeline stages.',
+            '# TYPE crawl_stage_total counter',
+        ]
+        for (stage, outcome, store, category), value in sorted(self.counters.items()):
+            lines.append(
+                f'crawl_stage_total{{stage="{_escape(stage)}",outcome="{_escape(outcome)}",'
+                f'store="{_escape(store)}",category="{_escape(category)}"}} {value}'
+            )
+        lines += [
+            '# HELP crawl_received_bytes_total Downloaded response bodies.',
+            '# TYPE crawl_received_bytes_total counter',
+        ]
+        for (store, category), value in sorted(self.bytes_received.items()):
+            labels = f'store="{_escape(store)}",category="{_escape(category)}"'
+            lines.append(f'crawl_received_bytes_total{{{labels}}} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Export the metrics as plain data that can be dumped to JSON and merged back with merge().
+        """
+        return {
+            'buckets': list(BUCKETS),
+            'histograms': [
+                {'stage': stage, 'store': store, 'category': category,
+                 'counts': histogram.counts, 'count': histogram.count, 'sum': histogram.sum}
+                for (stage, store, category), histogram in self.histograms.items()
+            ],
+            'counters': [
+                {'stage': stage, 'outcome': outcome, 'store': store, 'category': category, 'value': value}
+                for (stage, outcome, store, category), value in self.counters.items()
+            ],
+            'bytes_received': [
+                {'store': store, 'category': category, 'value': value}
+                for (store, category), value in self.bytes_received.items()
+            ],
+        }
+
+    def merge(self, data: Dict[str, Any]):
+        """
+        Add metrics exported with to_dict(), e.g. by another process, to this registry.
+        """
+        for item in data['histograms']:
+            histogram = Histogram()
+            histogram.counts = list(item['counts'])
+            histogram.count = item['count']
+            histogram.sum = item['sum']
+            self.histograms[(item['stage'], item['store'], item['category'])].merge(histogram)
+        for item in data['counters']:
+            self.counters[(item['stage'], item['outcome'], item['store'], item['category'])] += item['value']
+        for item in data['bytes_received']:
+            self.bytes_received[(item['store'], item['category'])] += item['value']
+
+    def dump(self, path: str):
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(self.to_dict(), file, ensure_ascii=False)
+
+
+class MetricsServer:
+    """
+    An HTTP endpoint for long-running crawls: /metrics in the Prometheus text format and /metrics.json.
+
+    Attributes:
+        registry (CrawlMetrics): The metrics to expose.
+        port (int): The port to listen on.
+    """
+
+    def __init__(self, registry: CrawlMetrics, port: int, host: str = '0.0.0.0'):
+        self.registry = registry
+        self.port = port
+        self.host = host
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/metrics', self._prometheus)
+        app.router.add_get('/metrics.json', self._json)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _prometheus(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.registry.to_prometheus(), content_type='text/plain', charset='utf-8')
+
+    async def _json(self, request: web.Request) -> web.Response:
+        return web.json_response(self.registry.to_dict())
+
+
+# The metrics of the current process.
+metrics = CrawlMetrics()
@@ -0,0 +1,78 @@
+# utils/name_normalizer.py
+import re
+from dataclasses import dataclass, field
+from typing import FrozenSet, Optional
+
+_NUMBER = r'(\d+(?:[.,]\d+)?)'
+_VOLUME_RE = re.compile(_NUMBER + r'\s*(мл|л)(?![а-я])')
+_WEIGHT_RE = re.compile(_NUMBER + r'\s*(кг|гр|г)(?![а-я])')
+_FAT_RE = re.compile(_NUMBER + r'\s*%')
+_PACK_RE = re.compile(r'(\d+)\s*(?:шт|x|х)(?![а-я])')
+_QUOTED_RE = re.compile(r'[«"“]([^»"”]+)[»"”]')
+_TOKEN_RE = re.compile(r'[a-zа-я]+')
+
+_STOP_WORDS = frozenset({
+    'и', 'в', 'с', 'со', 'из', 'для', 'на', 'по', 'без', 'от', 'шт', 'уп', 'упак', 'мл', 'л', 'г', 'гр', 'кг',
+})
+
+
+@dataclass(frozen=True)
+class NormalizedName:
+    """
+    A product name reduced to the parts that identify the product.
+
+    Attributes:
+        tokens (FrozenSet[str]): Lowercased words of the name without numbers, units and stop words.
+        brand (str): The brand, taken from the quoted part of the name or its Latin words.
+        volume_ml (float): The volume of one item in millilitres.
+        weight_g (float): The weight of one item in grams.
+        fat_pct (float): The fat content in percent.
+        pack_count (int): The number of items in the pack.
+    """
+    tokens: FrozenSet[str] = field(default_factory=frozenset)
+    brand: Optional[str] = None
+    volume_ml: Optional[float] = None
+    weight_g: Optional[float] = None
+    fat_pct: Optional[float] = None
+    pack_count: Optional[int] = None
+
+
+def _number(text: str) -> float:
+    return float(text.replace(',', '.'))
+
+
+def normalize_name(name: str) -> NormalizedName:
+    """
+    Normalize a product name: extract the brand, volume, weight, fat content and pack size, and tokenize the rest.
+
+    Args:
+        name (str): The product name as shown by the store.
+
+    Returns:
+        NormalizedName: The normalized name.
+    """
+    text = (name or '').lower().replace('ё', 'е')
+
+    volume_ml = weight_g = fat_pct = pack_count = None
+    match = _VOLUME_RE.search(text)
+    if match:
+        volume_ml = _number(match.group(1)) * (1000 if match.group(2) == 'л' else 1)
+    match = _WEIGHT_RE.search(text)
+    if match:
+        weight_g = _number(match.group(1)) * (1000 if match.group(2) == 'кг' else 1)
+    match = _FAT_RE.search(text)
+    if match:
+        fat_pct = _number(match.group(1))
+    match = _PACK_RE.search(text)
+    if match:
+        pack_count = int(match.group(1))
+
+    match = _QUOTED_RE.search(text)
+    if match:
+        brand = match.group(1).strip()
+    else:
+        latin_words = re.findall(r'[a-z][a-z\-\']+', text)
+        brand = ' '.join(latin_words) or None
+
+    tokens = frozenset(token for token in _TOKEN_RE.findall(text) if token not in _STOP_WORDS and len(token) > 1)
+    return NormalizedName(tokens, brand, volume_ml, weight_g, fat_pct, pack_count)
@@ -0,0 +1,36 @@
+# utils/url_normalizer.py
+from urllib.parse import urlsplit, urlunsplit, unquote_plus
+
+# Query parameters that only track where a visitor came from and never change the page.
+TRACKING_PARAMS = frozenset({
+    'gclid', 'yclid', 'fbclid', 'ysclid', 'dclid', 'msclkid', '_openstat', 'from', 'ref', 'referrer', 'erid',
+})
+TRACKING_PREFIXES = ('utm_',)
+
+
+def _is_tracking(key: str) -> bool:
+    return key in TRACKING_PARAMS or key.startswith(TRACKING_PREFIXES)
+
+
+def normalize_url(url: str) -> str:
+    """
+    Normalize a product URL so that the same page always gets the same key.
+
+    The scheme and host are lowercased, the fragment and the tracking parameters (utm_*, gclid, yclid and the like)
+    are dropped and the trailing slash is removed.
+
+    Args:
+        url (str): The URL to normalize.
+
+    Returns:
+        str: The normalized URL.
+    """
+    scheme, netloc, path, query, _ = urlsplit(url.strip())
+    path = path.rstrip('/') or '/'
+    if query:
+        # The other parameters are kept exactly as given, so the keys of URLs without tracking parameters do not change.
+        query = '&'.join(
+            param for param in query.split('&')
+            if param and not _is_tracking(unquote_plus(param.partition('=')[0]).lower())
+        )
+    return urlunsplit((scheme.lower(), netloc.lower(), path, query, ''))